@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Market Aggregates
+Price sums and counts per category × day (lowest prices) and per
+category × store × day (each chain's own prices), kept as prefix sums so
+any window and category/store slice is answered in O(categories × stores)
+"""
+
+import threading
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from catalog import CatalogSnapshot, ProductCatalog
+from price_history import PriceHistoryStore, DEFAULT_SPARE_DAYS, offer_key, split_offer_key
+
+# Windows (days) behind the week/month % changes
+CHANGE_WINDOWS = {"week": 7, "month": 30}
+
+# Day columns aggregated per pass while building
+BUILD_CHUNK_DAYS = 32
+
+Day = Union[int, date, np.datetime64]
+
+
+def start_store_history(catalog: CatalogSnapshot, day: Union[date, np.datetime64]) -> PriceHistoryStore:
+    """Per-store price history whose only day is the catalog's current offers on `day`
+
+    For engines with no recorded per-store prices yet: store slices cover
+    the days recorded from here on.
+    """
+    rows, cols = np.nonzero(np.isfinite(catalog.prices))
+    keys = [offer_key(catalog.products[row].id, catalog.stores[col]) for row, col in zip(rows, cols)]
+    return PriceHistoryStore.from_matrix(keys, day, catalog.prices[rows, cols][:, None])
+
+
+class DailyTotals:
+    """Prefix sums of one price history's points per slot × day.
+
+    `_sums[k, d]` is the sum of the prices of rows in slot k over the
+    history's days [0, d) (`_counts` likewise counts the priced points);
+    `row_slot` maps history rows to slots (-1 leaves a row out). A window is
+    two lookups per slot, and a new price on the latest day touches one
+    prefix column.
+    """
+
+    def __init__(self, history: PriceHistoryStore, row_slot: np.ndarray, n_slots: int):
+        self.history = history
+        self.row_slot = row_slot
+        self.n_slots = n_slots
+        self._lock = threading.Lock()
+        self._build()
+
+    def _build(self) -> None:
+        history = self.history
+        self.start = history.start
+        self.n_days = history.n_days
+        capacity = self.n_days + DEFAULT_SPARE_DAYS
+        self._sums = np.zeros((self.n_slots, capacity + 1))
+        self._counts = np.zeros((self.n_slots, capacity + 1))
+
+        # One bincount per day chunk over (slot, day) cells
+        rows = np.flatnonzero(self.row_slot >= 0)
+        slots = self.row_slot[rows]
+        prices = history.prices
+        for first in range(0, self.n_days, BUILD_CHUNK_DAYS):
+            chunk = prices[rows, first:first + BUILD_CHUNK_DAYS].astype(np.float64)
+            width = chunk.shape[1]
+            priced = np.isfinite(chunk)
+            cells = (slots[:, None] * width + np.arange(width))[priced]
+            days = slice(first + 1, first + 1 + width)
+            self._sums[:, days] = np.bincount(cells, weights=chunk[priced],
+                                              minlength=self.n_slots * width).reshape(self.n_slots, width)
+            self._counts[:, days] = np.bincount(cells, minlength=self.n_slots * width).reshape(self.n_slots, width)
+        np.cumsum(self._sums[:, :self.n_days + 1], axis=1, out=self._sums[:, :self.n_days + 1])
+        np.cumsum(self._counts[:, :self.n_days + 1], axis=1, out=self._counts[:, :self.n_days + 1])
+
+    # Incremental updates
+
+    def on_history_change(self, rows: Optional[np.ndarray], col: Optional[int],
+                          old: Optional[np.ndarray], new: Optional[np.ndarray]) -> None:
+        """PriceHistoryStore listener"""
+        with self._lock:
+            if rows is None and col == self.n_days:
+                self._append_day(new)
+            elif rows is not None and col is not None and col < self.n_days:
+                self._add(rows, col, new, 1.0)
+                self._add(rows, col, old, -1.0)
+            else:
+                self._build()
+
+    def _cells(self, rows: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(sums, counts) per slot of some rows' prices on one day"""
+        priced = np.isfinite(values) & (self.row_slot[rows] >= 0)
+        slots = self.row_slot[rows[priced]]
+        sums = np.bincount(slots, weights=values[priced], minlength=self.n_slots)
+        counts = np.bincount(slots, minlength=self.n_slots).astype(np.float64)
+        return sums, counts
+
+    def _add(self, rows: np.ndarray, col: int, values: np.ndarray, sign: float) -> None:
+        """Add (sign=1) or remove (sign=-1) price points of day `col`; O(1) prefix columns on the latest day"""
+        sums, counts = self._cells(rows, np.asarray(values, dtype=np.float64))
+        self._sums[:, col + 1:self.n_days + 1] += sign * sums[:, None]
+        self._counts[:, col + 1:self.n_days + 1] += sign * counts[:, None]
+
+    def _append_day(self, values: np.ndarray) -> None:
+        if self.n_days + 1 >= self._sums.shape[1]:
+            extra = max(DEFAULT_SPARE_DAYS, self.n_days // 4)
+            self._sums = np.concatenate([self._sums, np.zeros((self.n_slots, extra))], axis=1)
+            self._counts = np.concatenate([self._counts, np.zeros((self.n_slots, extra))], axis=1)
+        sums, counts = self._cells(np.arange(len(values)), np.asarray(values, dtype=np.float64))
+        self._sums[:, self.n_days + 1] = self._sums[:, self.n_days] + sums
+        self._counts[:, self.n_days + 1] = self._counts[:, self.n_days] + counts
+        self.n_days += 1
+
+    # Queries (days are dates; the window is clipped to this history)
+
+    def column(self, day: np.datetime64) -> int:
+        return int((day - self.start) // np.timedelta64(1, "D"))
+
+    def window(self, first: np.datetime64, last: np.datetime64, slots: List[int]) -> Tuple[float, float]:
+        """(price sum, priced points) of some slots over [first, last]"""
+        first = max(self.column(first), 0)
+        last = min(self.column(last), self.n_days - 1)
+        if last < first:
+            return 0.0, 0.0
+        with self._lock:
+            sums = self._sums[slots]
+            counts = self._counts[slots]
+            return (float((sums[:, last + 1] - sums[:, first]).sum()),
+                    float((counts[:, last + 1] - counts[:, first]).sum()))
+
+    def daily(self, first: np.datetime64, last: np.datetime64, slots: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Per-day (price sums, priced points) of some slots over [first, last]; zero outside the history"""
+        offset = self.column(first)
+        sums = np.zeros(max(self.column(last) - offset + 1, 0))
+        counts = np.zeros(len(sums))
+        lo = max(offset, 0)
+        hi = min(self.column(last), self.n_days - 1)
+        if hi >= lo:
+            with self._lock:
+                sums[lo - offset:hi - offset + 1] = np.diff(self._sums[slots, lo:hi + 2], axis=-1).sum(axis=0)
+                counts[lo - offset:hi - offset + 1] = np.diff(self._counts[slots, lo:hi + 2], axis=-1).sum(axis=0)
+        return sums, counts
+
+
+class MarketAggregates:
+    """Rolling-window market aggregates over one catalog snapshot's price histories.
+
+    Unsliced queries average each product's lowest price (`lowest`, over
+    the price history); store-sliced ones average the chains' own offer
+    prices (`offers`, over the per-store history, one slot per
+    category × store). Days are columns of the price history: ints count
+    from its first day, negative ones back from its latest.
+    """
+
+    def __init__(self, catalog: CatalogSnapshot, history: PriceHistoryStore, store_history: PriceHistoryStore):
+        self.catalog = catalog
+        self.categories: List[str] = list(catalog.category_index)
+        self.category_slots = {category: i for i, category in enumerate(self.categories)}
+        self.stores: List[str] = list(catalog.stores)
+
+        # Catalog row -> category slot
+        category_of = np.empty(len(catalog), dtype=np.intp)
+        for slot, rows in enumerate(catalog.category_index.values()):
+            category_of[rows] = slot
+
+        # History row -> category slot (-1 for products no longer listed)
+        rows = catalog.rows_of(history.product_ids)
+        listed = rows >= 0
+        row_category = np.full(len(rows), -1, dtype=np.intp)
+        row_category[listed] = category_of[rows[listed]]
+        self.lowest = DailyTotals(history, row_category, len(self.categories))
+
+        # Per-store history row -> category × store slot (-1 for offers of unlisted products or stores)
+        offers = [split_offer_key(key) for key in store_history.product_ids]
+        rows = catalog.rows_of(product_id for product_id, _ in offers)
+        cols = np.fromiter((catalog.store_index.get(store, -1) for _, store in offers), dtype=np.intp, count=len(offers))
+        known = (rows >= 0) & (cols >= 0)
+        row_cell = np.full(len(offers), -1, dtype=np.intp)
+        row_cell[known] = category_of[rows[known]] * len(self.stores) + cols[known]
+        self.offers = DailyTotals(store_history, row_cell, len(self.categories) * len(self.stores))
+
+    @property
+    def start(self) -> np.datetime64:
+        return self.lowest.start
+
+    @property
+    def n_days(self) -> int:
+        return self.lowest.n_days
+
+    # Queries
+
+    def day_index(self, day: Day) -> int:
+        """Column of a date (ints are taken as columns; negative ones count from the latest day)"""
+        if isinstance(day, (int, np.integer)):
+            return int(day) if day >= 0 else self.n_days + int(day)
+        return int((np.datetime64(day, "D") - self.start) // np.timedelta64(1, "D"))
+
+    def _slots(self, categories: Optional[Iterable[str]],
+               stores: Optional[Iterable[str]]) -> Tuple[DailyTotals, List[int]]:
+        """The table and slots behind a category/store slice"""
+        if categories is None:
+            slots = list(range(len(self.categories)))
+        else:
+            slots = [self.category_slots[c] for c in categories if c in self.category_slots]
+        if stores is None:
+            return self.lowest, slots
+        cols = [self.catalog.store_index[s] for s in stores if s in self.catalog.store_index]
+        return self.offers, [slot * len(self.stores) + col for slot in slots for col in cols]
+
+    def window(self, first: Day, last: Day, categories: Optional[Iterable[str]] = None,
+               stores: Optional[Iterable[str]] = None) -> Tuple[float, float]:
+        """(price sum, priced points) over days [first, last], clipped to the history"""
+        first = max(self.day_index(first), 0)
+        last = min(self.day_index(last), self.n_days - 1)
+        if last < first:
+            return 0.0, 0.0
+        table, slots = self._slots(categories, stores)
+        return table.window(self.start + first, self.start + last, slots)
+
+    def mean_price(self, first: Day, last: Day, categories: Optional[Iterable[str]] = None,
+                   stores: Optional[Iterable[str]] = None) -> Optional[float]:
+        total, points = self.window(first, last, categories, stores)
+        return total / points if points else None
+
+    def change(self, days: int, categories: Optional[Iterable[str]] = None, end: Day = -1,
+               stores: Optional[Iterable[str]] = None) -> Optional[float]:
+        """% change of the mean price over the `days` days up to `end` versus the `days` before"""
+        end = self.day_index(end)
+        if end - 2 * days + 1 < 0:
+            return None
+        current = self.mean_price(end - days + 1, end, categories, stores)
+        previous = self.mean_price(end - 2 * days + 1, end - days, categories, stores)
+        if current is None or not previous:
+            return None
+        return round((current / previous - 1) * 100, 2)
+
+    def price_index(self, categories: Optional[Iterable[str]] = None,
+                    stores: Optional[Iterable[str]] = None) -> Optional[float]:
+        """Mean price on the latest day relative to the first recorded day (= 100)"""
+        table, _ = self._slots(categories, stores)
+        first = max(self.day_index(table.start), 0)
+        base = self.mean_price(first, first, categories, stores)
+        latest = self.mean_price(-1, -1, categories, stores)
+        return round(latest / base * 100, 2) if base and latest is not None else None
+
+    def daily_means(self, first: Day, last: Day, categories: Optional[Iterable[str]] = None,
+                    stores: Optional[Iterable[str]] = None) -> List[Optional[float]]:
+        """Mean price per day over [first, last]"""
+        first = max(self.day_index(first), 0)
+        last = min(self.day_index(last), self.n_days - 1)
+        if last < first:
+            return []
+        table, slots = self._slots(categories, stores)
+        sums, counts = table.daily(self.start + first, self.start + last, slots)
+        return [round(float(s / c), 2) if c else None for s, c in zip(sums, counts)]
+
+    def changes(self, categories: Optional[Iterable[str]] = None,
+                stores: Optional[Iterable[str]] = None) -> Dict[str, Optional[float]]:
+        return {name: self.change(days, categories, stores=stores) for name, days in CHANGE_WINDOWS.items()}
+
+    def top_categories(self, n: int = 3, window: str = "week") -> List[str]:
+        """Categories whose prices fell the most over the window (best time to buy)"""
+        changes = [(self.change(CHANGE_WINDOWS[window], [c]), c) for c in self.categories]
+        return [c for change, c in sorted((x for x in changes if x[0] is not None), key=lambda x: x[0])[:n]]
+
+    @property
+    def last_date(self) -> np.datetime64:
+        return self.start + (self.n_days - 1)
+
+
+class MarketAggregateIndex:
+    """Keeps MarketAggregates in sync with a ProductCatalog and its price histories"""
+
+    def __init__(self, catalog: ProductCatalog, history: PriceHistoryStore, store_history: PriceHistoryStore):
+        self.catalog = catalog
+        self.history = history
+        self.store_history = store_history
+        self._lock = threading.Lock()
+        self._aggregates: Optional[MarketAggregates] = None
+        history.add_listener(self._on_history_change)
+        store_history.add_listener(self._on_store_history_change)
+
+    @property
+    def aggregates(self) -> MarketAggregates:
+        aggregates = self._aggregates
+        snapshot = self.catalog.snapshot
+        if aggregates is None or aggregates.catalog is not snapshot:
+            with self._lock:
+                if self._aggregates is None or self._aggregates.catalog is not snapshot:
+                    self._aggregates = MarketAggregates(snapshot, self.history, self.store_history)
+                aggregates = self._aggregates
+        return aggregates
+
+    def _on_history_change(self, rows, col, old, new) -> None:
+        aggregates = self._aggregates
+        if aggregates is not None:
+            aggregates.lowest.on_history_change(rows, col, old, new)
+
+    def _on_store_history_change(self, rows, col, old, new) -> None:
+        aggregates = self._aggregates
+        if aggregates is not None:
+            aggregates.offers.on_history_change(rows, col, old, new)
+
+    def summary(self, categories: Optional[List[str]] = None, stores: Optional[List[str]] = None,
+                start: Optional[Day] = None, end: Optional[Day] = None) -> Dict[str, Any]:
+        """Dashboard slice: mean price, points and daily means over a window, plus week/month changes"""
+        aggregates = self.aggregates
+        first = aggregates.day_index(start) if start is not None else 0
+        last = aggregates.day_index(end) if end is not None else aggregates.n_days - 1
+        total, points = aggregates.window(first, last, categories, stores)
+        return {
+            "start": str(aggregates.start + max(first, 0)),
+            "end": str(aggregates.start + min(last, aggregates.n_days - 1)),
+            "mean_price": round(total / points, 2) if points else None,
+            "price_points": int(points),
+            "price_changes": aggregates.changes(categories, stores),
+            "daily_mean_prices": aggregates.daily_means(first, last, categories, stores),
+        }
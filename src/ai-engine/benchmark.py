@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Benchmark Suite
+Throughput, p50/p99 latency and peak RSS for the engine hot paths and the
+HTTP endpoints of main.py and simple_ai.py on a synthetic catalog
+
+Usage:
+    python benchmark.py --skus 50000 --stores 12 --days 365 --output run.json
+    python benchmark.py --compare run.json      # exit 1 on p50 regressions
+"""
+
+import argparse
+import http.client
+import json
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from datagen import generate_catalog, generate_history
+from records import ProductRecord
+
+
+def measure(fn: Callable[[], Any], iterations: int, warmup: int = 3) -> Dict[str, float]:
+    """Run fn repeatedly and summarise per-call latency"""
+    for _ in range(warmup):
+        fn()
+    latencies = np.empty(iterations)
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies[i] = time.perf_counter() - t0
+    elapsed = time.perf_counter() - started
+    return {
+        "iterations": iterations,
+        "throughput_per_s": round(iterations / elapsed, 2),
+        "mean_ms": round(float(latencies.mean()) * 1000, 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class Workload:
+    """Seeded random payloads drawn from the synthetic catalog"""
+
+    def __init__(self, products: List[Dict[str, Any]], basket_size: int, seed: int):
+        self.rng = random.Random(seed)
+        self.products = products
+        self.ids = [p["id"] for p in products]
+        self.categories = sorted({p["category"] for p in products})
+        self.brands = sorted({p["brand"] for p in products})
+        self.basket_size = basket_size
+
+    def basket(self, **options) -> Dict[str, Any]:
+        items = [
+            {"product_id": pid, "quantity": self.rng.randint(1, 3)}
+            for pid in self.rng.sample(self.ids, min(self.basket_size, len(self.ids)))
+        ]
+        return {"items": items, **options}
+
+    def product_ids(self, n: int) -> List[str]:
+        return self.rng.sample(self.ids, min(n, len(self.ids)))
+
+    def preferences(self) -> Dict[str, Any]:
+        return {
+            "categories": self.rng.sample(self.categories, min(2, len(self.categories))),
+            "brands": self.rng.sample(self.brands, min(3, len(self.brands))),
+            "max_price": self.rng.choice([10.0, 20.0, 50.0]),
+        }
+
+
+def bench_engine(engine, work: Workload, iterations: int) -> Dict[str, Dict[str, float]]:
+    from main import ShoppingList
+
+    multi = {"optimization_mode": "multi_store", "max_stores": 3}
+    return {
+        "engine.optimize_basket": measure(
+            lambda: engine.optimize_shopping_basket(ShoppingList(**work.basket())), iterations),
+        "engine.optimize_basket_multi_store": measure(
+            lambda: engine.optimize_shopping_basket(ShoppingList(**work.basket(**multi))), iterations),
+        "engine.optimize_baskets_batch100": measure(
+            lambda: list(engine.optimize_shopping_baskets([ShoppingList(**work.basket()) for _ in range(100)])),
+            max(3, iterations // 10)),
+        "engine.predict_prices_100": measure(
+            lambda: engine.predict_price_trends(work.product_ids(100)), iterations),
+        "engine.predict_all_prices": measure(
+            engine.predict_all_price_trends, max(3, iterations // 10)),
+        "engine.recommendations": measure(
+            lambda: engine.get_personalized_recommendations(work.preferences()), iterations),
+    }
+
+
+def product_memory_mb(products: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Heap held by the catalog as product dicts vs ProductRecords (names are shared by both)"""
+    def traced(build: Callable[[], Any]) -> float:
+        tracemalloc.start()
+        try:
+            kept = build()
+            size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del kept
+        return round(size / (1024 * 1024), 2)
+
+    return {
+        "product_dicts": traced(lambda: [{**p, "prices": [dict(o) for o in p["prices"]]} for p in products]),
+        "product_records": traced(lambda: [ProductRecord.from_dict(p) for p in products]),
+    }
+
+
+def bench_records(products: List[Dict[str, Any]], iterations: int) -> Dict[str, Dict[str, float]]:
+    """Best-offer scan over 1000 products, dict offers vs slotted Offers"""
+    dicts = products[:1000]
+    records = [ProductRecord.from_dict(p) for p in dicts]
+    return {
+        "products.best_offer_dicts_1000": measure(
+            lambda: [min(p["prices"], key=lambda o: o["price"] - o.get("discount", 0)) for p in dicts], iterations),
+        "products.best_offer_records_1000": measure(
+            lambda: [min(p.offers, key=lambda o: o.price - o.discount) for p in records], iterations),
+    }
+
+
+def bench_main_http(engine, work: Workload, iterations: int) -> Dict[str, Dict[str, float]]:
+    """FastAPI endpoints in-process through the ASGI test client (cache disabled)"""
+    from fastapi.testclient import TestClient
+    import main
+    from cache import ResultCache
+
+    main._engine = engine
+    main.result_cache = ResultCache(max_entries=0)
+    client = TestClient(main.app)
+
+    def post(path: str, payload_fn: Callable[[], Any]) -> Callable[[], None]:
+        def call():
+            response = client.post(path, json=payload_fn())
+            response.raise_for_status()
+        return call
+
+    return {
+        "main.GET /": measure(lambda: client.get("/").raise_for_status(), iterations),
+        "main.POST /optimize-basket": measure(post("/optimize-basket", work.basket), iterations),
+        "main.POST /optimize-basket/batch": measure(
+            post("/optimize-basket/batch", lambda: [work.basket() for _ in range(100)]),
+            max(3, iterations // 10)),
+        "main.POST /predict-prices": measure(post("/predict-prices", lambda: work.product_ids(100)), iterations),
+        "main.POST /recommendations": measure(post("/recommendations", work.preferences), iterations),
+        "main.GET /analytics/market-trends": measure(
+            lambda: client.get("/analytics/market-trends").raise_for_status(), iterations),
+    }
+
+
+def bench_simple_http(work: Workload, iterations: int) -> Dict[str, Dict[str, float]]:
+    """simple_ai.py over a real socket with one keep-alive connection"""
+    from simple_ai import SmartShopAIHandler, SmartShopAIServer
+
+    class QuietHandler(SmartShopAIHandler):
+        def log_message(self, format, *args):
+            pass
+
+    server = SmartShopAIServer(("127.0.0.1", 0), QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+
+    def request(method: str, path: str, payload_fn: Optional[Callable[[], Any]] = None):
+        def call():
+            body = json.dumps(payload_fn()) if payload_fn else None
+            conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                raise RuntimeError(f"{method} {path} -> {response.status}")
+        return call
+
+    try:
+        return {
+            "simple.GET /": measure(request("GET", "/"), iterations),
+            "simple.POST /optimize-basket": measure(request("POST", "/optimize-basket", work.basket), iterations),
+            "simple.POST /predict-prices": measure(
+                request("POST", "/predict-prices", lambda: work.product_ids(100)), iterations),
+            "simple.POST /recommendations": measure(
+                request("POST", "/recommendations", work.preferences), iterations),
+            "simple.GET /analytics/market-trends": measure(
+                request("GET", "/analytics/market-trends"), iterations),
+        }
+    finally:
+        conn.close()
+        server.shutdown()
+        server.server_close()
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any], max_regression: float) -> bool:
+    """Print p50 ratios against a previous run; True when nothing regressed"""
+    ok = True
+    print(f"{'case':45} {'old p50':>10} {'new p50':>10} {'ratio':>7}")
+    for case, result in current["results"].items():
+        old = previous.get("results", {}).get(case)
+        if not old:
+            continue
+        ratio = result["p50_ms"] / old["p50_ms"] if old["p50_ms"] else float("inf")
+        flag = ""
+        if ratio > 1 + max_regression:
+            flag = "  ⚠️ regression"
+            ok = False
+        print(f"{case:45} {old['p50_ms']:>10.3f} {result['p50_ms']:>10.3f} {ratio:>7.2f}{flag}")
+    return ok
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="SmartShop AI benchmark suite")
+    parser.add_argument("--skus", type=int, default=10000, help="Synthetic catalog size")
+    parser.add_argument("--stores", type=int, default=10, help="Number of store chains")
+    parser.add_argument("--days", type=int, default=90, help="Days of price history")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--basket-size", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--skip-http", action="store_true", help="Only benchmark engine methods")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="Previous JSON report to compare p50 latencies against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed p50 slowdown before --compare fails (default: 0.2 = 20%%)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    import logging
+    logging.disable(logging.INFO)
+
+    from main import SmartShopAI
+
+    setup_started = time.perf_counter()
+    products = generate_catalog(args.skus, args.stores, seed=args.seed)
+    history = generate_history(products, args.days, seed=args.seed)
+    engine = SmartShopAI(products, price_history=history)
+    setup_s = time.perf_counter() - setup_started
+
+    work = Workload(products, args.basket_size, args.seed)
+    results = bench_engine(engine, work, args.iterations)
+    results.update(bench_records(products, args.iterations))
+    if not args.skip_http:
+        results.update(bench_main_http(engine, work, args.iterations))
+        results.update(bench_simple_http(work, args.iterations))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "skus": args.skus,
+            "stores": args.stores,
+            "days": args.days,
+            "seed": args.seed,
+            "basket_size": args.basket_size,
+            "iterations": args.iterations,
+            "setup_s": round(setup_s, 3),
+        },
+        "results": results,
+        "product_memory_mb": product_memory_mb(products),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        if not compare(previous, report, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
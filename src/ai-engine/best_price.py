@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Best Price Tables
+Per-product offer tables answering "cheapest acceptable offer" queries
+with a binary search instead of a filter + sort per basket item
+"""
+
+import threading
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from catalog import CatalogSnapshot, ProductCatalog
+from records import Offer, ProductRecord
+
+# Preferred-store masks whose tables are kept; older ones are dropped first
+MAX_STORE_MASKS = 64
+
+# (product record the table was built from, raw prices ascending, index into
+# product.offers of the best offer among the first k+1 entries)
+OfferTable = Tuple[ProductRecord, List[float], List[int]]
+
+
+class BestPriceTables:
+    """Lazily built best-offer tables for one catalog snapshot.
+
+    For every product (and store subset, as a bitmask over the snapshot's
+    store columns) the offers are sorted by raw price and annotated with a
+    running best by effective price (price - discount, earlier offer on
+    ties). The best offer within a max_price is then one bisect away.
+    """
+
+    def __init__(self, catalog: CatalogSnapshot):
+        self.catalog = catalog
+        # store mask -> row -> table; mask 0 means every store
+        self._tables: Dict[int, Dict[int, OfferTable]] = {0: {}}
+
+    def store_bits(self, stores: Optional[Iterable[str]]) -> int:
+        """Bitmask of the given store names (unknown stores are ignored)"""
+        mask = 0
+        for store in stores or ():
+            col = self.catalog.store_index.get(store)
+            if col is not None:
+                mask |= 1 << col
+        return mask
+
+    def best_option(self, row: int, max_price: Optional[float], store_bits: int = 0) -> Optional[Offer]:
+        """Same answer as _find_best_price_option, in O(log offers).
+
+        Offers above max_price are skipped; if any remaining offer is at a
+        preferred store only those compete.
+        """
+        limit = max_price if max_price else float("inf")
+        if store_bits:
+            option = _lookup(self._table(row, store_bits), limit)
+            if option is not None:
+                return option
+        return _lookup(self._table(row, 0), limit)
+
+    def _table(self, row: int, store_bits: int) -> OfferTable:
+        tables = self._tables.get(store_bits)
+        if tables is None:
+            if len(self._tables) > MAX_STORE_MASKS:
+                # Dicts keep insertion order: drop the oldest non-default mask
+                self._tables.pop(next(mask for mask in list(self._tables) if mask), None)
+            tables = self._tables[store_bits] = {}
+        product = self.catalog.products[row]
+        table = tables.get(row)
+        # In-place price updates swap in a new product record; a table built
+        # from the old one is stale even if refresh_rows has not run yet
+        if table is None or table[0] is not product:
+            table = tables[row] = self._build(product, store_bits)
+        return table
+
+    def _build(self, product: ProductRecord, store_bits: int) -> OfferTable:
+        store_columns = self.catalog.store_columns
+        candidates = [
+            (offer.price, offer.price - offer.discount, position)
+            for position, offer in enumerate(product.offers)
+            if not store_bits or store_bits >> store_columns[offer.store_id] & 1
+        ]
+        candidates.sort(key=lambda c: c[0])
+
+        prices, best = [], []
+        best_key = None
+        for price, effective, position in candidates:
+            if best_key is None or (effective, position) < best_key:
+                best_key = (effective, position)
+            prices.append(price)
+            best.append(best_key[1])
+        return product, prices, best
+
+    def refresh_rows(self, rows: Iterable[int]) -> None:
+        """Forget the tables of rows whose offers changed"""
+        rows = list(rows)
+        for tables in list(self._tables.values()):
+            for row in rows:
+                tables.pop(row, None)
+
+
+def _lookup(table: OfferTable, limit: float) -> Optional[Offer]:
+    product, prices, best = table
+    k = bisect_right(prices, limit)
+    return product.offers[best[k - 1]] if k else None
+
+
+class BestPriceIndex:
+    """Keeps BestPriceTables in sync with a ProductCatalog"""
+
+    def __init__(self, catalog: ProductCatalog):
+        self.catalog = catalog
+        self._lock = threading.Lock()
+        self._tables: Optional[BestPriceTables] = None
+        catalog.add_listener(self._on_catalog_change)
+
+    @property
+    def tables(self) -> BestPriceTables:
+        tables = self._tables
+        snapshot = self.catalog.snapshot
+        if tables is None or tables.catalog is not snapshot:
+            with self._lock:
+                if self._tables is None or self._tables.catalog is not snapshot:
+                    self._tables = BestPriceTables(snapshot)
+                tables = self._tables
+        return tables
+
+    def _on_catalog_change(self, product_ids: Optional[List[str]]) -> None:
+        if product_ids is None:
+            return  # new snapshot; tables are rebuilt lazily on next use
+        with self._lock:
+            tables = self._tables
+            if tables is not None and tables.catalog is self.catalog.snapshot:
+                tables.refresh_rows(tables.catalog.id_index[pid] for pid in product_ids)
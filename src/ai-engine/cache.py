@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Result Cache
+LRU/TTL cache for engine results with per-product price invalidation
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Dependency tag for results that depend on every product (e.g. recommendations)
+ALL_PRODUCTS = "*"
+
+
+def canonical_key(namespace: str, payload: Any, version: int = 0) -> str:
+    """Stable hash of a JSON-able payload; equal payloads map to equal keys"""
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    digest = hashlib.sha256(body.encode("utf-8")).hexdigest()
+    return f"{namespace}:v{version}:{digest}"
+
+
+class MemoryBackend:
+    """In-process LRU with TTL and a product -> keys reverse index"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires, value, deps)
+        self._by_product: Dict[str, Set[str]] = {}
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: str, value: Any, deps: Set[str]) -> None:
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, value, deps)
+        for pid in deps:
+            self._by_product.setdefault(pid, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, product_ids: Optional[Iterable[str]]) -> int:
+        if product_ids is None:
+            dropped = len(self._entries)
+            self._entries.clear()
+            self._by_product.clear()
+            return dropped
+        keys = set(self._by_product.get(ALL_PRODUCTS, ()))
+        for pid in product_ids:
+            keys |= self._by_product.get(pid, set())
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for pid in entry[2]:
+            keys = self._by_product.get(pid)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_product[pid]
+
+
+class RedisBackend:
+    """Shared cache in Redis: values as JSON with TTL, dependency tags as sets.
+
+    A sorted set indexes the live keys by expiry time, so the size (scraped
+    by /metrics) is a prune of expired members plus one ZCARD, not a scan.
+    """
+
+    def __init__(self, url: str, ttl: float, prefix: str = "smartshop:cache:"):
+        import redis  # optional dependency, only needed for this backend
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.index = f"{prefix}index"
+        self.evictions = 0  # Redis evicts on its own (maxmemory-policy)
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, deps: Set[str]) -> None:
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, json.dumps(value, default=str), ex=int(self.ttl))
+        pipe.zadd(self.index, {self.prefix + key: time.time() + int(self.ttl)})
+        for pid in deps:
+            tag = f"{self.prefix}dep:{pid}"
+            pipe.sadd(tag, self.prefix + key)
+            pipe.expire(tag, int(self.ttl))
+        pipe.execute()
+
+    def invalidate(self, product_ids: Optional[Iterable[str]]) -> int:
+        if product_ids is None:
+            keys = list(self.client.scan_iter(match=self.prefix + "*"))
+            if keys:
+                self.client.delete(*keys)
+            return len(keys)
+        tags = [f"{self.prefix}dep:{pid}" for pid in list(product_ids) + [ALL_PRODUCTS]]
+        keys = self.client.sunion(tags)
+        pipe = self.client.pipeline()
+        if keys:
+            pipe.delete(*keys)
+            pipe.zrem(self.index, *keys)
+        pipe.delete(*tags)
+        pipe.execute()
+        return len(keys)
+
+    def __len__(self) -> int:
+        pipe = self.client.pipeline()
+        pipe.zremrangebyscore(self.index, "-inf", time.time())
+        pipe.zcard(self.index)
+        return pipe.execute()[1]
+
+
+class ResultCache:
+    """Result cache keyed by canonical payload hashes.
+
+    Each entry records the product ids it depends on; a price update for a
+    product drops only those entries. `generation` guards against storing a
+    result computed from prices that changed while it was being computed.
+    """
+
+    def __init__(self, backend=None, max_entries: int = 1024, ttl: float = 300.0):
+        self.backend = backend if backend is not None else MemoryBackend(max_entries, ttl)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_writes = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls) -> "ResultCache":
+        """Configure from SMARTSHOP_CACHE (memory|redis), _CACHE_SIZE, _CACHE_TTL, _REDIS_URL"""
+        ttl = float(os.getenv("SMARTSHOP_CACHE_TTL", "300"))
+        max_entries = int(os.getenv("SMARTSHOP_CACHE_SIZE", "1024"))
+        if os.getenv("SMARTSHOP_CACHE", "memory") == "redis":
+            url = os.getenv("SMARTSHOP_REDIS_URL", "redis://localhost:6379/0")
+            logger.info(f"Result cache backed by Redis at {url}")
+            return cls(RedisBackend(url, ttl))
+        return cls(max_entries=max_entries, ttl=ttl)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self.backend.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, depends_on: Optional[Iterable[str]] = None,
+            generation: Optional[int] = None) -> None:
+        """Store a result; depends_on=None means it depends on the whole catalog"""
+        deps = {ALL_PRODUCTS} if depends_on is None else set(depends_on)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                self.stale_writes += 1
+                return
+            self.backend.set(key, value, deps)
+
+    def invalidate(self, product_ids: Optional[Iterable[str]] = None) -> None:
+        """Drop entries depending on the given products (all entries for None)"""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += self.backend.invalidate(product_ids)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.backend.evictions,
+            "invalidated_entries": self.invalidations,
+            "stale_writes": self.stale_writes,
+        }
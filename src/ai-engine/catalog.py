@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Product Catalog
+Indexed in-memory product store backing the AI engine
+"""
+
+import threading
+import logging
+from typing import List, Dict, Optional, Any, Callable, Iterable, Union
+import numpy as np
+
+from records import STORES, CATEGORIES, Offer, ProductRecord, as_offer, as_record, remap
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogSnapshot:
+    """Fully indexed view of the product catalog.
+
+    Readers grab one snapshot per request and never see a half-built index;
+    reloads build a new snapshot and swap it in, so the products, ids,
+    stores and indexes of a snapshot never change. Prices do: updates for
+    stores the snapshot already has a column for are written into it in
+    place (ProductCatalog.update_prices / merge_offers). Each product's
+    record is swapped whole, so one ProductRecord's offers are always
+    consistent, but the price arrays may show part of an update batch.
+    Products may be given as API-shaped dicts; they are kept as ProductRecords.
+    """
+
+    def __init__(self, products: Iterable[Union[ProductRecord, Dict[str, Any]]], version: int = 0):
+        self.version = version
+        self.products: List[ProductRecord] = [as_record(product) for product in products]
+
+        # Hash index and postings lists (row numbers into self.products)
+        self.id_index: Dict[str, int] = {}
+        self.category_index: Dict[str, List[int]] = {}
+        self.brand_index: Dict[str, List[int]] = {}
+        self.stores: List[str] = []
+        self.store_index: Dict[str, int] = {}
+        # Interned store id -> price column
+        self.store_columns: Dict[int, int] = {}
+
+        for row, product in enumerate(self.products):
+            self.id_index[product.id] = row
+            self.category_index.setdefault(product.category, []).append(row)
+            self.brand_index.setdefault(product.brand, []).append(row)
+            for offer in product.offers:
+                if offer.store_id not in self.store_columns:
+                    self.store_columns[offer.store_id] = len(self.stores)
+                    self.store_index[offer.store] = len(self.stores)
+                    self.stores.append(offer.store)
+
+        # Per-store price arrays: one column per store, NaN where not sold
+        shape = (len(self.products), len(self.stores))
+        self.prices = np.full(shape, np.nan)
+        self.discounts = np.zeros(shape)
+        # Position of each offer in the product's own price list; breaks
+        # effective-price ties the same way a stable sort of that list would
+        self.offer_order = np.full(shape, np.iinfo(np.int32).max, dtype=np.int32)
+        self.effective_prices = np.full(shape, np.nan)
+        for row, product in enumerate(self.products):
+            self._fill_row(row, product.offers)
+
+    def _fill_row(self, row: int, offers: Iterable[Offer]) -> None:
+        self.prices[row] = np.nan
+        self.discounts[row] = 0.0
+        self.offer_order[row] = np.iinfo(np.int32).max
+        for position, offer in enumerate(offers):
+            col = self.store_columns[offer.store_id]
+            self.prices[row, col] = offer.price
+            self.discounts[row, col] = offer.discount
+            self.offer_order[row, col] = position
+        self.effective_prices[row] = self.prices[row] - self.discounts[row]
+
+    def _fill_rows(self, rows: List[int], offers: List[Iterable[Offer]]) -> None:
+        """_fill_row for many rows with a handful of bulk array writes"""
+        rows = np.asarray(rows, dtype=np.intp)
+        self.prices[rows] = np.nan
+        self.discounts[rows] = 0.0
+        self.offer_order[rows] = np.iinfo(np.int32).max
+        cells = [
+            (row, self.store_columns[offer.store_id], offer.price, offer.discount, position)
+            for row, row_offers in zip(rows, offers)
+            for position, offer in enumerate(row_offers)
+        ]
+        if cells:
+            r, c, price, discount, position = (np.array(column) for column in zip(*cells))
+            self.prices[r, c] = price
+            self.discounts[r, c] = discount
+            self.offer_order[r, c] = position
+        self.effective_prices[rows] = self.prices[rows] - self.discounts[rows]
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Interned ids are per process: ship the names they stand for
+        return {**self.__dict__, "_store_names": list(STORES.names), "_category_names": list(CATEGORIES.names)}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        store_names = state.pop("_store_names")
+        category_names = state.pop("_category_names")
+        self.__dict__.update(state)
+        products = remap(self.products, store_names, category_names)
+        if products is not None:
+            self.products = products
+            self.store_columns = {STORES.id(store): col for col, store in enumerate(self.stores)}
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def offer_at(self, row: int, col: int) -> Offer:
+        """The product's own offer behind one (row, store column) price cell"""
+        return self.products[row].offers[self.offer_order[row, col]]
+
+    def get(self, product_id: str) -> Optional[ProductRecord]:
+        """Look up a product by id in O(1)"""
+        row = self.id_index.get(product_id)
+        return self.products[row] if row is not None else None
+
+    def row_of(self, product_id: str) -> int:
+        """Row number of a product, or -1 when unknown"""
+        return self.id_index.get(product_id, -1)
+
+    def rows_of(self, product_ids: Iterable[str]) -> np.ndarray:
+        """Vector of row numbers for the given ids (-1 for unknown ids)"""
+        return np.fromiter(
+            (self.id_index.get(pid, -1) for pid in product_ids), dtype=np.intp
+        )
+
+    def by_category(self, category: str) -> List[ProductRecord]:
+        return [self.products[row] for row in self.category_index.get(category, [])]
+
+    def by_brand(self, brand: str) -> List[ProductRecord]:
+        return [self.products[row] for row in self.brand_index.get(brand, [])]
+
+    def store_mask(self, stores: Optional[Iterable[str]]) -> np.ndarray:
+        """Boolean mask over store columns for the given store names"""
+        mask = np.zeros(len(self.stores), dtype=bool)
+        for store in stores or ():
+            col = self.store_index.get(store)
+            if col is not None:
+                mask[col] = True
+        return mask
+
+    def store_prices(self, store: str) -> np.ndarray:
+        """Price column for one store (NaN where the store does not sell the product)"""
+        return self.prices[:, self.store_index[store]]
+
+
+class ProductCatalog:
+    """Thread-safe catalog handle with non-blocking hot reload"""
+
+    def __init__(self, products: Optional[Iterable[Dict[str, Any]]] = None,
+                 loader: Optional[Callable[[], Iterable[Dict[str, Any]]]] = None):
+        self._loader = loader
+        self._reload_lock = threading.Lock()
+        self._listeners: List[Callable[[Optional[List[str]]], None]] = []
+        # Bumped on every in-place price update (reloads bump snapshot.version)
+        self.price_version = 0
+        if products is None:
+            products = loader() if loader else []
+        self._snapshot = CatalogSnapshot(products, version=1)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: CatalogSnapshot,
+                      loader: Optional[Callable[[], Iterable[Dict[str, Any]]]] = None) -> "ProductCatalog":
+        """Wrap a prebuilt (e.g. unpickled) snapshot without re-indexing"""
+        catalog = cls(products=[], loader=loader)
+        catalog._snapshot = snapshot
+        return catalog
+
+    @property
+    def snapshot(self) -> CatalogSnapshot:
+        """Current snapshot; take it once per request for a consistent view"""
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def reload(self, products: Optional[Iterable[Dict[str, Any]]] = None) -> CatalogSnapshot:
+        """Rebuild the indexes and atomically swap them in.
+
+        The new snapshot is built off to the side, so requests keep reading
+        the previous one until the reference swap.
+        """
+        with self._reload_lock:
+            if products is None:
+                if self._loader is None:
+                    raise ValueError("No products given and catalog has no loader")
+                products = self._loader()
+            snapshot = CatalogSnapshot(products, version=self._snapshot.version + 1)
+            self._snapshot = snapshot
+        logger.info(f"Catalog reloaded: {len(snapshot)} products, version {snapshot.version}")
+        self._notify(None)
+        return snapshot
+
+    def add_listener(self, listener: Callable[[Optional[List[str]]], None]) -> None:
+        """Call `listener(product_ids)` after price changes; None means a full reload"""
+        self._listeners.append(listener)
+
+    def update_prices(self, updates: Dict[str, List[Dict[str, Any]]]) -> List[str]:
+        """Replace the offers of existing products in place.
+
+        Only the touched rows are rewritten. Offers at a store the catalog
+        has never seen need a new price column, so those fall back to a
+        full rebuild. Returns the ids that were updated.
+        """
+        with self._reload_lock:
+            changed, new_store = self._apply_updates(updates)
+        if changed:
+            self._notify(None if new_store else changed)
+        return changed
+
+    def merge_offers(self, deltas: Iterable[Dict[str, Any]]) -> List[str]:
+        """Apply per-store offer deltas ({"product_id", "store", "price", "discount"}).
+
+        Each delta replaces the product's offer at that store, or adds one
+        if the product was not sold there yet; other offers are kept. A
+        delta with "removed": True drops the offer at that store instead.
+        Later deltas win. Unknown products are ignored. Returns the ids
+        that were updated.
+        """
+        with self._reload_lock:
+            snapshot = self._snapshot
+            updates: Dict[str, List[Offer]] = {}
+            # (row, col) -> (price, discount, position): the only array cells a delta touches
+            cells: Dict[tuple, tuple] = {}
+            # Rows that lost an offer: later offers shift position, so the whole row is rewritten
+            refill = set()
+            new_store = False
+            for delta in deltas:
+                pid = delta["product_id"]
+                row = snapshot.id_index.get(pid)
+                if row is None:
+                    continue
+                offers = updates.get(pid)
+                if delta.get("removed"):
+                    current = offers if offers is not None else snapshot.products[row].offers
+                    store_id = STORES.ids.get(delta["store"])
+                    if any(existing.store_id == store_id for existing in current):
+                        updates[pid] = [existing for existing in current if existing.store_id != store_id]
+                        refill.add(row)
+                    continue
+                if offers is None:
+                    offers = updates[pid] = list(snapshot.products[row].offers)
+                offer = Offer(STORES.id(delta["store"]), delta["price"], delta.get("discount", 0))
+                for position, existing in enumerate(offers):
+                    if existing.store_id == offer.store_id:
+                        offers[position] = offer
+                        break
+                else:
+                    position = len(offers)
+                    offers.append(offer)
+                col = snapshot.store_columns.get(offer.store_id)
+                if col is None:
+                    new_store = True
+                else:
+                    cells[row, col] = (offer.price, offer.discount, position)
+            
+            if new_store:
+                changed, _ = self._apply_updates(updates)
+            else:
+                changed = list(updates)
+                for pid, offers in updates.items():
+                    row = snapshot.id_index[pid]
+                    snapshot.products[row] = snapshot.products[row].with_offers(offers)
+                if refill:
+                    rows = sorted(refill)
+                    snapshot._fill_rows(rows, [snapshot.products[row].offers for row in rows])
+                    cells = {cell: value for cell, value in cells.items() if cell[0] not in refill}
+                if cells:
+                    r, c = np.array(list(cells)).T
+                    price, discount, position = (np.array(column) for column in zip(*cells.values()))
+                    snapshot.prices[r, c] = price
+                    snapshot.discounts[r, c] = discount
+                    snapshot.offer_order[r, c] = position
+                    snapshot.effective_prices[r, c] = snapshot.prices[r, c] - snapshot.discounts[r, c]
+                self.price_version += 1
+        if changed:
+            self._notify(None if new_store else changed)
+        return changed
+
+    def _apply_updates(self, updates: Dict[str, List[Union[Offer, Dict[str, Any]]]]) -> tuple:
+        """Write new offers under the reload lock; returns (changed ids, rebuilt?)"""
+        snapshot = self._snapshot
+        offers = {
+            pid: tuple(as_offer(offer) for offer in updates[pid])
+            for pid in updates if pid in snapshot.id_index
+        }
+        changed = list(offers)
+        new_store = any(
+            offer.store_id not in snapshot.store_columns
+            for pid in changed for offer in offers[pid]
+        )
+        if new_store:
+            products = list(snapshot.products)
+            for pid in changed:
+                row = snapshot.id_index[pid]
+                products[row] = products[row].with_offers(offers[pid])
+            self._snapshot = CatalogSnapshot(products, version=snapshot.version + 1)
+        else:
+            rows = [snapshot.id_index[pid] for pid in changed]
+            for pid, row in zip(changed, rows):
+                # New record, so readers holding the old product see consistent offers
+                snapshot.products[row] = snapshot.products[row].with_offers(offers[pid])
+            snapshot._fill_rows(rows, [offers[pid] for pid in changed])
+        self.price_version += 1
+        return changed, new_store
+
+    def _notify(self, product_ids: Optional[List[str]]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(product_ids)
+            except Exception as e:
+                logger.error(f"Catalog listener error: {str(e)}")
+
+    def reload_in_background(self, products: Optional[Iterable[Dict[str, Any]]] = None) -> threading.Thread:
+        """Run reload() on a daemon thread and return it"""
+        thread = threading.Thread(target=self.reload, args=(products,), daemon=True)
+        thread.start()
+        return thread
+
+    # Convenience pass-throughs to the current snapshot
+    def __len__(self) -> int:
+        return len(self._snapshot)
+
+    def get(self, product_id: str) -> Optional[ProductRecord]:
+        return self._snapshot.get(product_id)
+
+    @property
+    def products(self) -> List[ProductRecord]:
+        return self._snapshot.products
+
+    @property
+    def stores(self) -> List[str]:
+        return self._snapshot.stores
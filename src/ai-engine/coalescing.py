@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Request Coalescing
+Single-flight sharing of identical in-flight computations, and short
+windows that merge overlapping id sets into one batched engine call
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set
+
+logger = logging.getLogger(__name__)
+
+# Default window for merging id sets, and the most ids merged into one call
+BATCH_WINDOW = 0.002
+MAX_BATCH_IDS = 5000
+
+
+def _consume(task: asyncio.Future) -> None:
+    # Mark the outcome as retrieved even when every waiter went away
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one computation.
+
+    The first caller starts `compute()` as a task; callers arriving while it
+    runs await the same task. The key is forgotten once the task finishes, so
+    later calls compute afresh (caching finished results is ResultCache's job).
+    A caller that disconnects does not cancel the computation for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.started = 0
+        self.shared = 0
+
+    async def run(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(compute())
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            task.add_done_callback(_consume)
+            self.started += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {"started": self.started, "shared": self.shared, "in_flight": len(self._inflight)}
+
+
+class _Batch:
+    __slots__ = ("ids", "future", "requests")
+
+    def __init__(self, future: asyncio.Future):
+        self.ids: Dict[str, None] = {}  # insertion-ordered set
+        self.future = future
+        self.requests = 0
+
+
+class IdBatcher:
+    """Merges the id sets of calls arriving within `window` seconds.
+
+    `call(ids, group)` computes results for a list of ids; `key_of(result)`
+    gives the id a result belongs to. Calls only merge within the same group
+    (e.g. the same forecast horizon). Each caller gets an id -> result map
+    covering the ids it asked for (ids without a result are left out).
+    """
+
+    def __init__(self, call: Callable[[List[str], Hashable], Awaitable[List[Any]]],
+                 key_of: Callable[[Any], str], window: float = BATCH_WINDOW,
+                 max_ids: int = MAX_BATCH_IDS):
+        self.call = call
+        self.key_of = key_of
+        self.window = window
+        self.max_ids = max_ids
+        self._open: Dict[Hashable, _Batch] = {}
+        self._flushing: Set[asyncio.Task] = set()  # strong refs until done
+        self.batches = 0
+        self.requests = 0
+
+    async def submit(self, ids: List[str], group: Hashable = None) -> Dict[str, Any]:
+        self.requests += 1
+        batch = self._open.get(group)
+        if batch is None or len(batch.ids) + len(ids) > self.max_ids:
+            loop = asyncio.get_running_loop()
+            batch = self._open[group] = _Batch(loop.create_future())
+            batch.future.add_done_callback(_consume)
+            loop.call_later(self.window, self._start_flush, group, batch)
+        batch.requests += 1
+        batch.ids.update(dict.fromkeys(ids))
+        return await asyncio.shield(batch.future)
+
+    def _start_flush(self, group: Hashable, batch: _Batch) -> None:
+        task = asyncio.ensure_future(self._flush(group, batch))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _flush(self, group: Hashable, batch: _Batch) -> None:
+        if self._open.get(group) is batch:
+            del self._open[group]
+        self.batches += 1
+        if batch.requests > 1:
+            logger.debug(f"Merged {batch.requests} calls into one of {len(batch.ids)} ids")
+        try:
+            results = await self.call(list(batch.ids), group)
+        except asyncio.CancelledError:
+            batch.future.cancel()
+            raise
+        except Exception as e:
+            batch.future.set_exception(e)
+        else:
+            batch.future.set_result({self.key_of(result): result for result in results})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": round(self.window * 1000, 3),
+            "requests": self.requests,
+            "batches": self.batches,
+            "open": len(self._open),
+        }
+
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Synthetic Data Generator
+Deterministic catalogs and price histories of any size for benchmarks and
+load tests, written straight to the engine's snapshot format
+
+Every random draw is a pure function of (seed, product id, stream, column):
+a product's attributes and price walk never depend on which other products
+are generated with it, on chunking, on the process or on PYTHONHASHSEED.
+Workers, restarts and shards (which generate only the products they own)
+therefore all see identical data.
+
+Usage:
+    python datagen.py /data/snapshot --skus 1000000 --stores 12 --days 365
+    python datagen.py /data/snapshot --skus 200000 --shards 4 --by hash
+"""
+
+import argparse
+import hashlib
+import shutil
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import numpy as np
+
+from price_history import PriceHistoryStore, DEFAULT_SPARE_DAYS, offer_key
+from records import ProductRecord
+from sharding import SHARD_BY
+
+STORES = [
+    "LIDL", "Biedronka", "Auchan", "Kaufland", "Carrefour", "Netto",
+    "Dino", "Żabka", "Stokrotka", "Aldi", "Intermarché", "Polomarket",
+]
+
+CATEGORIES = {
+    # category: (product nouns, typical price range in PLN)
+    "Nabiał": (["Mleko UHT", "Jogurt naturalny", "Ser żółty", "Masło", "Śmietana 18%", "Kefir"], (2.0, 12.0)),
+    "Pieczywo": (["Chleb Żytni", "Bułki pszenne", "Chleb tostowy", "Bagietka", "Rogal"], (1.0, 8.0)),
+    "Napoje": (["Kawa Mielona", "Herbata czarna", "Sok pomarańczowy", "Woda mineralna", "Napój gazowany"], (1.5, 30.0)),
+    "Mięso": (["Filet z kurczaka", "Szynka", "Kiełbasa śląska", "Schab", "Parówki"], (6.0, 40.0)),
+    "Warzywa": (["Ziemniaki", "Marchew", "Pomidory", "Ogórki", "Cebula", "Papryka"], (1.5, 15.0)),
+    "Owoce": (["Jabłka", "Banany", "Pomarańcze", "Truskawki", "Gruszki"], (2.5, 20.0)),
+    "Słodycze": (["Czekolada mleczna", "Wafelki", "Ciastka owsiane", "Cukierki", "Batony"], (1.5, 15.0)),
+    "Chemia": (["Płyn do naczyń", "Proszek do prania", "Mydło", "Papier toaletowy", "Szampon"], (3.0, 45.0)),
+}
+
+SIZES = ["200g", "250g", "300g", "500g", "1kg", "0.5L", "1L", "1.5L", "2L", "6x1.5L"]
+BRAND_PREFIXES = ["Pol", "Mazur", "Kasz", "Tatr", "Wiel", "Łąk", "Zdrow", "Słon", "Mlecz", "Złot"]
+BRAND_SUFFIXES = ["ka", "ex", "pol", "ski", "owo", "mar", "vita", "land"]
+DISCOUNT_RATES = np.array([0.0, 0.0, 0.05, 0.1, 0.2])
+
+# Products per vectorized block of the catalog, and history values per block
+# (blocks bound the size of the products × stores/days temporaries)
+CHUNK_PRODUCTS = 65536
+CHUNK_VALUES = 1 << 20
+
+# Independent draw streams per product
+(_CATEGORY, _NOUN, _SIZE, _BRAND, _BASE, _OFFERS, _STORE_ORDER,
+ _PRICE, _DISCOUNT, _RATING, _WALK_RADIUS, _WALK_ANGLE) = range(12)
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_UINT64_MASK = 0xFFFFFFFFFFFFFFFF
+
+Product = Union[ProductRecord, Dict[str, Any]]
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, elementwise over uint64 (overwrites `x`)"""
+    with np.errstate(over="ignore"):
+        x ^= x >> np.uint64(30)
+        x *= np.uint64(0xBF58476D1CE4E5B9)
+        x ^= x >> np.uint64(27)
+        x *= np.uint64(0x94D049BB133111EB)
+        x ^= x >> np.uint64(31)
+    return x
+
+
+def product_keys(product_ids: Iterable[str], seed: int = 42) -> np.ndarray:
+    """64-bit stream key per product id, the same in every process (any int seed, taken mod 2**64)"""
+    digests = b"".join(hashlib.blake2b(pid.encode("utf-8"), digest_size=8).digest() for pid in product_ids)
+    seed_key = _mix(np.array([seed & _UINT64_MASK], dtype=np.uint64))
+    return _mix(np.frombuffer(digests, dtype="<u8") ^ seed_key)
+
+
+def uniform(keys: np.ndarray, stream: int, columns: Optional[int] = None) -> np.ndarray:
+    """Uniform [0, 1) draws: one per key, or a keys × columns block"""
+    with np.errstate(over="ignore"):
+        bits = _mix(keys ^ (np.uint64(stream + 1) * _GOLDEN))
+        if columns is not None:
+            bits = bits[:, None] + np.arange(1, columns + 1, dtype=np.uint64) * _GOLDEN
+    bits = _mix(bits)
+    bits >>= np.uint64(11)
+    return bits * (1.0 / (1 << 53))
+
+
+def normal(keys: np.ndarray, columns: int) -> np.ndarray:
+    """Standard normal keys × columns block (Box-Muller; each uniform pair yields two draws)"""
+    pairs = (columns + 1) // 2
+    radius = np.sqrt(-2.0 * np.log1p(-uniform(keys, _WALK_RADIUS, pairs)))
+    angle = 2.0 * np.pi * uniform(keys, _WALK_ANGLE, pairs)
+    draws = np.empty((len(keys), 2 * pairs))
+    np.multiply(radius, np.cos(angle), out=draws[:, :pairs])
+    np.multiply(radius, np.sin(angle), out=draws[:, pairs:])
+    return draws[:, :columns]
+
+
+def _choice(keys: np.ndarray, stream: int, n: Union[int, np.ndarray]) -> np.ndarray:
+    return (uniform(keys, stream) * n).astype(np.int64)
+
+
+def generate_catalog(n_products: int = 1000, n_stores: int = 3, seed: int = 42) -> List[Dict[str, Any]]:
+    """Catalog in the engine's product-dict format; product i has id str(i + 1)"""
+    products = []
+    for first in range(0, n_products, CHUNK_PRODUCTS):
+        ids = [str(i + 1) for i in range(first, min(first + CHUNK_PRODUCTS, n_products))]
+        products.extend(_catalog_chunk(ids, n_stores, seed))
+    return products
+
+
+def _catalog_chunk(ids: List[str], n_stores: int, seed: int) -> List[Dict[str, Any]]:
+    stores = _store_names(n_stores)
+    categories = list(CATEGORIES)
+    brands = [p + s for p in BRAND_PREFIXES for s in BRAND_SUFFIXES]
+    noun_counts = np.array([len(CATEGORIES[c][0]) for c in categories])
+    low = np.array([CATEGORIES[c][1][0] for c in categories])
+    high = np.array([CATEGORIES[c][1][1] for c in categories])
+    keys = product_keys(ids, seed)
+
+    category = _choice(keys, _CATEGORY, len(categories))
+    noun = _choice(keys, _NOUN, noun_counts[category])
+    size = _choice(keys, _SIZE, len(SIZES))
+    brand = _choice(keys, _BRAND, len(brands))
+    base = low[category] + uniform(keys, _BASE) * (high - low)[category]
+    rating = np.round(3.0 + 2.0 * uniform(keys, _RATING), 1)
+
+    # Offer j of a product goes to the j-th store of its own random store order
+    n_offers = 1 + _choice(keys, _OFFERS, n_stores)
+    store_order = np.argsort(uniform(keys, _STORE_ORDER, n_stores), axis=1)
+    prices = np.round(base[:, None] * (0.85 + 0.35 * uniform(keys, _PRICE, n_stores)), 2)
+    rates = DISCOUNT_RATES[(uniform(keys, _DISCOUNT, n_stores) * len(DISCOUNT_RATES)).astype(np.int64)]
+    discounts = np.round(prices * rates, 2)
+
+    products = []
+    for pid, cat, n, s, b, count, order, price, discount, stars in zip(
+            ids, category.tolist(), noun.tolist(), size.tolist(), brand.tolist(), n_offers.tolist(),
+            store_order.tolist(), prices.tolist(), discounts.tolist(), rating.tolist()):
+        category_name = categories[cat]
+        products.append({
+            "id": pid,
+            "name": f"{CATEGORIES[category_name][0][n]} {SIZES[s]} {brands[b]}",
+            "category": category_name,
+            "brand": brands[b],
+            "prices": [{"store": stores[order[j]], "price": price[j], "discount": discount[j]}
+                       for j in range(count)],
+            "rating": stars,
+            "availability": count,
+        })
+    return products
+
+
+def generate_history(products: List[Product], n_days: int = 90, seed: int = 42,
+                     end: Optional[date] = None, volatility: float = 0.02) -> PriceHistoryStore:
+    """Random-walk daily price history around each product's lowest price.
+
+    The walk of a product depends only on its id and `seed`; `end` (default
+    today) just dates the last column. Products without offers have no
+    price to walk from and get no history row.
+    """
+    lowest = [_lowest_price(product) for product in products]
+    product_ids = [_product_id(product) for product, price in zip(products, lowest) if price is not None]
+    base = np.array([price for price in lowest if price is not None], dtype=np.float64)
+    return _random_walks(product_ids, base, n_days, seed, end, volatility)
+
+
+def generate_store_history(products: List[Product], n_days: int = 90, seed: int = 42,
+                           end: Optional[date] = None, volatility: float = 0.02) -> PriceHistoryStore:
+    """Random-walk daily price history of every offer, one row per product × store.
+
+    Rows are keyed offer_key(product id, store) and walk around the offer's
+    shelf price, each on its own stream, so chains drift apart the way real
+    ones do.
+    """
+    offers = [(offer_key(_product_id(product), store), price)
+              for product in products for store, price in _offers(product)]
+    keys = [key for key, _ in offers]
+    base = np.array([price for _, price in offers], dtype=np.float64)
+    return _random_walks(keys, base, n_days, seed, end, volatility)
+
+
+def _random_walks(ids: List[str], base: np.ndarray, n_days: int, seed: int,
+                  end: Optional[date], volatility: float) -> PriceHistoryStore:
+    end = end or date.today()
+    data = np.full((len(ids), n_days + DEFAULT_SPARE_DAYS), np.nan, dtype=np.float32)
+    chunk = max(1, CHUNK_VALUES // max(n_days, 1))
+    for first in range(0, len(ids), chunk):
+        rows = slice(first, first + chunk)
+        changes = volatility * normal(product_keys(ids[rows], seed), n_days)
+        walk = base[rows, None] * (1 + np.cumsum(changes, axis=1))
+        data[rows, :n_days] = np.maximum(walk, 0.01)
+    return PriceHistoryStore(ids, end - timedelta(days=n_days - 1), data, n_days)
+
+
+def write_snapshot(path: str, n_products: int, n_stores: int, n_days: int, seed: int = 42,
+                   end: Optional[date] = None, shards: int = 0, by: str = "category") -> List[str]:
+    """Generate a catalog and history and write them as engine snapshot(s).
+
+    With `shards`, one snapshot per shard is written at the per-node paths
+    the sharded engine looks for (SMARTSHOP_SNAPSHOT plus the shard suffix).
+    Returns the paths written.
+    """
+    from catalog import CatalogSnapshot
+    from sharding import ShardSpec
+    from snapshot import save_snapshot
+
+    products = generate_catalog(n_products, n_stores, seed)
+    parts = [(path, products)]
+    if shards:
+        specs = [ShardSpec(i, shards, by) for i in range(shards)]
+        parts = [(spec.path(path), spec.filter(products)) for spec in specs]
+
+    for target, owned in parts:
+        shutil.rmtree(target, ignore_errors=True)
+        save_snapshot(target, CatalogSnapshot(owned), generate_history(owned, n_days, seed, end),
+                      generate_store_history(owned, n_days, seed, end))
+    return [target for target, _ in parts]
+
+
+def _product_id(product: Product) -> str:
+    return product["id"] if isinstance(product, dict) else product.id
+
+
+def _offers(product: Product) -> List[Tuple[str, float]]:
+    if isinstance(product, dict):
+        return [(offer["store"], offer["price"]) for offer in product["prices"]]
+    return [(offer.store, offer.price) for offer in product.offers]
+
+
+def _lowest_price(product: Product) -> Optional[float]:
+    if isinstance(product, dict):
+        return min((offer["price"] for offer in product["prices"]), default=None)
+    return min((offer.price for offer in product.offers), default=None)
+
+
+def _store_names(n_stores: int) -> List[str]:
+    if n_stores <= len(STORES):
+        return STORES[:n_stores]
+    return STORES + [f"Sklep {i}" for i in range(len(STORES) + 1, n_stores + 1)]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Write a synthetic SmartShop AI engine snapshot")
+    parser.add_argument("path", help="Snapshot directory (point SMARTSHOP_SNAPSHOT here)")
+    parser.add_argument("--skus", type=int, default=10000, help="Synthetic catalog size")
+    parser.add_argument("--stores", type=int, default=10, help="Number of store chains")
+    parser.add_argument("--days", type=int, default=90, help="Days of price history")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end", type=date.fromisoformat, help="Date of the last history day (default: today)")
+    parser.add_argument("--shards", type=int, default=0, help="Write one snapshot per shard of this many")
+    parser.add_argument("--by", choices=SHARD_BY, default="category", help="Shard key")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    started = time.perf_counter()
+    paths = write_snapshot(args.path, args.skus, args.stores, args.days, args.seed, args.end,
+                           args.shards, args.by)
+    print(f"📦 {args.skus} products × {args.days} days written to {', '.join(paths)} "
+          f"in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
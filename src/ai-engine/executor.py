@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Engine Executor
+Runs CPU-bound engine calls on a thread or process pool so the event loop
+stays responsive, with per-endpoint concurrency limits and backpressure
+"""
+
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = ("optimize", "predict", "recommend", "search", "analytics")
+
+# Engine factory of a process-pool worker (built once per worker, at start)
+_worker_factory: Optional[Callable[[], Any]] = None
+
+
+def _init_worker(engine_factory: Callable[[], Any]) -> None:
+    global _worker_factory
+    _worker_factory = engine_factory
+    engine_factory()
+
+
+class _WorkerHTTPError(Exception):
+    """Picklable stand-in for HTTPException raised inside a pool process"""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(status_code, detail)
+
+
+def _call_engine(method: str, args: tuple) -> Any:
+    try:
+        return getattr(_worker_factory(), method)(*args)
+    except HTTPException as e:
+        raise _WorkerHTTPError(e.status_code, e.detail) from None
+
+
+class EngineExecutor:
+    """Dispatches engine methods to a bounded worker pool.
+
+    Each endpoint has a concurrency limit (calls running at once) and a
+    queue size (calls allowed to wait for a slot). Requests beyond
+    limit + queue are rejected with 429 instead of piling up.
+
+    In "process" mode every worker builds its own engine with
+    `engine_factory` (cheap with SMARTSHOP_SNAPSHOT); catalog updates made in
+    the server process are not seen by workers (days appended to a shared
+    price history file are), so use it for read-mostly deployments.
+    """
+
+    def __init__(self, engine_factory: Callable[[], Any], mode: str = "thread",
+                 workers: Optional[int] = None, limits: Optional[Dict[str, int]] = None,
+                 queue_sizes: Optional[Dict[str, int]] = None):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown executor mode: {mode}")
+        self.engine_factory = engine_factory
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.limits = {endpoint: self.workers for endpoint in ENDPOINTS}
+        self.limits.update(limits or {})
+        self.queue_sizes = {endpoint: 4 * self.limits[endpoint] for endpoint in ENDPOINTS}
+        self.queue_sizes.update(queue_sizes or {})
+
+        self._pool: Optional[Executor] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.pending: Dict[str, int] = {endpoint: 0 for endpoint in self.limits}
+        self.running: Dict[str, int] = {endpoint: 0 for endpoint in self.limits}
+        self.rejected: Dict[str, int] = {endpoint: 0 for endpoint in self.limits}
+
+    @classmethod
+    def from_environment(cls, engine_factory: Callable[[], Any]) -> "EngineExecutor":
+        """SMARTSHOP_EXECUTOR=thread|process, SMARTSHOP_EXECUTOR_WORKERS,
+        SMARTSHOP_LIMIT_<ENDPOINT> and SMARTSHOP_QUEUE_<ENDPOINT> (e.g. SMARTSHOP_LIMIT_OPTIMIZE)"""
+        workers = os.getenv("SMARTSHOP_EXECUTOR_WORKERS")
+        limits, queue_sizes = {}, {}
+        for endpoint in ENDPOINTS:
+            limit = os.getenv(f"SMARTSHOP_LIMIT_{endpoint.upper()}")
+            if limit:
+                limits[endpoint] = int(limit)
+            queue = os.getenv(f"SMARTSHOP_QUEUE_{endpoint.upper()}")
+            if queue:
+                queue_sizes[endpoint] = int(queue)
+        return cls(
+            engine_factory,
+            mode=os.getenv("SMARTSHOP_EXECUTOR", "thread"),
+            workers=int(workers) if workers else None,
+            limits=limits,
+            queue_sizes=queue_sizes
+        )
+
+    @property
+    def pool(self) -> Executor:
+        if self._pool is None:
+            if self.mode == "process":
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_worker,
+                    initargs=(self.engine_factory,)
+                )
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="engine")
+            logger.info(f"Engine executor started: {self.mode} pool with {self.workers} workers")
+        return self._pool
+
+    async def run(self, endpoint: str, method: str, *args: Any) -> Any:
+        """Run engine.<method>(*args) on the pool, or raise 429 when saturated"""
+        if self.pending[endpoint] >= self.limits[endpoint] + self.queue_sizes[endpoint]:
+            self.rejected[endpoint] += 1
+            raise HTTPException(
+                status_code=429,
+                detail=f"Engine busy ({endpoint}), please retry",
+                headers={"Retry-After": "1"}
+            )
+
+        self.pending[endpoint] += 1
+        try:
+            semaphore = self._semaphores.get(endpoint)
+            if semaphore is None:
+                semaphore = self._semaphores[endpoint] = asyncio.Semaphore(self.limits[endpoint])
+            async with semaphore:
+                self.running[endpoint] += 1
+                try:
+                    loop = asyncio.get_running_loop()
+                    if self.mode == "process":
+                        try:
+                            return await loop.run_in_executor(self.pool, _call_engine, method, args)
+                        except _WorkerHTTPError as e:
+                            raise HTTPException(status_code=e.args[0], detail=e.args[1])
+                    call = functools.partial(getattr(self.engine_factory(), method), *args)
+                    return await loop.run_in_executor(self.pool, call)
+                finally:
+                    self.running[endpoint] -= 1
+        finally:
+            self.pending[endpoint] -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "endpoints": {
+                endpoint: {
+                    "limit": self.limits[endpoint],
+                    "queue_size": self.queue_sizes[endpoint],
+                    "running": self.running[endpoint],
+                    "queued": self.pending[endpoint] - self.running[endpoint],
+                    "rejected": self.rejected[endpoint],
+                }
+                for endpoint in self.limits
+            },
+        }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
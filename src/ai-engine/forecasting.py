@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Price Forecasting
+Gradient-boosted next-day return models on lag features, trained per
+category in background processes and stored as versioned artifacts
+
+Layout of a models directory:
+    CURRENT             name of the active version directory
+    LOCK                held while a version is published (POSIX advisory lock)
+    v0001/manifest.json models, training window and holdout error
+    v0001/000.pkl ...   pickled HistGradientBoostingRegressor per model
+
+Each training run writes into a private temp directory; publishing picks
+the next free version number, renames the directory into place and
+repoints CURRENT, so workers training at the same time never share a
+version directory.
+
+Artifacts are trusted local build outputs (they are unpickled on load).
+
+Usage:
+    python forecasting.py <snapshot_dir> <models_dir> [--workers N] [--force]
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from predictor import TrendBatch, predict_batch
+from price_history import PriceHistoryStore
+
+try:
+    import fcntl
+except ImportError:  # Windows: publishing relies on the rename retry alone
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MODELS_FORMAT = 1
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = "LOCK"
+MANIFEST_FILE = "manifest.json"
+KEEP_VERSIONS = 3
+
+# Prices in the feature window (the window ends the day before the target)
+LAGS = 14
+# Most recent target days used for training, the last HOLDOUT_DAYS of them held out
+TRAIN_WINDOW_DAYS = 120
+HOLDOUT_DAYS = 7
+# Windows sampled per model
+MAX_TRAINING_ROWS = 100_000
+# Categories with fewer products are served by the global model
+MIN_CATEGORY_PRODUCTS = 30
+GLOBAL_MODEL = "__global__"
+
+# Incremental retraining: a model is refit once this many new days arrived,
+# or earlier when its error on the new days grew by DRIFT_FACTOR
+RETRAIN_AFTER_DAYS = 7
+DRIFT_FACTOR = 1.5
+
+# Predicted daily returns are clipped to this magnitude during recursion
+MAX_DAILY_RETURN = 0.2
+
+
+def _weekday(day: np.ndarray) -> np.ndarray:
+    """Monday=0 weekday of days counted from 1970-01-01 (a Thursday)"""
+    return (day + 3) % 7
+
+
+def lag_features(windows: np.ndarray, target_day: np.ndarray) -> np.ndarray:
+    """Features for predicting the return of the day after each LAGS-price window"""
+    last = windows[:, -1:]
+    relative = windows[:, :-1] / last - 1
+    returns = np.diff(windows, axis=1) / windows[:, :-1]
+    return np.column_stack([
+        relative,
+        returns[:, -7:].std(axis=1),
+        returns[:, -7:].mean(axis=1),
+        np.log(last[:, 0]),
+        _weekday(target_day),
+    ]).astype(np.float32)
+
+
+def training_set(prices: np.ndarray, rows: np.ndarray, first_day: int, rng: np.random.Generator,
+                 max_rows: int = MAX_TRAINING_ROWS,
+                 since_day: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(X, y, target_day) for sampled (product, day) windows of the given rows of a products × days matrix.
+
+    Windows are gathered by index after sampling, so memory stays
+    proportional to max_rows rather than to products × days.
+    """
+    n_products, n_days = len(rows), prices.shape[1]
+    first_target = max(LAGS, n_days - TRAIN_WINDOW_DAYS)
+    if since_day is not None:
+        first_target = max(first_target, since_day - first_day)
+    n_targets = n_days - first_target
+    if n_products == 0 or n_targets <= 0:
+        return np.empty((0, LAGS + 3), dtype=np.float32), np.empty(0), np.empty(0, dtype=np.int64)
+
+    total = n_products * n_targets
+    if total <= max_rows:
+        pairs = np.arange(total)
+    else:
+        pairs = np.sort(rng.choice(total, size=max_rows, replace=False))
+    picked, cols = np.divmod(pairs, n_targets)
+    cols += first_target
+    windows = prices[rows[picked][:, None], cols[:, None] + np.arange(-LAGS, 1)]
+    ok = np.isfinite(windows).all(axis=1) & (windows > 0).all(axis=1)
+    windows, cols = windows[ok], cols[ok]
+
+    target_day = first_day + cols
+    X = lag_features(windows[:, :-1], target_day)
+    y = windows[:, -1] / windows[:, -2] - 1
+    return X, y, target_day
+
+
+def _fit(name: str, X: np.ndarray, y: np.ndarray, holdout: np.ndarray) -> Dict[str, Any]:
+    """Process-pool task: fit one model and measure its holdout error"""
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    from threadpoolctl import threadpool_limits
+
+    started = time.perf_counter()
+    # Parallelism comes from the process pool; keep OpenMP to one thread each
+    with threadpool_limits(1):
+        model = HistGradientBoostingRegressor(
+            max_iter=200, learning_rate=0.05, max_leaf_nodes=31,
+            early_stopping=True, validation_fraction=0.1, random_state=0
+        )
+        model.fit(X[~holdout], y[~holdout])
+        mae = float(np.abs(model.predict(X[holdout]) - y[holdout]).mean()) if holdout.any() else None
+    return {
+        "name": name,
+        "model": pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL),
+        "rows": int(len(y)),
+        "mae": mae,
+        "fit_s": round(time.perf_counter() - started, 2),
+    }
+
+
+def _category_groups(product_ids: Sequence[str], categories: Dict[str, str]) -> Dict[str, np.ndarray]:
+    """History rows per model name; small or unknown categories go to the global model"""
+    groups: Dict[str, List[int]] = {}
+    for row, product_id in enumerate(product_ids):
+        groups.setdefault(categories.get(product_id, GLOBAL_MODEL), []).append(row)
+    result = {GLOBAL_MODEL: np.arange(len(product_ids))}
+    for name, rows in groups.items():
+        if name != GLOBAL_MODEL and len(rows) >= MIN_CATEGORY_PRODUCTS:
+            result[name] = np.array(rows)
+    return result
+
+
+def train_models(history: PriceHistoryStore, categories: Dict[str, str], root: str,
+                 workers: Optional[int] = None, force: bool = False, seed: int = 0) -> Dict[str, Any]:
+    """
+    Train (or incrementally refresh) the forecasting models into a new version
+    Models whose data has not moved on enough since their last fit are
+    carried over unchanged; the rest are fit in parallel worker processes.
+    Returns the new manifest (the previous one when nothing needed training).
+    """
+    started = time.perf_counter()
+    prices = history.prices
+    first_day = int(history.start.astype(np.int64))
+    last_day = first_day + history.n_days - 1
+    groups = _category_groups(history.product_ids, categories)
+    previous = read_manifest(root)
+    previous_models = previous["models"] if previous and previous.get("format") == MODELS_FORMAT else {}
+    rng = np.random.default_rng(seed)
+
+    tasks, reused = {}, {}
+    for name, rows in groups.items():
+        entry = previous_models.get(name)
+        if not force and entry is not None and not _needs_retraining(
+                root, previous, entry, prices, rows, first_day, last_day, rng):
+            reused[name] = entry
+            continue
+        X, y, target_day = training_set(prices, rows, first_day, rng)
+        if len(y) < 100:
+            logger.warning(f"Not enough price history to train '{name}' ({len(y)} windows)")
+            continue
+        tasks[name] = (X, y, target_day > last_day - HOLDOUT_DAYS)
+
+    if not tasks:
+        logger.info("Forecasting models are up to date")
+        return previous
+
+    results = []
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    # spawn: safe to start from a threaded server process
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(_fit, name, *args) for name, args in tasks.items()]
+        for future in futures:
+            results.append(future.result())
+
+    tmp = tempfile.mkdtemp(prefix=f"v.tmp-{os.getpid()}-", dir=root)
+    try:
+        models = {}
+        for i, name in enumerate(sorted(groups)):
+            filename = f"{i:03d}.pkl"
+            if name in reused:
+                shutil.copyfile(os.path.join(root, previous["directory"], reused[name]["file"]),
+                                os.path.join(tmp, filename))
+                models[name] = {**reused[name], "file": filename}
+                continue
+            result = next((r for r in results if r["name"] == name), None)
+            if result is None:
+                continue
+            with open(os.path.join(tmp, filename), "wb") as f:
+                f.write(result["model"])
+            models[name] = {
+                "file": filename,
+                "rows": result["rows"],
+                "mae": result["mae"],
+                "trained_through": str(np.datetime64(last_day, "D")),
+                "fit_s": result["fit_s"],
+            }
+
+        manifest = {
+            "format": MODELS_FORMAT,
+            "created_at": datetime.now().isoformat(),
+            "lags": LAGS,
+            "history_last_date": str(history.last_date),
+            "models": models,
+            "retrained": sorted(tasks),
+            "train_s": round(time.perf_counter() - started, 2),
+        }
+        manifest = _publish(root, tmp, manifest)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    logger.info(f"Forecasting models {manifest['directory']}: retrained {len(tasks)}, reused {len(reused)} "
+                f"in {manifest['train_s']} s")
+    return manifest
+
+
+@contextmanager
+def _publish_lock(root: str):
+    """Exclusive lock on the models directory, across processes"""
+    with open(os.path.join(root, LOCK_FILE), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _publish(root: str, tmp: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
+    """Move a finished temp directory into place as the next version and make it current.
+
+    Renaming onto an existing version directory fails, so a version taken by
+    a concurrent run (without the lock) makes this try the next number.
+    """
+    with _publish_lock(root):
+        taken = [int(d[1:]) for d in os.listdir(root) if d.startswith("v") and d[1:].isdigit()]
+        version = max(taken, default=0) + 1
+        while True:
+            version_dir = f"v{version:04d}"
+            manifest = {**manifest, "version": version, "directory": version_dir}
+            with open(os.path.join(tmp, MANIFEST_FILE), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2, ensure_ascii=False)
+            try:
+                os.rename(tmp, os.path.join(root, version_dir))
+                break
+            except OSError:
+                if not os.path.isdir(os.path.join(root, version_dir)):
+                    raise
+                version += 1
+        _write_current(root, version_dir)
+        _prune_versions(root, keep=KEEP_VERSIONS)
+    return manifest
+
+
+def _needs_retraining(root: str, manifest: Dict[str, Any], entry: Dict[str, Any], prices: np.ndarray,
+                      rows: np.ndarray, first_day: int, last_day: int, rng: np.random.Generator) -> bool:
+    trained_through = int(np.datetime64(entry["trained_through"], "D").astype(np.int64))
+    new_days = last_day - trained_through
+    if new_days <= 0:
+        return False
+    if new_days >= RETRAIN_AFTER_DAYS or not entry.get("mae"):
+        return True
+    # Drift check: error of the current model on the days it has not seen
+    X, y, _ = training_set(prices, rows, first_day, rng, max_rows=5000, since_day=trained_through + 1)
+    if len(y) == 0:
+        return False
+    with open(os.path.join(root, manifest["directory"], entry["file"]), "rb") as f:
+        model = pickle.load(f)
+    return float(np.abs(model.predict(X) - y).mean()) > DRIFT_FACTOR * entry["mae"]
+
+
+def read_manifest(root: str) -> Optional[Dict[str, Any]]:
+    """Manifest of the active version, or None when nothing was trained yet"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            version_dir = f.read().strip()
+        with open(os.path.join(root, version_dir, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_current(root: str, version_dir: str) -> None:
+    target = os.path.join(root, CURRENT_FILE)
+    tmp = f"{target}.tmp-{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version_dir)
+    os.replace(tmp, target)
+
+
+def _prune_versions(root: str, keep: int) -> None:
+    versions = sorted(d for d in os.listdir(root) if d.startswith("v") and d[1:].isdigit())
+    for old in versions[:-keep]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+
+
+def linear_path(prices: np.ndarray, predicted: np.ndarray, horizon: int) -> np.ndarray:
+    """Daily prices on the straight line from the last known price to `predicted`"""
+    last = prices[:, -1] if prices.shape[1] else predicted
+    steps = np.arange(1, horizon + 1) / horizon
+    return last[:, None] + (predicted - last)[:, None] * steps
+
+
+class Forecaster:
+    """Loaded model version serving batched multi-day forecasts"""
+
+    def __init__(self, manifest: Dict[str, Any], models: Dict[str, Any]):
+        self.manifest = manifest
+        self.models = models
+
+    @property
+    def version(self) -> int:
+        return self.manifest["version"]
+
+    @classmethod
+    def load(cls, root: str) -> Optional["Forecaster"]:
+        """Load the active version from `root`, or None when there is none"""
+        manifest = read_manifest(root)
+        if manifest is None or manifest.get("format") != MODELS_FORMAT:
+            return None
+        models = {}
+        for name, entry in manifest["models"].items():
+            with open(os.path.join(root, manifest["directory"], entry["file"]), "rb") as f:
+                models[name] = pickle.load(f)
+        logger.info(f"Forecasting models {manifest['directory']} loaded ({len(models)} models)")
+        return cls(manifest, models)
+
+    def forecast(self, prices: np.ndarray, categories: Sequence[Optional[str]], last_day: int,
+                 horizon: int) -> Tuple[TrendBatch, np.ndarray]:
+        """
+        Recursive `horizon`-day forecast for every row of a products × days matrix
+        Each step predicts one day for all rows of a model in one call and
+        feeds the prediction back into the lag window. Rows without a full
+        window of history fall back to predictor.predict_batch.
+        For model rows the trend is forward-looking: the mean forecast over
+        the horizon against the last 7 days' mean (predict_batch compares the
+        last 7 days with the 7 before them).
+        Returns (trend batch, products × horizon predicted prices).
+        """
+        prices = np.asarray(prices, dtype=float)
+        n = len(prices)
+        fallback = predict_batch(prices, horizon)
+        path = linear_path(prices, fallback.predicted_price, horizon)
+        if n == 0 or prices.shape[1] < LAGS:
+            return fallback, path
+
+        window = prices[:, -LAGS:].copy()
+        valid = np.isfinite(window).all(axis=1) & (window > 0).all(axis=1)
+        names = np.array([c if c in self.models else GLOBAL_MODEL for c in categories], dtype=object)
+        groups = {name: np.flatnonzero(valid & (names == name)) for name in set(names[valid])}
+        groups = {name: rows for name, rows in groups.items() if name in self.models and len(rows)}
+
+        for step in range(horizon):
+            target_day = np.full(n, last_day + 1 + step)
+            step_returns = np.zeros(n)
+            for name, rows in groups.items():
+                X = lag_features(window[rows], target_day[rows])
+                step_returns[rows] = self.models[name].predict(X)
+            np.clip(step_returns, -MAX_DAILY_RETURN, MAX_DAILY_RETURN, out=step_returns)
+            next_price = window[:, -1] * (1 + step_returns)
+            window = np.column_stack([window[:, 1:], next_price])
+            path[valid, step] = next_price[valid]
+
+        recent_avg = prices[:, -7:].mean(axis=1)
+        mae = np.array([self.manifest["models"].get(name, {}).get("mae") or 0.05 for name in names])
+        confidence = np.clip(1.0 - 10 * mae * np.sqrt(horizon), 0.3, 0.99)
+        batch = TrendBatch(
+            predicted_price=np.where(valid, path[:, -1], fallback.predicted_price),
+            confidence=np.where(valid, confidence, fallback.confidence),
+            trend_change=np.where(valid, (path.mean(axis=1) - recent_avg) / recent_avg, fallback.trend_change)
+        )
+        return batch, path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train SmartShop price forecasting models")
+    parser.add_argument("snapshot", help="Engine snapshot directory (see snapshot.py)")
+    parser.add_argument("models", help="Models directory; a new version is added")
+    parser.add_argument("--workers", type=int, help="Training processes (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="Retrain every model")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from snapshot import load_snapshot
+
+    catalog, history = load_snapshot(args.snapshot)
+    os.makedirs(args.models, exist_ok=True)
+    categories = {product.id: product.category for product in catalog.products}
+    manifest = train_models(history, categories, args.models, workers=args.workers, force=args.force)
+    if manifest is None:
+        sys.exit("Not enough price history to train any model")
+    print(json.dumps({k: v for k, v in manifest.items() if k != "models"}, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
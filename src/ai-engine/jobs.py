@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Background Jobs
+Submit/poll/stream/result job subsystem for heavy analytics, running on a
+local worker pool or Celery, with results memoized per data version
+"""
+
+import asyncio
+import inspect
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from cache import canonical_key
+
+logger = logging.getLogger(__name__)
+
+# Job states; DONE and FAILED are terminal
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+# Finished jobs kept for status/result lookups before the oldest are dropped
+MAX_JOBS = 256
+
+# Seconds between status checks while streaming a job's progress
+POLL_INTERVAL = 0.25
+
+# Tasks: task(engine, **params) -> JSON-able result
+
+def market_trends(engine) -> Dict[str, Any]:
+    """Week/month % changes overall, per category and per chain, plus category price indices
+
+    Chains are compared on their own offer prices (per-store history); a
+    window the per-store history does not cover yet reports None.
+    """
+    aggregates = engine.market_aggregates.aggregates
+    return {
+        "as_of": str(aggregates.last_date),
+        "days": aggregates.n_days,
+        "price_changes": aggregates.changes(),
+        "top_categories": aggregates.top_categories(),
+        "categories": {
+            category: {"price_index": aggregates.price_index([category]), **aggregates.changes([category])}
+            for category in aggregates.categories
+        },
+        "chains": {store: aggregates.changes(stores=[store]) for store in aggregates.stores},
+    }
+
+
+def catalog_forecast(engine, horizon: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Price predictions for the whole catalog"""
+    return [p.model_dump(exclude_none=True) for p in engine.predict_all_price_trends(horizon)]
+
+
+TASKS: Dict[str, Callable[..., Any]] = {
+    "market_trends": market_trends,
+    "catalog_forecast": catalog_forecast,
+}
+
+
+def data_version(engine) -> str:
+    """Changes whenever the catalog, its prices or the history move on"""
+    catalog = engine.catalog
+    return f"{catalog.version}.{catalog.price_version}.{engine.price_history.n_days}"
+
+
+class Job:
+    __slots__ = ("id", "kind", "params", "key", "state", "submitted_at", "started_at",
+                 "finished_at", "result", "error", "_handle")
+
+    def __init__(self, kind: str, params: Dict[str, Any], key: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.key = key
+        self.state = QUEUED
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self._handle = None  # Celery AsyncResult
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (DONE, FAILED)
+
+    def status(self) -> Dict[str, Any]:
+        def iso(ts):
+            return datetime.fromtimestamp(ts).isoformat() if ts else None
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "state": self.state,
+            "submitted_at": iso(self.submitted_at),
+            "started_at": iso(self.started_at),
+            "finished_at": iso(self.finished_at),
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """Runs TASKS in the background and memoizes their results.
+
+    A submission whose (kind, params, data version) matches a queued,
+    running or finished job returns that job instead of starting another,
+    so repeated and scheduled submissions only compute when data changed.
+
+    backend="local" runs jobs on a thread pool next to the engine (NumPy
+    releases the GIL for the heavy parts); backend="celery" sends them to
+    Celery workers, each building its own engine, with results in the
+    Celery result backend.
+    """
+
+    def __init__(self, engine_factory: Callable[[], Any], backend: str = "local",
+                 workers: int = 2, max_jobs: int = MAX_JOBS, broker_url: Optional[str] = None):
+        if backend not in ("local", "celery"):
+            raise ValueError(f"Unknown job backend: {backend}")
+        self.engine_factory = engine_factory
+        self.backend = backend
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.broker_url = broker_url
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._by_key: Dict[str, str] = {}
+        self._latest: Dict[str, str] = {}  # kind -> id of the newest finished job
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._schedules: List[asyncio.Task] = []
+        self.memo_hits = 0
+
+    @classmethod
+    def from_environment(cls, engine_factory: Callable[[], Any]) -> "JobManager":
+        """SMARTSHOP_JOBS=local|celery, SMARTSHOP_JOB_WORKERS, SMARTSHOP_CELERY_BROKER"""
+        return cls(
+            engine_factory,
+            backend=os.getenv("SMARTSHOP_JOBS", "local"),
+            workers=int(os.getenv("SMARTSHOP_JOB_WORKERS", "2")),
+            broker_url=os.getenv("SMARTSHOP_CELERY_BROKER",
+                                 os.getenv("SMARTSHOP_REDIS_URL", "redis://localhost:6379/0"))
+        )
+
+    # Submission
+
+    def submit(self, kind: str, params: Optional[Dict[str, Any]] = None) -> Job:
+        """Start a job, or return the memoized one for the same kind, params and data.
+
+        Raises KeyError for an unknown kind and TypeError for params the task does not take.
+        """
+        if kind not in TASKS:
+            raise KeyError(kind)
+        params = params or {}
+        inspect.signature(TASKS[kind]).bind(None, **params)
+        key = canonical_key(kind, params, data_version(self.engine_factory()))
+        with self._lock:
+            existing = self._jobs.get(self._by_key.get(key, ""))
+            if existing is not None and existing.state != FAILED:
+                self.memo_hits += 1
+                return existing
+            job = Job(kind, params, key)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+            self._trim()
+
+        if self.backend == "celery":
+            job._handle = _celery_app(self.broker_url).send_task(RUN_TASK, args=(kind, params), task_id=job.id)
+        else:
+            self.pool.submit(self._run_local, job)
+        logger.info(f"Job {job.id} submitted: {kind} {params}")
+        return job
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        return self._pool
+
+    def _run_local(self, job: Job) -> None:
+        job.state, job.started_at = RUNNING, time.time()
+        try:
+            result = TASKS[job.kind](self.engine_factory(), **job.params)
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {str(e)}")
+            self._finish(job, FAILED, error=str(e))
+        else:
+            self._finish(job, DONE, result=result)
+
+    def _finish(self, job: Job, state: str, result: Any = None, error: Optional[str] = None) -> None:
+        job.result, job.error = result, error
+        job.finished_at = time.time()
+        job.state = state
+        if state == DONE:
+            with self._lock:
+                self._latest[job.kind] = job.id
+            logger.info(f"Job {job.id} ({job.kind}) done in {job.finished_at - job.started_at:.2f}s")
+
+    def _trim(self) -> None:
+        """Drop the oldest finished jobs beyond max_jobs (caller holds the lock)"""
+        if len(self._jobs) <= self.max_jobs:
+            return
+        keep = set(self._latest.values())
+        for job_id in list(self._jobs):
+            job = self._jobs[job_id]
+            if job.finished and job_id not in keep:
+                del self._jobs[job_id]
+                if self._by_key.get(job.key) == job_id:
+                    del self._by_key[job.key]
+                if len(self._jobs) <= self.max_jobs:
+                    break
+
+    # Status and results
+
+    def get(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is not None and job._handle is not None and not job.finished:
+            self._poll_celery(job)
+        return job
+
+    def _poll_celery(self, job: Job) -> None:
+        state = job._handle.state
+        if state == "STARTED" and job.started_at is None:
+            job.state, job.started_at = RUNNING, time.time()
+        elif state == "SUCCESS":
+            job.started_at = job.started_at or job.submitted_at
+            self._finish(job, DONE, result=job._handle.result)
+        elif state in ("FAILURE", "REVOKED"):
+            job.started_at = job.started_at or job.submitted_at
+            self._finish(job, FAILED, error=str(job._handle.result))
+
+    def jobs(self) -> List[Dict[str, Any]]:
+        return [self.get(job_id).status() for job_id in list(self._jobs)]
+
+    def latest_result(self, kind: str) -> Optional[Any]:
+        """Result of the newest finished job of a kind, even if the data has moved on since"""
+        job = self._jobs.get(self._latest.get(kind, ""))
+        return job.result if job is not None else None
+
+    async def updates(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Status on every state change until the job finishes"""
+        last = None
+        while True:
+            job = self.get(job_id)
+            if job.state != last:
+                last = job.state
+                yield job.status()
+            if job.finished:
+                return
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def wait(self, job_id: str) -> Job:
+        async for _ in self.updates(job_id):
+            pass
+        return self.get(job_id)
+
+    # Scheduling
+
+    def schedule(self, kind: str, interval: float, params: Optional[Dict[str, Any]] = None) -> None:
+        """Resubmit a job every `interval` seconds on the running event loop (memoization
+        makes refreshes free while the data is unchanged)"""
+        async def refresh():
+            while True:
+                try:
+                    self.submit(kind, params)
+                except Exception as e:
+                    logger.error(f"Scheduled {kind} job could not be submitted: {str(e)}")
+                await asyncio.sleep(interval)
+
+        self._schedules.append(asyncio.get_running_loop().create_task(refresh()))
+        logger.info(f"Scheduled {kind} job every {interval:.0f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        states: Dict[str, int] = {}
+        for job in list(self._jobs.values()):
+            states[job.state] = states.get(job.state, 0) + 1
+        return {
+            "backend": self.backend,
+            "workers": self.workers,
+            "jobs": states,
+            "memo_hits": self.memo_hits,
+            "scheduled": len(self._schedules),
+        }
+
+    def shutdown(self) -> None:
+        for task in self._schedules:
+            task.cancel()
+        self._schedules.clear()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# Celery backend: start workers with `celery -A jobs:celery_app worker`
+
+RUN_TASK = "smartshop.run_job"
+
+_celery = None
+_worker_engine = None
+
+
+def _celery_app(broker_url: str):
+    global _celery
+    if _celery is None:
+        from celery import Celery  # optional dependency, only needed for this backend
+
+        _celery = Celery("smartshop", broker=broker_url, backend=broker_url)
+        _celery.conf.update(task_track_started=True, result_expires=24 * 3600)
+        _celery.task(name=RUN_TASK)(_run_task)
+    return _celery
+
+
+def _run_task(kind: str, params: Dict[str, Any]) -> Any:
+    global _worker_engine
+    if _worker_engine is None:
+        from main import build_engine  # worker processes build their own engine
+
+        _worker_engine = build_engine()
+    return TASKS[kind](_worker_engine, **params)
+
+
+celery_app = (
+    _celery_app(os.getenv("SMARTSHOP_CELERY_BROKER", os.getenv("SMARTSHOP_REDIS_URL", "redis://localhost:6379/0")))
+    if os.getenv("SMARTSHOP_JOBS") == "celery" else None
+)
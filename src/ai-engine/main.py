@@ -4,27 +4,70 @@ SmartShop AI - AI Engine
 Comprehensive AI-powered shopping optimization system for Polish market
 """
 
-from fastapi import FastAPI, HTTPException
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
-import pandas as pd
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
+from typing import List, Dict, Optional, Any, Literal
 import numpy as np
-from datetime import datetime, timedelta
-import uvicorn
+from datetime import date, datetime, timedelta, timezone
 import logging
-from dataclasses import dataclass
+import os
+import asyncio
+import threading
 import json
 
+from catalog import ProductCatalog
+from records import ProductRecord
+from optimizer import solve_store_subset, solve_budget, STORE_VISIT_COST
+from predictor import predict_batch
+from forecasting import Forecaster, train_models, linear_path
+from price_history import PriceHistoryStore, META_FILE, MAX_APPEND_DAYS, offer_key
+from snapshot import snapshot_exists, load_snapshot, load_store_history, save_snapshot, STORE_HISTORY_DIR
+from datagen import generate_history, generate_store_history
+from storage import Storage, STORE_HISTORY_TABLE
+from cache import ResultCache, canonical_key
+from recommender import Recommender
+from best_price import BestPriceIndex, BestPriceTables
+from aggregates import MarketAggregateIndex, start_store_history
+from substitutes import SubstituteIndex, Substitutes, SWAP_PENALTY
+from search import SearchIndex, search_results
+from executor import EngineExecutor
+from jobs import JobManager, DONE, FAILED, data_version
+from coalescing import SingleFlight, IdBatcher
+from sharding import ShardSpec
+from serialization import dumps, ndjson_chunks, paginate
+from metrics import (REGISTRY, ENGINE_STAGE_SECONDS, BASKET_ITEMS, PREDICTION_PRODUCT_IDS,
+                     HTTP_REQUESTS, HTTP_LATENCY, PRICE_DELTAS, SamplingProfiler)
+
+# Startup-time breakdown reported by the health endpoint
+STARTUP_TIMINGS: Dict[str, Any] = {
+    "imports_ms": round((time.perf_counter() - _import_started) * 1000, 1)
+}
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with serialization.dumps (orjson when installed).
+
+    Routes return it directly for large payloads, which also skips FastAPI's
+    jsonable_encoder pass over the response.
+    """
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
 # FastAPI app initialization
 app = FastAPI(
     title="SmartShop AI Engine",
     description="AI-powered shopping optimization for Polish grocery market",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # CORS middleware
@@ -36,6 +79,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Count and time every request, labelled by route template to bound cardinality"""
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    HTTP_REQUESTS.inc(method=request.method, route=path, status=str(response.status_code))
+    HTTP_LATENCY.observe(time.perf_counter() - started, route=path)
+    return response
+
 # Data Models
 class Product(BaseModel):
     id: str
@@ -47,14 +101,26 @@ class Product(BaseModel):
     availability: int
 
 class ShoppingItem(BaseModel):
-    product_id: str
+    product_id: Optional[str] = None
     quantity: int
     max_price: Optional[float] = None
+    name: Optional[str] = None  # free text ("mleko laciate 1l"), resolved via search when product_id is missing
+    
+    @model_validator(mode="after")
+    def _has_product(self) -> "ShoppingItem":
+        if not self.product_id and not self.name:
+            raise ValueError("product_id or name is required")
+        return self
 
 class ShoppingList(BaseModel):
     items: List[ShoppingItem]
     budget: Optional[float] = None
     preferred_stores: Optional[List[str]] = None
+    # "greedy": cheapest store per item; "multi_store": best store subset incl. trip cost;
+    # "budget": greedy, then same-category substitutes until the basket fits the budget
+    optimization_mode: Literal["greedy", "multi_store", "budget"] = "greedy"
+    store_visit_cost: Optional[float] = Field(None, ge=0)
+    max_stores: Optional[int] = Field(None, ge=1)
 
 class OptimizationResult(BaseModel):
     optimized_list: List[Dict[str, Any]]
@@ -62,6 +128,8 @@ class OptimizationResult(BaseModel):
     savings: float
     store_distribution: Dict[str, int]
     recommendations: List[str]
+    selected_stores: Optional[List[str]] = None
+    trip_cost: Optional[float] = None
 
 class PricePrediction(BaseModel):
     product_id: str
@@ -69,6 +137,26 @@ class PricePrediction(BaseModel):
     confidence: float
     trend: str  # "rising", "falling", "stable"
     best_buy_time: str
+    forecast: Optional[List[float]] = None  # daily prices over the requested horizon
+
+# How far a delta's timestamp may run ahead of this server's clock
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+class PriceDelta(BaseModel):
+    product_id: str
+    store: str
+    price: float
+    discount: float = 0.0
+    timestamp: Optional[datetime] = None  # defaults to time of ingestion
+    removed: bool = False  # the store no longer offers the product (out of stock or closed)
+    
+    @field_validator("timestamp")
+    @classmethod
+    def _not_in_future(cls, timestamp: Optional[datetime]) -> Optional[datetime]:
+        now = datetime.now(timezone.utc) if timestamp and timestamp.tzinfo else datetime.now()
+        if timestamp and timestamp > now + MAX_CLOCK_SKEW:
+            raise ValueError(f"timestamp {timestamp.isoformat()} is in the future")
+        return timestamp
 
 # Mock data for demonstration
 MOCK_PRODUCTS = [
@@ -116,33 +204,127 @@ MOCK_PRODUCTS = [
 class SmartShopAI:
     """AI Engine for SmartShop optimization algorithms"""
     
-    def __init__(self):
-        self.products_db = MOCK_PRODUCTS
-        self.price_history = self._generate_mock_price_history()
-        
-    def _generate_mock_price_history(self):
-        """Generate mock price history for ML training"""
-        history = {}
-        for product in self.products_db:
-            dates = pd.date_range(
-                start=datetime.now() - timedelta(days=90),
-                end=datetime.now(),
-                freq='D'
-            )
-            
-            base_price = min([p["price"] for p in product["prices"]])
-            
-            # Generate realistic price fluctuations
-            np.random.seed(hash(product["id"]) % 2**32)
-            price_changes = np.random.normal(0, 0.05, len(dates))
-            prices = base_price * (1 + np.cumsum(price_changes))
-            
-            history[product["id"]] = {
-                "dates": [d.isoformat() for d in dates],
-                "prices": prices.tolist()
-            }
-            
-        return history
+    def __init__(self, products: Optional[List[Dict[str, Any]]] = None, history_path: Optional[str] = None,
+                 catalog: Optional[ProductCatalog] = None, price_history: Optional[PriceHistoryStore] = None,
+                 store_history: Optional[PriceHistoryStore] = None):
+        started = time.perf_counter()
+        if catalog is None:
+            catalog = ProductCatalog(products if products is not None else MOCK_PRODUCTS)
+        self.catalog = catalog
+        self.recommender = Recommender(catalog)
+        self.best_prices = BestPriceIndex(catalog)
+        self.substitutes = SubstituteIndex(catalog)
+        self.search = SearchIndex(catalog)
+        self._ingest_lock = threading.Lock()
+        # Backend database the catalog came from (storage.py), if any
+        self.storage: Optional[Storage] = None
+        # Trained models (forecasting.py); None falls back to trend extrapolation
+        self.forecaster: Optional[Forecaster] = None
+        self.training_status: Dict[str, Any] = {"state": "idle"}
+        self._training_lock = threading.Lock()
+        catalog_ready = time.perf_counter()
+        self.price_history = price_history if price_history is not None else self._load_price_history(history_path)
+        if store_history is None:
+            # Generated along with generated history; otherwise recorded from the current offers on
+            store_history = (self._load_store_history(history_path) if price_history is None
+                             else start_store_history(catalog.snapshot, self.price_history.last_date))
+        # Per-store daily prices, one row per offer (price_history.offer_key)
+        self.store_history = store_history
+        # Category × store × day price aggregates behind /analytics
+        self.market_aggregates = MarketAggregateIndex(catalog, self.price_history, self.store_history)
+        self.startup_timings = {
+            "catalog_ms": round((catalog_ready - started) * 1000, 1),
+            "price_history_ms": round((time.perf_counter() - catalog_ready) * 1000, 1)
+        }
+    
+    @classmethod
+    def from_snapshot(cls, path: str) -> "SmartShopAI":
+        """Build the engine from a prebuilt snapshot instead of recomputing its state"""
+        started = time.perf_counter()
+        catalog, history = load_snapshot(path)
+        engine = cls(catalog=ProductCatalog.from_snapshot(catalog), price_history=history,
+                     store_history=load_store_history(path))
+        engine.startup_timings = {
+            "snapshot_load_ms": round((time.perf_counter() - started) * 1000, 1),
+            "source": "snapshot"
+        }
+        return engine
+    
+    @classmethod
+    def from_storage(cls, storage: Storage, shard: Optional[ShardSpec] = None) -> "SmartShopAI":
+        """
+        Build the engine from the backend database
+        The catalog is streamed in and can be reloaded from the database;
+        price history and per-store price history come from the engine's
+        history tables (seeded with today's offers when empty) and recorded
+        prices are written back.
+        """
+        started = time.perf_counter()
+        storage.ensure_schema()
+        loader = storage.load_catalog if shard is None else lambda: shard.filter(storage.load_catalog())
+        catalog = ProductCatalog(loader=loader)
+        catalog_ready = time.perf_counter()
+        
+        snapshot = catalog.snapshot
+        product_ids = [product.id for product in snapshot.products]
+        lowest = np.full(len(snapshot), np.nan)
+        sold = ~np.isnan(snapshot.prices).all(axis=1)
+        lowest[sold] = np.nanmin(snapshot.prices[sold], axis=1)
+        history = storage.load_history(product_ids, lowest)
+        if history is None:
+            today = date.today()
+            history = PriceHistoryStore.from_matrix(product_ids, today, lowest[:, None])
+            storage.save_prices(today, [pid for pid, ok in zip(product_ids, sold) if ok], lowest[sold])
+        history.add_listener(storage.history_writer(history))
+        
+        offers = start_store_history(snapshot, date.today())
+        store_history = storage.load_history(offers.product_ids, offers.prices[:, 0], STORE_HISTORY_TABLE)
+        if store_history is None:
+            store_history = offers
+            storage.save_prices(date.today(), offers.product_ids, offers.prices[:, 0], STORE_HISTORY_TABLE)
+        store_history.add_listener(storage.history_writer(store_history, STORE_HISTORY_TABLE))
+        
+        engine = cls(catalog=catalog, price_history=history, store_history=store_history)
+        engine.storage = storage
+        engine.startup_timings = {
+            "catalog_ms": round((catalog_ready - started) * 1000, 1),
+            "price_history_ms": round((time.perf_counter() - catalog_ready) * 1000, 1),
+            "source": "database"
+        }
+        return engine
+    
+    def refresh_from_storage(self) -> Dict[str, int]:
+        """Apply offers scraped into the database since the last refresh"""
+        deltas = []
+        for delta in self.storage.changed_offers():
+            try:
+                deltas.append(PriceDelta(**delta))
+            except ValidationError as e:
+                logger.warning(f"Skipping offer {delta['product_id']}@{delta['store']}: {e.errors()[0]['msg']}")
+        if not deltas:
+            return {"products_updated": 0, "history_points": 0, "rejected": 0}
+        result = self.ingest_price_deltas(deltas)
+        logger.info(f"Database refresh: {len(deltas)} offers, {result['products_updated']} products updated")
+        return result
+        
+    def _load_price_history(self, path: Optional[str]) -> PriceHistoryStore:
+        """Map persisted price history if present, otherwise generate (and persist) it"""
+        if path and os.path.exists(os.path.join(path, META_FILE)):
+            return PriceHistoryStore.open(path)
+        history = self._generate_mock_price_history()
+        return history.save(path) if path else history
+    
+    def _load_store_history(self, path: Optional[str]) -> PriceHistoryStore:
+        """Map persisted per-store price history if present, otherwise generate (and persist) it"""
+        path = os.path.join(path, STORE_HISTORY_DIR) if path else None
+        if path and os.path.exists(os.path.join(path, META_FILE)):
+            return PriceHistoryStore.open(path)
+        history = generate_store_history(self.catalog.products, n_days=91, volatility=0.05)
+        return history.save(path) if path else history
+    
+    def _generate_mock_price_history(self) -> PriceHistoryStore:
+        """Generate mock price history for ML training (identical across workers and restarts)"""
+        return generate_history(self.catalog.products, n_days=91, volatility=0.05)
     
     def optimize_shopping_basket(self, shopping_list: ShoppingList) -> OptimizationResult:
         """
@@ -150,86 +332,333 @@ class SmartShopAI:
         Finds best store combinations for maximum savings
         """
         try:
-            optimized_items = []
-            total_cost = 0.0
-            store_counts = {"LIDL": 0, "Biedronka": 0, "Auchan": 0}
-            
-            for item in shopping_list.items:
-                # Find product in database
-                product = next(
-                    (p for p in self.products_db if p["id"] == item.product_id), 
-                    None
-                )
-                
-                if not product:
-                    continue
-                
-                # Find best price considering discounts and availability
-                best_option = self._find_best_price_option(
-                    product, 
-                    item.max_price,
-                    shopping_list.preferred_stores
-                )
-                
-                if best_option:
-                    item_cost = best_option["price"] * item.quantity
-                    total_cost += item_cost
-                    store_counts[best_option["store"]] += item.quantity
-                    
-                    optimized_items.append({
-                        "product_id": item.product_id,
-                        "product_name": product["name"],
-                        "quantity": item.quantity,
-                        "store": best_option["store"],
-                        "unit_price": best_option["price"],
-                        "total_price": item_cost,
-                        "discount": best_option.get("discount", 0),
-                        "savings": best_option.get("discount", 0) * item.quantity
-                    })
-            
-            # Calculate total savings
-            total_savings = sum(item["savings"] for item in optimized_items)
+            catalog = self.catalog.snapshot
+            plan = None
+            BASKET_ITEMS.observe(len(shopping_list.items))
+            shopping_list = self._resolve_item_names(shopping_list)
             
-            # Generate AI recommendations
-            recommendations = self._generate_recommendations(
-                optimized_items, 
-                store_counts, 
-                total_cost,
-                shopping_list.budget
-            )
+            if shopping_list.optimization_mode == "multi_store":
+                picks, plan = self._plan_multi_store(catalog, shopping_list)
+            elif shopping_list.optimization_mode == "budget":
+                picks = self._plan_budget(catalog, shopping_list)
+            else:
+                picks = self._plan_per_item(catalog, shopping_list)
             
-            return OptimizationResult(
-                optimized_list=optimized_items,
-                total_cost=round(total_cost, 2),
-                savings=round(total_savings, 2),
-                store_distribution=store_counts,
-                recommendations=recommendations
-            )
+            return self._build_optimization_result(catalog, shopping_list, picks, plan)
             
         except Exception as e:
             logger.error(f"Optimization error: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Optimization failed: {str(e)}")
     
-    def _find_best_price_option(self, product: Dict, max_price: Optional[float], preferred_stores: Optional[List[str]]):
-        """Find the best price option for a product"""
-        options = product["prices"].copy()
+    def optimize_shopping_baskets(self, shopping_lists: List[ShoppingList]) -> List[tuple]:
+        """
+        Batch variant of optimize_shopping_basket for many baskets
+        Greedy picks for every basket are made in one vectorized pass over a
+        single catalog snapshot. Returns (result, None) or (None, error) per
+        basket, so one failing basket does not fail the others.
+        """
+        catalog = self.catalog.snapshot
+        resolved = []
+        for shopping_list in shopping_lists:
+            BASKET_ITEMS.observe(len(shopping_list.items))
+            try:
+                resolved.append(self._resolve_item_names(shopping_list))
+            except Exception as e:
+                resolved.append(e)
+        greedy_lists = [sl for sl in resolved if isinstance(sl, ShoppingList) and sl.optimization_mode == "greedy"]
+        try:
+            greedy_picks = dict(zip(map(id, greedy_lists), self._plan_per_item_batch(catalog, greedy_lists)))
+        except Exception as e:
+            logger.error(f"Batch greedy planning failed, planning baskets one by one: {str(e)}")
+            greedy_picks = {}
+        
+        results = []
+        for shopping_list in resolved:
+            try:
+                if isinstance(shopping_list, Exception):
+                    raise shopping_list
+                plan = None
+                if shopping_list.optimization_mode == "multi_store":
+                    picks, plan = self._plan_multi_store(catalog, shopping_list)
+                elif shopping_list.optimization_mode == "budget":
+                    picks = self._plan_budget(catalog, shopping_list)
+                elif id(shopping_list) in greedy_picks:
+                    picks = greedy_picks[id(shopping_list)]
+                else:
+                    picks = self._plan_per_item(catalog, shopping_list)
+                results.append((self._build_optimization_result(catalog, shopping_list, picks, plan), None))
+            except Exception as e:
+                logger.error(f"Optimization error: {str(e)}")
+                results.append((None, f"Optimization failed: {str(e)}"))
+        return results
+    
+    def _resolve_item_names(self, shopping_list: ShoppingList) -> ShoppingList:
+        """Fill in product_id for items given only by name (unmatched names are skipped like unknown ids)"""
+        if all(item.product_id for item in shopping_list.items):
+            return shopping_list
+        
+        items = []
+        for item in shopping_list.items:
+            if not item.product_id:
+                with ENGINE_STAGE_SECONDS.time(stage="name_resolution"):
+                    product_id = self.search.resolve(item.name)
+                if product_id is None:
+                    logger.info(f"No product matches basket item '{item.name}'")
+                else:
+                    item = item.model_copy(update={"product_id": product_id})
+            items.append(item)
+        return shopping_list.model_copy(update={"items": items})
+    
+    def _build_optimization_result(self, catalog, shopping_list: ShoppingList,
+                                   picks: List[tuple], plan=None) -> OptimizationResult:
+        """Turn (item, product, option) picks into the API result"""
+        optimized_items = []
+        total_cost = 0.0
+        store_counts = {store: 0 for store in catalog.stores}
+        
+        for item, product, best_option in picks:
+            if best_option:
+                item_cost = best_option.price * item.quantity
+                total_cost += item_cost
+                store = best_option.store
+                store_counts[store] += item.quantity
+                
+                line = {
+                    "product_id": product.id,
+                    "product_name": product.name,
+                    "quantity": item.quantity,
+                    "store": store,
+                    "unit_price": best_option.price,
+                    "total_price": item_cost,
+                    "discount": best_option.discount,
+                    "savings": best_option.discount * item.quantity
+                }
+                if product.id != item.product_id:
+                    line["substitute_for"] = item.product_id
+                optimized_items.append(line)
         
-        # Filter by max price if specified
-        if max_price:
-            options = [opt for opt in options if opt["price"] <= max_price]
+        # Calculate total savings
+        total_savings = sum(item["savings"] for item in optimized_items)
         
-        # Prefer specified stores
-        if preferred_stores:
-            preferred_options = [opt for opt in options if opt["store"] in preferred_stores]
-            if preferred_options:
-                options = preferred_options
+        # Generate AI recommendations
+        recommendations = self._generate_recommendations(
+            optimized_items, 
+            store_counts, 
+            total_cost,
+            shopping_list.budget
+        )
         
-        # Sort by effective price (price - discount)
-        options.sort(key=lambda x: x["price"] - x.get("discount", 0))
+        for line in optimized_items:
+            if "substitute_for" in line:
+                original = catalog.get(line["substitute_for"])
+                recommendations.append(
+                    f"🔄 {original.name} yerine {line['product_name']} "
+                    f"({line['store']}, {line['unit_price']:.2f} PLN) - bütçeye uygun alternatif"
+                )
+        
+        selected_stores = None
+        trip_cost = None
+        if plan is not None:
+            selected_stores = [catalog.stores[col] for col in plan.stores]
+            trip_cost = round(plan.visit_cost, 2)
+            recommendations.append(
+                f"🛒 En uygun plan: {' + '.join(selected_stores)} "
+                f"({len(selected_stores)} mağaza, ziyaret maliyeti {trip_cost:.2f} PLN)"
+            )
         
-        return options[0] if options else None
+        return OptimizationResult(
+            optimized_list=optimized_items,
+            total_cost=round(total_cost, 2),
+            savings=round(total_savings, 2),
+            store_distribution=store_counts,
+            recommendations=recommendations,
+            selected_stores=selected_stores,
+            trip_cost=trip_cost
+        )
+
+    def _plan_per_item(self, catalog, shopping_list: ShoppingList) -> List[tuple]:
+        """Pick the cheapest acceptable store for every item independently"""
+        tables = self.best_prices.tables
+        if tables.catalog is not catalog:
+            tables = BestPriceTables(catalog)  # catalog swapped mid-request; tables are lazy
+        store_bits = tables.store_bits(shopping_list.preferred_stores)
+        
+        picks = []
+        lookup_seconds = 0.0
+        option_seconds = 0.0
+        for item in shopping_list.items:
+            # Find product in catalog (hash index lookup)
+            started = time.perf_counter()
+            row = catalog.row_of(item.product_id)
+            looked_up = time.perf_counter()
+            lookup_seconds += looked_up - started
+            
+            if row < 0:
+                continue
+            
+            # Best price considering discounts, max_price and preferred stores
+            best_option = tables.best_option(row, item.max_price, store_bits)
+            option_seconds += time.perf_counter() - looked_up
+            picks.append((item, catalog.products[row], best_option))
+        # One observation per basket keeps the timers off the per-item path
+        ENGINE_STAGE_SECONDS.observe(lookup_seconds, stage="catalog_lookup")
+        ENGINE_STAGE_SECONDS.observe(option_seconds, stage="best_option")
+        return picks
     
-    def _generate_recommendations(self, items: List[Dict], store_counts: Dict, total_cost: float, budget: Optional[float]) -> List[str]:
+    def _plan_budget(self, catalog, shopping_list: ShoppingList) -> List[tuple]:
+        """
+        Greedy picks, then swap items for same-category substitutes until the
+        basket fits the budget with the least rating loss (quantity-weighted)
+        """
+        picks = self._plan_per_item(catalog, shopping_list)
+        budget = shopping_list.budget
+        total = sum(option.price * item.quantity for item, _, option in picks if option)
+        if not budget or total <= budget:
+            return picks
+        
+        with ENGINE_STAGE_SECONDS.time(stage="substitution"):
+            options, costs, losses = self._substitute_options(catalog, shopping_list, picks)
+            plan = solve_budget(costs, losses, budget)
+        
+        return [
+            (item, *item_options[choice])
+            for (item, _, _), item_options, choice in zip(picks, options, plan.choices)
+        ]
+    
+    def _substitute_options(self, catalog, shopping_list: ShoppingList, picks: List[tuple]):
+        """
+        (product, offer) options per greedy pick with their line costs and
+        quantity-weighted rating losses; option 0 of every item is its greedy pick
+        """
+        substitutes = self.substitutes.substitutes
+        if substitutes.catalog is not catalog:
+            substitutes = Substitutes(catalog)  # catalog swapped mid-request
+        tables = self.best_prices.tables
+        if tables.catalog is not catalog:
+            tables = BestPriceTables(catalog)
+        store_bits = tables.store_bits(shopping_list.preferred_stores)
+        
+        options, costs, losses = [], [], []
+        for item, product, option in picks:
+            item_options = [(product, option)]
+            if option:
+                for row in substitutes.of(catalog.row_of(product.id)):
+                    sub_option = tables.best_option(row, item.max_price, store_bits)
+                    if sub_option and sub_option.price < option.price:
+                        item_options.append((catalog.products[row], sub_option))
+            options.append(item_options)
+            costs.append(np.array([o.price * item.quantity if o else 0.0 for _, o in item_options]))
+            losses.append(np.array([max(0.0, product.rating - p.rating) * item.quantity
+                                    + (SWAP_PENALTY if p is not product else 0.0)
+                                    for p, _ in item_options]))
+        return options, costs, losses
+    
+    def basket_options(self, shopping_list: ShoppingList) -> Dict[str, Any]:
+        """
+        Candidate offers for the basket items this node holds, so a shard
+        router can run the store-subset search or the budget knapsack once
+        over the whole basket (see router.py)
+        multi_store: every acceptable offer of an item with its line cost;
+        budget: the greedy pick (option 0) and its cheaper substitutes with
+        line costs and rating losses. `index` is the item's position in the
+        request; items this node does not hold are left out.
+        """
+        catalog = self.catalog.snapshot
+        held = [(i, item) for i, item in enumerate(shopping_list.items)
+                if item.product_id and catalog.get(item.product_id)]
+        items = [item for _, item in held]
+        rows = catalog.rows_of(item.product_id for item in items)
+        answers = []
+        
+        if shopping_list.optimization_mode == "multi_store":
+            preferred = np.broadcast_to(catalog.store_mask(shopping_list.preferred_stores),
+                                        (len(items), len(catalog.stores)))
+            allowed = self._allowed_options(catalog, rows, items, preferred)
+            for (i, item), row, mask in zip(held, rows, allowed):
+                offers = []
+                for col in np.flatnonzero(mask):
+                    offer = catalog.offer_at(row, col)
+                    offers.append({**offer.to_dict(), "cost": float(catalog.effective_prices[row, col]) * item.quantity})
+                answers.append({"index": i, "product_id": catalog.products[row].id,
+                                "product_name": catalog.products[row].name, "offers": offers})
+        else:
+            picks = self._plan_per_item(catalog, shopping_list.model_copy(update={"items": items}))
+            with ENGINE_STAGE_SECONDS.time(stage="substitution"):
+                options, costs, losses = self._substitute_options(catalog, shopping_list, picks)
+            for (i, _), item_options, item_costs, item_losses in zip(held, options, costs, losses):
+                answers.append({"index": i, "options": [
+                    {"product_id": product.id, "product_name": product.name,
+                     "offer": offer.to_dict() if offer else None, "cost": float(cost), "loss": float(loss)}
+                    for (product, offer), cost, loss in zip(item_options, item_costs, item_losses)
+                ]})
+        return {"stores": catalog.stores, "items": answers}
+    
+    def _plan_per_item_batch(self, catalog, shopping_lists: List[ShoppingList]) -> List[List[tuple]]:
+        """Vectorized _plan_per_item over all items of many baskets at once"""
+        items = [item for sl in shopping_lists for item in sl.items]
+        if not items:
+            return [[] for _ in shopping_lists]
+        owners = np.repeat(np.arange(len(shopping_lists)), [len(sl.items) for sl in shopping_lists])
+        with ENGINE_STAGE_SECONDS.time(stage="catalog_lookup"):
+            rows = catalog.rows_of(item.product_id for item in items)
+        known = rows >= 0
+        rows = np.where(known, rows, 0)
+        
+        with ENGINE_STAGE_SECONDS.time(stage="best_option"):
+            preferred = np.array([catalog.store_mask(sl.preferred_stores) for sl in shopping_lists])
+            allowed = self._allowed_options(catalog, rows, items, preferred[owners])
+            allowed &= known[:, None]
+            
+            # Cheapest effective price per item, ties broken by offer order
+            effective = np.where(allowed, catalog.effective_prices[rows], np.inf)
+            best = np.lexsort((catalog.offer_order[rows], effective))[:, 0]
+            found = allowed[np.arange(len(items)), best]
+        
+        picks = [[] for _ in shopping_lists]
+        for owner, item, row, col, ok, is_known in zip(owners, items, rows, best, found, known):
+            if not is_known:
+                continue
+            option = catalog.offer_at(row, col) if ok else None
+            picks[owner].append((item, catalog.products[row], option))
+        return picks
+    
+    def _allowed_options(self, catalog, rows: np.ndarray, items: List[ShoppingItem],
+                         preferred: np.ndarray) -> np.ndarray:
+        """items × stores mask of acceptable offers (sold, within max_price, preferred store first)"""
+        raw = catalog.prices[rows]
+        allowed = ~np.isnan(raw)
+        max_prices = np.array([item.max_price or np.inf for item in items], dtype=float)
+        allowed &= ~(raw > max_prices[:, None])
+        
+        # Preferred stores win for every item that can be bought there
+        has_preferred = (allowed & preferred).any(axis=1)
+        allowed[has_preferred] &= preferred[has_preferred]
+        return allowed
+    
+    def _plan_multi_store(self, catalog, shopping_list: ShoppingList):
+        """Pick one store subset for the whole basket, trading prices against trip cost"""
+        items = [item for item in shopping_list.items if catalog.get(item.product_id)]
+        rows = catalog.rows_of(item.product_id for item in items)
+        quantities = np.array([item.quantity for item in items], dtype=float)
+        
+        # items × stores line-cost matrix, inf where an option is not allowed
+        preferred = np.broadcast_to(catalog.store_mask(shopping_list.preferred_stores),
+                                    (len(items), len(catalog.stores)))
+        allowed = self._allowed_options(catalog, rows, items, preferred)
+        costs = np.where(allowed, catalog.effective_prices[rows] * quantities[:, None], np.inf)
+        visit_cost = (shopping_list.store_visit_cost
+                      if shopping_list.store_visit_cost is not None else STORE_VISIT_COST)
+        with ENGINE_STAGE_SECONDS.time(stage="store_subset"):
+            plan = solve_store_subset(costs, visit_cost, shopping_list.max_stores)
+        
+        picks = []
+        for item, row, col in zip(items, rows, plan.assignment):
+            option = catalog.offer_at(row, col) if col >= 0 else None
+            picks.append((item, catalog.products[row], option))
+        return picks, plan
+    
+    @staticmethod
+    def _generate_recommendations(items: List[Dict], store_counts: Dict, total_cost: float, budget: Optional[float]) -> List[str]:
         """Generate AI-powered shopping recommendations"""
         recommendations = []
         
@@ -242,7 +671,7 @@ class SmartShopAI:
             recommendations.append(f"💰 Bütçe içinde: {remaining:.2f} PLN tasarruf!")
         
         # Store optimization
-        dominant_store = max(store_counts.items(), key=lambda x: x[1])
+        dominant_store = max(store_counts.items(), key=lambda x: x[1], default=(None, 0))
         if dominant_store[1] > sum(store_counts.values()) * 0.7:
             recommendations.append(f"🎯 {dominant_store[0]} mağazasında toplu alışveriş önerisi - nakliye tasarrufu!")
         
@@ -260,130 +689,216 @@ class SmartShopAI:
         
         return recommendations
     
-    def predict_price_trends(self, product_ids: List[str]) -> List[PricePrediction]:
-        """Predict future price trends using historical data"""
-        predictions = []
+    def ingest_price_deltas(self, deltas: List[PriceDelta]) -> Dict[str, int]:
+        """
+        Apply a batch of per-store price deltas in place
+        Only the touched catalog rows are rewritten; catalog listeners then
+        refresh the derived data of those rows (recommendation features,
+        cached results). Each product's lowest offer is recorded in price
+        history on the day of its latest delta (products left without offers
+        record nothing), and each offer's price in the per-store history on
+        the day of its own latest delta (NaN once removed). Deltas dated
+        before the first history day, or more than MAX_APPEND_DAYS after the
+        last one, are rejected before anything is applied.
+        """
+        now = datetime.now()
+        first_day = self.price_history.start.astype(date)
+        last_day = (self.price_history.last_date + MAX_APPEND_DAYS).astype(date)
+        accepted = [delta for delta in deltas if first_day <= (delta.timestamp or now).date() <= last_day]
+        rejected = len(deltas) - len(accepted)
+        if rejected:
+            logger.warning(f"Rejected {rejected} price deltas dated outside {first_day} - {last_day}")
+        deltas = accepted
         
-        for product_id in product_ids:
-            try:
-                # Get historical data
-                history = self.price_history.get(product_id)
-                if not history:
+        with self._ingest_lock:
+            changed = set(self.catalog.merge_offers(delta.model_dump() for delta in deltas))
+            
+            latest_day = {}
+            for delta in deltas:
+                if delta.product_id in changed:
+                    day = (delta.timestamp or now).date()
+                    latest_day[delta.product_id] = max(day, latest_day.get(delta.product_id, day))
+            by_day = {}
+            for product_id, day in latest_day.items():
+                by_day.setdefault(day, []).append(product_id)
+            
+            catalog = self.catalog.snapshot
+            recorded = 0
+            for day in sorted(by_day):
+                prices = catalog.prices[catalog.rows_of(by_day[day])]
+                lowest = np.where(np.isnan(prices), np.inf, prices).min(axis=1, initial=np.inf)
+                sold = np.isfinite(lowest)
+                product_ids = [pid for pid, keep in zip(by_day[day], sold) if keep]
+                recorded += self.price_history.record_prices(product_ids, day, lowest[sold])
+            
+            # Per-store history starts where the engine began recording offers
+            first_store_day = self.store_history.start.astype(date)
+            last_store_day = (self.store_history.last_date + MAX_APPEND_DAYS).astype(date)
+            latest_offer = {}
+            for delta in deltas:
+                day = (delta.timestamp or now).date()
+                if delta.product_id not in changed or not first_store_day <= day <= last_store_day:
                     continue
-                
-                prices = np.array(history["prices"])
-                
-                # Simple trend analysis
-                recent_prices = prices[-7:]  # Last 7 days
-                older_prices = prices[-14:-7]  # Previous 7 days
-                
-                recent_avg = np.mean(recent_prices)
-                older_avg = np.mean(older_prices)
-                
-                # Calculate trend
-                trend_change = (recent_avg - older_avg) / older_avg
-                
-                if trend_change > 0.05:
-                    trend = "rising"
-                    best_buy_time = "Şimdi satın alın - fiyat artışı bekleniyor"
-                elif trend_change < -0.05:
-                    trend = "falling" 
-                    best_buy_time = "Birkaç gün bekleyin - fiyat düşüşü devam edebilir"
-                else:
-                    trend = "stable"
-                    best_buy_time = "Stabil fiyat - istediğiniz zaman alabilirsiniz"
-                
-                # Predict next price (simple linear extrapolation)
-                if len(prices) >= 5:
-                    x = np.arange(len(prices[-5:]))
-                    y = prices[-5:]
-                    slope = np.polyfit(x, y, 1)[0]
-                    predicted_price = prices[-1] + slope
-                else:
-                    predicted_price = prices[-1]
-                
-                # Confidence based on price volatility
-                volatility = np.std(recent_prices) / np.mean(recent_prices)
-                confidence = max(0.3, 1.0 - volatility * 10)
-                
-                predictions.append(PricePrediction(
-                    product_id=product_id,
-                    predicted_price=round(float(predicted_price), 2),
-                    confidence=round(confidence, 2),
-                    trend=trend,
-                    best_buy_time=best_buy_time
-                ))
-                
+                key = offer_key(delta.product_id, delta.store)
+                if day >= latest_offer.get(key, (day,))[0]:
+                    latest_offer[key] = (day, np.nan if delta.removed else delta.price)
+            offers_by_day = {}
+            for key, (day, price) in latest_offer.items():
+                offers_by_day.setdefault(day, {})[key] = price
+            for day in sorted(offers_by_day):
+                prices = offers_by_day[day]
+                self.store_history.record_prices(list(prices), day, np.array(list(prices.values())))
+        
+        return {"products_updated": len(changed), "history_points": recorded, "rejected": rejected}
+    
+    def load_forecaster(self, path: str) -> Optional[Forecaster]:
+        """Load the active model version from `path` (keeps the current models when there is none)"""
+        forecaster = Forecaster.load(path)
+        if forecaster is not None:
+            self.forecaster = forecaster
+        return forecaster
+    
+    def train_forecaster_in_background(self, path: str, force: bool = False) -> Optional[threading.Thread]:
+        """
+        Train (or incrementally refresh) the forecasting models from the current
+        price history in worker processes, then swap in the new version
+        Returns None when a training run is already in progress.
+        """
+        with self._training_lock:
+            if self.training_status["state"] == "running":
+                return None
+            self.training_status = {"state": "running", "started_at": datetime.now().isoformat()}
+        
+        def run():
+            try:
+                os.makedirs(path, exist_ok=True)
+                categories = {product.id: product.category for product in self.catalog.products}
+                manifest = train_models(self.price_history, categories, path, force=force)
+                self.load_forecaster(path)
+                self.training_status = {
+                    "state": "done",
+                    "finished_at": datetime.now().isoformat(),
+                    "version": manifest["version"] if manifest else None,
+                    "retrained": manifest.get("retrained", []) if manifest else []
+                }
             except Exception as e:
-                logger.error(f"Price prediction error for {product_id}: {str(e)}")
-                continue
+                logger.error(f"Forecast training failed: {str(e)}")
+                self.training_status = {"state": "failed", "error": str(e)}
+        
+        thread = threading.Thread(target=run, name="forecast-training", daemon=True)
+        thread.start()
+        return thread
+    
+    def predict_price_trends(self, product_ids: List[str], horizon: Optional[int] = None) -> List[PricePrediction]:
+        """
+        Predict future price trends using historical data
+        With trained models the forecast comes from them, and the trend
+        compares the mean forecast with the last week's mean; without them it
+        compares the last week with the week before. With a `horizon` each
+        prediction also carries the daily price path up to that day. Products
+        without any recorded price are left out.
+        """
+        history = self.price_history
+        PREDICTION_PRODUCT_IDS.observe(len(product_ids))
+        rows = history.rows_of(product_ids)
+        known = rows >= 0
+        # Rows of products never sold are all NaN: nothing to forecast from
+        known[known] = np.isfinite(history.prices[rows[known]]).any(axis=1)
+        product_ids = [pid for pid, ok in zip(product_ids, known) if ok]
+        if not product_ids:
+            return []
+        
+        # One vectorized pass over the requested rows of the history matrix
+        days = horizon or 1
+        with ENGINE_STAGE_SECONDS.time(stage="trend_computation"):
+            prices = history.prices[rows[known]]
+            forecaster = self.forecaster
+            if forecaster is not None:
+                catalog = self.catalog.snapshot
+                products = [catalog.get(pid) for pid in product_ids]
+                categories = [product.category if product else None for product in products]
+                last_day = int(history.last_date.astype(np.int64))
+                batch, path = forecaster.forecast(prices, categories, last_day, days)
+            else:
+                batch = predict_batch(prices, days)
+                path = linear_path(prices, batch.predicted_price, days) if horizon else None
+        rising, falling = batch.rising, batch.falling
+        
+        predictions = []
+        for i, product_id in enumerate(product_ids):
+            if rising[i]:
+                trend = "rising"
+                best_buy_time = "Şimdi satın alın - fiyat artışı bekleniyor"
+            elif falling[i]:
+                trend = "falling" 
+                best_buy_time = "Birkaç gün bekleyin - fiyat düşüşü devam edebilir"
+            else:
+                trend = "stable"
+                best_buy_time = "Stabil fiyat - istediğiniz zaman alabilirsiniz"
+            
+            predictions.append(PricePrediction(
+                product_id=product_id,
+                predicted_price=round(float(batch.predicted_price[i]), 2),
+                confidence=round(float(batch.confidence[i]), 2),
+                trend=trend,
+                best_buy_time=best_buy_time,
+                forecast=[round(float(price), 2) for price in path[i]] if horizon else None
+            ))
         
         return predictions
     
+    def search_products(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Free-text search hits as API result dicts"""
+        hits = self.search.search(query, limit)
+        return search_results(self.catalog.snapshot, hits)
+    
+    def price_aggregates(self, categories: Optional[List[str]] = None, stores: Optional[List[str]] = None,
+                         start: Optional[date] = None, end: Optional[date] = None) -> Dict[str, Any]:
+        """Market aggregate summary for a category/store slice and date window"""
+        return self.market_aggregates.summary(categories, stores, start, end)
+    
+    def predict_all_price_trends(self, horizon: Optional[int] = None) -> List[PricePrediction]:
+        """Predict price trends for every product with history"""
+        return self.predict_price_trends(self.price_history.product_ids, horizon)
+    
     def get_personalized_recommendations(self, user_preferences: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Generate personalized product recommendations"""
         try:
-            # Extract user preferences
-            preferred_categories = user_preferences.get("categories", [])
-            max_price_range = user_preferences.get("max_price", 50.0)
-            preferred_brands = user_preferences.get("brands", [])
-            
-            recommendations = []
-            
-            for product in self.products_db:
-                # Score calculation based on preferences
-                score = 0.0
-                
-                # Category preference
-                if product["category"] in preferred_categories:
-                    score += 0.4
-                
-                # Price preference 
-                min_price = min([p["price"] for p in product["prices"]])
-                if min_price <= max_price_range:
-                    score += 0.3 * (1 - min_price / max_price_range)
+            with ENGINE_STAGE_SECONDS.time(stage="recommendations"):
+                features = self.recommender.features
+                catalog = features.catalog
+                rows, scores = features.top_k(user_preferences, k=10)
                 
-                # Brand preference
-                if product["brand"] in preferred_brands:
-                    score += 0.2
-                
-                # Rating influence
-                score += 0.1 * (product["rating"] / 5.0)
-                
-                # Discount influence
-                max_discount = max([p.get("discount", 0) for p in product["prices"]])
-                if max_discount > 0:
-                    score += 0.1
-                
-                if score > 0.5:  # Threshold for recommendation
-                    best_price = min(product["prices"], key=lambda x: x["price"] - x.get("discount", 0))
+                recommendations = []
+                for row, score in zip(rows, scores):
+                    product = catalog.products[row]
+                    best_price = product.offers[features.best_offer[row]]
+                    max_discount = float(features.max_discount[row])
                     
                     recommendations.append({
-                        "product_id": product["id"],
-                        "name": product["name"],
-                        "category": product["category"],
-                        "brand": product["brand"],
-                        "best_price": best_price["price"],
-                        "best_store": best_price["store"],
-                        "discount": best_price.get("discount", 0),
-                        "rating": product["rating"],
-                        "score": round(score, 2),
-                        "reason": self._get_recommendation_reason(product, score, max_discount)
+                        "product_id": product.id,
+                        "name": product.name,
+                        "category": product.category,
+                        "brand": product.brand,
+                        "best_price": best_price.price,
+                        "best_store": best_price.store,
+                        "discount": best_price.discount,
+                        "rating": product.rating,
+                        "score": round(float(score), 2),
+                        "reason": self._get_recommendation_reason(product, float(score), max_discount)
                     })
-            
-            # Sort by score and return top recommendations
-            recommendations.sort(key=lambda x: x["score"], reverse=True)
-            return recommendations[:10]
+                
+                return recommendations
             
         except Exception as e:
             logger.error(f"Recommendation error: {str(e)}")
             return []
     
-    def _get_recommendation_reason(self, product: Dict, score: float, discount: float) -> str:
+    def _get_recommendation_reason(self, product: ProductRecord, score: float, discount: float) -> str:
         """Generate explanation for recommendation"""
         reasons = []
         
-        if product["rating"] >= 4.5:
+        if product.rating >= 4.5:
             reasons.append("yüksek kullanıcı puanı")
         
         if discount > 1.0:
@@ -396,8 +911,140 @@ class SmartShopAI:
         
         return "Öneriliyor: " + ", ".join(reasons) if reasons else "Kaliteli ürün"
 
-# Initialize AI engine
-ai_engine = SmartShopAI()
+# AI engine, created on first use (or at app startup) rather than at import
+_engine: Optional[SmartShopAI] = None
+
+# Cached /optimize-basket and /recommendations results
+result_cache = ResultCache.from_environment()
+
+# This node's catalog partition when running sharded behind router.py (SMARTSHOP_SHARD=i/n)
+SHARD = ShardSpec.from_environment()
+
+def catalog_products() -> List[Dict[str, Any]]:
+    """Products this node serves: the whole catalog, or its shard of it"""
+    return SHARD.filter(MOCK_PRODUCTS) if SHARD else MOCK_PRODUCTS
+
+def _node_path(variable: str) -> Optional[str]:
+    path = os.getenv(variable)
+    return SHARD.path(path) if SHARD else path
+
+def build_engine() -> SmartShopAI:
+    """Create the engine from SMARTSHOP_DATABASE_URL, else from SMARTSHOP_SNAPSHOT when present
+    (publishing one otherwise)"""
+    storage = Storage.from_environment()
+    snapshot_path = _node_path("SMARTSHOP_SNAPSHOT")
+    if storage is not None:
+        engine = SmartShopAI.from_storage(storage, SHARD)
+    elif snapshot_path and snapshot_exists(snapshot_path):
+        engine = SmartShopAI.from_snapshot(snapshot_path)
+    else:
+        engine = SmartShopAI(catalog_products(), history_path=_node_path("SMARTSHOP_HISTORY_PATH"))
+        engine.startup_timings["source"] = "generated"
+        if snapshot_path:
+            save_snapshot(snapshot_path, engine.catalog.snapshot, engine.price_history, engine.store_history)
+    
+    models_path = os.getenv("SMARTSHOP_MODELS")
+    if models_path:
+        engine.load_forecaster(models_path)
+    return engine
+
+def get_engine() -> SmartShopAI:
+    global _engine
+    if _engine is None:
+        started = time.perf_counter()
+        _engine = build_engine()
+        _engine.catalog.add_listener(result_cache.invalidate)
+        STARTUP_TIMINGS["engine_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"AI engine ready in {STARTUP_TIMINGS['engine_ms']} ms ({_engine.startup_timings.get('source')})")
+    else:
+        # Days appended to a shared history file by another worker
+        _engine.price_history.refresh()
+        _engine.store_history.refresh()
+    return _engine
+
+# Thread/process pool running CPU-bound engine calls off the event loop
+executor = EngineExecutor.from_environment(get_engine)
+
+# Identical concurrent /predict-prices and /recommendations calls share one computation
+predict_flight = SingleFlight()
+recommend_flight = SingleFlight()
+
+async def _predict_batch(product_ids: List[str], horizon: Optional[int]) -> List[PricePrediction]:
+    return await executor.run("predict", "predict_price_trends", product_ids, horizon)
+
+# /predict-prices id sets arriving within this window go to the engine as one call (0 disables)
+predict_batcher = IdBatcher(
+    _predict_batch,
+    key_of=lambda prediction: prediction.product_id,
+    window=float(os.getenv("SMARTSHOP_PREDICT_BATCH_MS", "2")) / 1000
+)
+
+# Background analytics jobs (local pool or Celery)
+jobs = JobManager.from_environment(get_engine)
+
+# Seconds between scheduled market-trend refreshes
+TRENDS_REFRESH_SECONDS = float(os.getenv("SMARTSHOP_TRENDS_REFRESH", "900"))
+
+# Seconds between polls of the database for newly scraped offers
+DB_REFRESH_SECONDS = float(os.getenv("SMARTSHOP_DB_REFRESH", "60"))
+_db_refresh: Optional[asyncio.Task] = None
+
+async def _refresh_from_storage_forever(engine: SmartShopAI):
+    while True:
+        await asyncio.sleep(DB_REFRESH_SECONDS)
+        try:
+            await run_in_threadpool(engine.refresh_from_storage)
+        except Exception as e:
+            logger.error(f"Database refresh failed: {str(e)}")
+
+# Sampling profiler, only reachable when SMARTSHOP_PROFILER=1
+profiler = SamplingProfiler(interval=float(os.getenv("SMARTSHOP_PROFILER_INTERVAL", "0.005")))
+
+def _executor_gauge(field: str):
+    def samples():
+        for endpoint, stats in executor.stats()["endpoints"].items():
+            yield (endpoint,), stats[field]
+    return samples
+
+def _cache_gauge(field: str):
+    return lambda: [((), result_cache.stats()[field])]
+
+REGISTRY.gauge("smartshop_executor_running", "Engine calls running on the pool", ["endpoint"],
+               _executor_gauge("running"))
+REGISTRY.gauge("smartshop_executor_queued", "Engine calls waiting for a pool slot", ["endpoint"],
+               _executor_gauge("queued"))
+REGISTRY.gauge("smartshop_executor_rejected", "Engine calls rejected with 429 since startup", ["endpoint"],
+               _executor_gauge("rejected"))
+REGISTRY.gauge("smartshop_cache_entries", "Result cache entries", [], _cache_gauge("entries"))
+REGISTRY.gauge("smartshop_cache_hits", "Result cache hits since startup", [], _cache_gauge("hits"))
+REGISTRY.gauge("smartshop_cache_misses", "Result cache misses since startup", [], _cache_gauge("misses"))
+REGISTRY.gauge("smartshop_cache_evictions", "Result cache evictions since startup", [], _cache_gauge("evictions"))
+REGISTRY.gauge("smartshop_coalesced_requests", "Requests that shared another request's computation",
+               ["endpoint"], lambda: [(("predict",), predict_flight.shared), (("recommend",), recommend_flight.shared)])
+REGISTRY.gauge("smartshop_jobs", "Background jobs by state", ["state"],
+               lambda: [((state,), count) for state, count in jobs.stats()["jobs"].items()])
+REGISTRY.gauge("smartshop_catalog_products", "Products in the current catalog snapshot", [],
+               lambda: [((), len(_engine.catalog))] if _engine is not None else [])
+
+@app.on_event("startup")
+async def load_engine():
+    """Build engine state before serving instead of on the first request"""
+    global _db_refresh
+    engine = get_engine()
+    engine.search.sync_in_background()
+    jobs.schedule("market_trends", TRENDS_REFRESH_SECONDS)
+    if engine.storage is not None:
+        _db_refresh = asyncio.get_running_loop().create_task(_refresh_from_storage_forever(engine))
+
+@app.on_event("shutdown")
+async def stop_executor():
+    executor.shutdown()
+    jobs.shutdown()
+    if _db_refresh is not None:
+        _db_refresh.cancel()
+    if _engine is not None and _engine.storage is not None:
+        _engine.storage.close()
+    profiler.stop()
 
 # API Routes
 @app.get("/")
@@ -407,44 +1054,366 @@ async def root():
         "service": "SmartShop AI Engine",
         "status": "healthy",
         "version": "1.0.0",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": datetime.now().isoformat(),
+        "shard": {"index": SHARD.index, "count": SHARD.count, "by": SHARD.by} if SHARD else None,
+        "startup": {
+            **STARTUP_TIMINGS,
+            "engine": _engine.startup_timings if _engine is not None else "not loaded"
+        }
     }
 
+def _optimize_dependencies(shopping_list: ShoppingList, result: OptimizationResult) -> Optional[List[str]]:
+    """Product ids a cached optimization result depends on"""
+    # Budget plans may pick any substitute, so any price change can alter them;
+    # items given by name depend on the products they resolved to
+    if shopping_list.optimization_mode == "budget":
+        return None
+    depends_on = [item.product_id for item in shopping_list.items if item.product_id]
+    return depends_on + [line["product_id"] for line in result.optimized_list]
+
 @app.post("/optimize-basket", response_model=OptimizationResult)
 async def optimize_basket(shopping_list: ShoppingList):
     """Optimize shopping basket for maximum savings"""
     logger.info(f"Optimizing basket with {len(shopping_list.items)} items")
-    return ai_engine.optimize_shopping_basket(shopping_list)
+    engine = get_engine()
+    key = canonical_key("optimize", shopping_list.model_dump(), engine.catalog.version)
+    cached = result_cache.get(key)
+    if cached is not None:
+        return FastJSONResponse(cached)
+    
+    generation = result_cache.generation
+    result = await executor.run("optimize", "optimize_shopping_basket", shopping_list)
+    result_cache.set(key, result.model_dump(), depends_on=_optimize_dependencies(shopping_list, result),
+                     generation=generation)
+    return FastJSONResponse(result)
+
+@app.post("/optimize-basket/options")
+async def optimize_basket_options(shopping_list: ShoppingList):
+    """Candidate offers per basket item for a shard router's whole-basket plan (multi_store and budget modes)"""
+    if shopping_list.optimization_mode == "greedy":
+        raise HTTPException(status_code=400, detail="Options are only served for multi_store and budget baskets")
+    return FastJSONResponse(await executor.run("optimize", "basket_options", shopping_list))
+
+# Baskets per engine call while streaming /optimize-basket/batch
+OPTIMIZE_BATCH_CHUNK = 64
+
+@app.post("/optimize-basket/batch")
+async def optimize_basket_batch(shopping_lists: List[ShoppingList]):
+    """
+    Optimize many baskets in one call, streamed back as NDJSON (one OptimizationResult per line)
+    Cached baskets come from the result cache; the rest go to the engine
+    executor in chunks, under the same limits as /optimize-basket. A basket
+    that fails (or is rejected while the engine is busy) gets an
+    {"index": i, "error": ...} line instead.
+    """
+    logger.info(f"Optimizing batch of {len(shopping_lists)} baskets")
+    engine = get_engine()
+    
+    async def stream():
+        for first in range(0, len(shopping_lists), OPTIMIZE_BATCH_CHUNK):
+            chunk = shopping_lists[first:first + OPTIMIZE_BATCH_CHUNK]
+            keys = [canonical_key("optimize", sl.model_dump(), engine.catalog.version) for sl in chunk]
+            lines = [result_cache.get(key) for key in keys]
+            missing = [i for i, line in enumerate(lines) if line is None]
+            if missing:
+                generation = result_cache.generation
+                try:
+                    answers = await executor.run("optimize", "optimize_shopping_baskets", [chunk[i] for i in missing])
+                except HTTPException as e:
+                    answers = [(None, e.detail)] * len(missing)
+                except Exception as e:
+                    logger.error(f"Batch optimization error: {str(e)}")
+                    answers = [(None, f"Optimization failed: {str(e)}")] * len(missing)
+                for i, (result, error) in zip(missing, answers):
+                    if error is not None:
+                        lines[i] = {"index": first + i, "error": error}
+                        continue
+                    lines[i] = result.model_dump()
+                    result_cache.set(keys[i], lines[i], depends_on=_optimize_dependencies(chunk[i], result),
+                                     generation=generation)
+            yield b"".join(dumps(line) + b"\n" for line in lines)
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+# Deltas applied per engine call while streaming /prices/ingest
+INGEST_BATCH_SIZE = 5000
+
+@app.post("/prices/ingest")
+async def ingest_prices(request: Request):
+    """
+    Ingest streamed NDJSON price deltas, one PriceDelta object per line
+    Lines are applied in batches as they arrive, so arbitrarily large
+    feeds never sit in memory; malformed lines are reported and skipped
+    """
+    engine = get_engine()
+    totals = {"received": 0, "rejected": 0, "products_updated": 0, "history_points": 0}
+    errors = []
+    batch = []
+    
+    def parse(line: bytes, line_no: int):
+        if not line.strip():
+            return
+        totals["received"] += 1
+        try:
+            batch.append(PriceDelta.model_validate_json(line))
+        except ValidationError as e:
+            totals["rejected"] += 1
+            if len(errors) < 10:
+                errors.append({"line": line_no, "error": e.errors(include_url=False)[0]["msg"]})
+    
+    async def flush():
+        if batch:
+            result = await run_in_threadpool(engine.ingest_price_deltas, list(batch))
+            batch.clear()
+            for key, value in result.items():
+                totals[key] += value
+    
+    buffer = b""
+    line_no = 0
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            parse(line, line_no)
+        if len(batch) >= INGEST_BATCH_SIZE:
+            await flush()
+    parse(buffer, line_no + 1)
+    await flush()
+    
+    PRICE_DELTAS.inc(totals["received"] - totals["rejected"], outcome="applied")
+    PRICE_DELTAS.inc(totals["rejected"], outcome="rejected")
+    logger.info(f"Ingested {totals['received']} price deltas ({totals['rejected']} rejected, "
+                f"{totals['products_updated']} product updates)")
+    return {
+        **totals,
+        "errors": errors,
+        "catalog_version": engine.catalog.version,
+        "price_version": engine.catalog.price_version
+    }
+
+# Longest forecast /predict-prices serves
+MAX_HORIZON_DAYS = 30
 
 @app.post("/predict-prices")
-async def predict_prices(product_ids: List[str]):
-    """Predict future price trends for given products"""
-    logger.info(f"Predicting prices for {len(product_ids)} products")
-    predictions = ai_engine.predict_price_trends(product_ids)
-    return {"predictions": predictions}
+async def predict_prices(product_ids: Optional[List[str]] = None, all_products: bool = False,
+                         horizon: Optional[int] = Query(None, ge=1, le=MAX_HORIZON_DAYS)):
+    """
+    Predict future price trends for given products (or the whole catalog with ?all_products=true)
+    ?horizon=N predicts N days ahead and adds the daily forecast path
+    """
+    engine = get_engine()
+    product_ids = product_ids or []
+    key = canonical_key("predict", [all_products, horizon, product_ids], data_version(engine))
+    
+    async def compute():
+        if all_products:
+            logger.info("Predicting prices for all products")
+            predictions = await executor.run("predict", "predict_all_price_trends", horizon)
+        elif predict_batcher.window > 0:
+            logger.info(f"Predicting prices for {len(product_ids)} products")
+            by_id = await predict_batcher.submit(product_ids, horizon)
+            predictions = [by_id[pid] for pid in product_ids if pid in by_id]
+        else:
+            logger.info(f"Predicting prices for {len(product_ids)} products")
+            predictions = await executor.run("predict", "predict_price_trends", product_ids, horizon)
+        # forecast is only present when a horizon was requested
+        return [p.model_dump(exclude_none=True) for p in predictions]
+    
+    return FastJSONResponse({"predictions": await predict_flight.run(key, compute)})
+
+@app.post("/models/train", status_code=202)
+async def train_forecasting_models(force: bool = False):
+    """Train or incrementally refresh the forecasting models in background processes"""
+    models_path = os.getenv("SMARTSHOP_MODELS")
+    if not models_path:
+        raise HTTPException(status_code=400, detail="Set SMARTSHOP_MODELS to a models directory first")
+    engine = get_engine()
+    if engine.train_forecaster_in_background(models_path, force=force) is None:
+        raise HTTPException(status_code=409, detail="Training already in progress")
+    return engine.training_status
+
+@app.get("/models")
+async def forecasting_models():
+    """Active forecasting model version and the state of the last training run"""
+    engine = get_engine()
+    forecaster = engine.forecaster
+    return {
+        "training": engine.training_status,
+        "active": forecaster.manifest if forecaster is not None else None
+    }
 
 @app.post("/recommendations")
 async def get_recommendations(user_preferences: Dict[str, Any]):
     """Get personalized product recommendations"""
     logger.info("Generating personalized recommendations")
-    recommendations = ai_engine.get_personalized_recommendations(user_preferences)
-    return {"recommendations": recommendations}
+    engine = get_engine()
+    # Category/brand lists are sets semantically; order must not change the key
+    canonical = {
+        k: sorted(v, key=str) if isinstance(v, list) else v
+        for k, v in user_preferences.items()
+    }
+    key = canonical_key("recommend", canonical, engine.catalog.version)
+    recommendations = result_cache.get(key)
+    if recommendations is None:
+        async def compute():
+            generation = result_cache.generation
+            result = await executor.run("recommend", "get_personalized_recommendations", user_preferences)
+            result_cache.set(key, result, depends_on=None, generation=generation)
+            return result
+        
+        recommendations = await recommend_flight.run(key, compute)
+    return FastJSONResponse({"recommendations": recommendations})
+
+@app.get("/search")
+async def search_products(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=100)):
+    """Free-text product search over names, brands and categories (diacritics and typos tolerated)"""
+    results = await executor.run("search", "search_products", q, limit)
+    return FastJSONResponse({"query": q, "results": results})
+
+@app.get("/executor/stats")
+async def executor_stats():
+    """Worker pool configuration, in-flight and rejected calls per endpoint"""
+    return executor.stats()
+
+@app.get("/coalescing/stats")
+async def coalescing_stats():
+    """Shared in-flight computations per endpoint and /predict-prices batching"""
+    return {
+        "predict": predict_flight.stats(),
+        "recommend": recommend_flight.stats(),
+        "predict_batching": predict_batcher.stats()
+    }
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Result cache hit/miss statistics"""
+    return result_cache.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+def _require_profiler():
+    if os.getenv("SMARTSHOP_PROFILER") != "1":
+        raise HTTPException(status_code=403, detail="Profiler disabled (set SMARTSHOP_PROFILER=1)")
+
+@app.post("/debug/profiler/start")
+async def start_profiler():
+    """Start sampling all threads' stacks"""
+    _require_profiler()
+    profiler.start()
+    return {"status": "running", "interval": profiler.interval}
+
+@app.post("/debug/profiler/stop", response_class=PlainTextResponse)
+async def stop_profiler():
+    """Stop sampling and return folded stacks (feed to flamegraph.pl or speedscope)"""
+    _require_profiler()
+    return PlainTextResponse(profiler.stop())
 
 @app.get("/products")
-async def get_products():
-    """Get all available products for testing"""
-    return {"products": MOCK_PRODUCTS}
+async def get_products(cursor: Optional[str] = None, limit: int = Query(100, ge=1, le=1000)):
+    """One page of products; pass the returned next_cursor to get the next page"""
+    catalog = get_engine().catalog.snapshot
+    try:
+        page = paginate(catalog.products, catalog.id_index, cursor, limit)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Unknown cursor: {cursor}")
+    # Records become API Product dicts only here, one page at a time
+    return FastJSONResponse({"products": [product.to_dict() for product in page.pop("items")], **page})
+
+@app.get("/products/stream")
+async def stream_products(category: Optional[str] = None):
+    """Whole catalog (or one category) as NDJSON, one product per line, serialized chunk by chunk"""
+    catalog = get_engine().catalog.snapshot
+    if category is not None:
+        rows = catalog.category_index.get(category, [])
+        products = (catalog.products[row] for row in rows)
+    else:
+        products = iter(catalog.products)
+    return StreamingResponse(ndjson_chunks(product.to_dict() for product in products),
+                             media_type="application/x-ndjson")
+
+@app.post("/catalog/reload", status_code=202)
+async def reload_catalog():
+    """Rebuild catalog indexes in the background; requests keep using the current snapshot"""
+    engine = get_engine()
+    # With a database the catalog's loader re-reads it
+    engine.catalog.reload_in_background(catalog_products() if engine.storage is None else None)
+    return {"status": "reloading", "version": get_engine().catalog.version}
+
+@app.post("/jobs/{kind}", status_code=202)
+async def submit_job(kind: str, params: Optional[Dict[str, Any]] = None):
+    """
+    Start a background job (market_trends, catalog_forecast)
+    Returns the existing job when the same one already ran on unchanged data
+    """
+    try:
+        job = jobs.submit(kind, params)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown job kind: {kind}")
+    except TypeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job.status()
+
+@app.get("/jobs")
+async def list_jobs():
+    """Known jobs and job subsystem statistics"""
+    return {"stats": jobs.stats(), "jobs": jobs.jobs()}
+
+def _get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Poll a job's state"""
+    return _get_job(job_id).status()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Stream a job's state changes as NDJSON until it finishes"""
+    _get_job(job_id)
+    
+    async def stream():
+        async for status in jobs.updates(job_id):
+            yield dumps(status) + b"\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    """A finished job's result; 202 with the status while it is still running"""
+    job = _get_job(job_id)
+    if job.state == FAILED:
+        raise HTTPException(status_code=409, detail=f"Job failed: {job.error}")
+    if job.state != DONE:
+        return JSONResponse(job.status(), status_code=202)
+    return FastJSONResponse({"job": job.status(), "result": job.result})
 
 @app.get("/analytics/market-trends")
 async def get_market_trends():
-    """Get market trend analytics"""
+    """
+    Get market trend analytics
+    Price changes and top categories come straight from the rolling
+    aggregates; per-category and per-chain breakdowns from the scheduled
+    market_trends job
+    """
+    aggregates = get_engine().market_aggregates.aggregates
+    trends = jobs.latest_result("market_trends")
+    if trends is None:
+        # Only before the first scheduled run has finished
+        trends = (await jobs.wait(jobs.submit("market_trends").id)).result or {}
     return {
         "trends": {
-            "top_categories": ["Nabiał", "Pieczywo", "Napoje"],
-            "price_changes": {
-                "week": -2.3,  # % change
-                "month": +1.8
-            },
+            "top_categories": aggregates.top_categories(),  # steepest weekly price drops
+            "price_changes": aggregates.changes(),  # % change
+            "category_indices": trends.get("categories", {}),
+            "chains": trends.get("chains", {}),
+            "as_of": str(aggregates.last_date),
             "best_stores": {
                 "LIDL": "En iyi discount oranları",
                 "Biedronka": "Geniş ürün yelpazesi", 
@@ -454,7 +1423,19 @@ async def get_market_trends():
         }
     }
 
+@app.get("/analytics/prices")
+async def get_price_aggregates(category: Optional[List[str]] = Query(None), store: Optional[List[str]] = Query(None),
+                               start: Optional[date] = None, end: Optional[date] = None):
+    """
+    Mean prices over a date window for a category/store slice (dashboard filters)
+    Without a store filter each product counts with its lowest price; with
+    one, the chains' own offer prices are averaged
+    """
+    return await executor.run("analytics", "price_aggregates", category, store, start, end)
+
 if __name__ == "__main__":
+    import uvicorn
+    
     logger.info("🤖 SmartShop AI Engine starting...")
     uvicorn.run(
         "main:app",
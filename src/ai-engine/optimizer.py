@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Multi-Store Basket Optimizer
+Exact store-subset search trading item prices against trip cost, and a
+budget knapsack choosing between items and their substitutes
+"""
+
+from dataclasses import dataclass
+from itertools import combinations, islice
+from typing import List, Optional
+import numpy as np
+
+# Default cost (PLN) of visiting one extra store: fuel, parking, time
+STORE_VISIT_COST = 5.0
+
+# Upper bound on items × subsets × stores evaluated per vectorized chunk
+_CHUNK_ELEMENTS = 1_000_000
+
+# Budget resolution of the substitution knapsack: 1 grosz, or budget / steps
+# for large budgets so the DP stays O(items × options × steps)
+BUDGET_STEP = 0.01
+MAX_BUDGET_STEPS = 20_000
+
+
+@dataclass
+class StorePlan:
+    """Result of the store-subset search"""
+    stores: List[int]          # selected store columns
+    assignment: np.ndarray     # chosen store column per item, -1 if unavailable
+    item_cost: float           # sum of item costs under the assignment
+    visit_cost: float          # len(stores) * per-store visit cost
+
+    @property
+    def total_cost(self) -> float:
+        return self.item_cost + self.visit_cost
+
+
+def solve_store_subset(costs: np.ndarray, visit_cost: float = STORE_VISIT_COST,
+                       max_stores: Optional[int] = None) -> StorePlan:
+    """
+    Choose the set of stores minimising item cost + visit_cost per store.
+
+    `costs` is an items × stores matrix of line costs with np.inf where an
+    item cannot be bought at a store. Items unavailable everywhere are left
+    unassigned. Subsets are enumerated exactly by increasing size; a size-k
+    subset can never beat (sum of row minima + k * visit_cost), which bounds
+    the search once a good plan is known.
+    """
+    n_items, n_stores = costs.shape
+    assignment = np.full(n_items, -1, dtype=np.intp)
+
+    available = np.isfinite(costs)
+    buyable = available.any(axis=1)
+    if not buyable.any():
+        return StorePlan([], assignment, 0.0, 0.0)
+
+    # Only consider buyable items and stores that sell at least one of them
+    sub_costs = costs[buyable]
+    store_cols = np.flatnonzero(np.isfinite(sub_costs).any(axis=0))
+    sub_costs = sub_costs[:, store_cols]
+
+    limit = len(store_cols) if max_stores is None else max(1, min(max_stores, len(store_cols)))
+
+    # Unconstrained optimum: lower bound on item cost for any subset
+    row_best = sub_costs.argmin(axis=1)
+    lower_bound = float(sub_costs[np.arange(len(sub_costs)), row_best].sum())
+    used = np.unique(row_best)
+
+    best_cost = np.inf
+    best_subset = None
+    if len(used) <= limit:
+        best_cost = lower_bound + len(used) * visit_cost
+        best_subset = tuple(used)
+        # Larger subsets cannot lower item cost below the bound
+        limit = len(used)
+
+    for size in range(1, limit + 1):
+        if lower_bound + size * visit_cost >= best_cost:
+            break
+        subsets = combinations(range(len(store_cols)), size)
+        chunk = max(1, _CHUNK_ELEMENTS // (len(sub_costs) * size))
+        while True:
+            block = np.array(list(islice(subsets, chunk)), dtype=np.intp)
+            if block.size == 0:
+                break
+            # items × subsets: cheapest line cost within each subset
+            line_costs = sub_costs[:, block].min(axis=2)
+            totals = line_costs.sum(axis=0) + size * visit_cost
+            idx = int(totals.argmin())
+            if totals[idx] < best_cost:
+                best_cost = float(totals[idx])
+                best_subset = tuple(block[idx])
+
+    if best_subset is None:
+        # Not every item can be covered within max_stores: fall back to the
+        # subset covering the most items, ranked by cost
+        return _best_partial_plan(costs, store_cols, sub_costs, buyable, limit, visit_cost)
+
+    cols = np.array(best_subset, dtype=np.intp)
+    within = sub_costs[:, cols]
+    assignment[buyable] = store_cols[cols[within.argmin(axis=1)]]
+    item_cost = float(within.min(axis=1).sum())
+    stores = sorted(int(c) for c in np.unique(assignment[buyable]))
+    return StorePlan(stores, assignment, item_cost, len(stores) * visit_cost)
+
+
+def _best_partial_plan(costs, store_cols, sub_costs, buyable, limit, visit_cost) -> StorePlan:
+    """Best subset of exactly `limit` stores when no subset covers every item"""
+    best_key, best_subset = None, None
+    for subset in combinations(range(len(store_cols)), limit):
+        line_costs = sub_costs[:, subset].min(axis=1)
+        covered = np.isfinite(line_costs)
+        key = (-int(covered.sum()), float(line_costs[covered].sum()))
+        if best_key is None or key < best_key:
+            best_key, best_subset = key, subset
+
+    assignment = np.full(costs.shape[0], -1, dtype=np.intp)
+    cols = np.array(best_subset, dtype=np.intp)
+    within = sub_costs[:, cols]
+    covered = np.isfinite(within).any(axis=1)
+    picks = np.full(len(within), -1, dtype=np.intp)
+    picks[covered] = store_cols[cols[within[covered].argmin(axis=1)]]
+    assignment[buyable] = picks
+    item_cost = float(within[covered].min(axis=1).sum())
+    stores = sorted(int(c) for c in np.unique(picks[covered]))
+    return StorePlan(stores, assignment, item_cost, len(stores) * visit_cost)
+
+
+@dataclass
+class BudgetPlan:
+    """Result of the budget knapsack"""
+    choices: List[int]   # chosen option per item
+    cost: float          # total cost of the chosen options
+    loss: float          # total loss of the chosen options
+    within_budget: bool  # False when even the cheapest options exceed the budget
+
+
+def solve_budget(costs: List[np.ndarray], losses: List[np.ndarray], budget: float,
+                 max_steps: int = MAX_BUDGET_STEPS) -> BudgetPlan:
+    """
+    Choose one option per item minimising total loss with total cost <= budget.
+
+    A multiple-choice knapsack solved by DP over the budget discretised into
+    at most `max_steps` steps. Costs are rounded up to whole steps, so a plan
+    the DP accepts is always within the real budget. Among plans with the
+    minimum loss the cheapest is returned, and on equal loss the earlier
+    option of an item wins. If no plan fits, the cheapest option of every
+    item is returned with within_budget=False.
+    """
+    n_items = len(costs)
+    step = max(BUDGET_STEP, budget / max_steps)
+    capacity = int(np.floor(budget / step + 1e-9))
+    cheapest = [int(np.argmin(c)) for c in costs]
+    if capacity < 0 or n_items == 0:
+        return _budget_plan(cheapest, costs, losses, within=n_items == 0)
+
+    # best[b]: least loss of the items so far with cost <= b steps
+    best = np.zeros(capacity + 1)
+    choice = np.full((n_items, capacity + 1), -1, dtype=np.int16)
+    for i, (item_costs, item_losses) in enumerate(zip(costs, losses)):
+        weights = np.ceil(np.asarray(item_costs) / step - 1e-9).astype(np.int64)
+        next_best = np.full(capacity + 1, np.inf)
+        for j, (weight, loss) in enumerate(zip(weights, item_losses)):
+            if weight > capacity:
+                continue
+            candidate = best[:capacity + 1 - weight] + loss
+            better = candidate < next_best[weight:]
+            next_best[weight:][better] = candidate[better]
+            choice[i, weight:][better] = j
+        best = next_best
+
+    if not np.isfinite(best[capacity]):
+        return _budget_plan(cheapest, costs, losses, within=False)
+
+    # best is non-increasing in b: the first b reaching the optimum is the cheapest such plan
+    b = int(np.argmax(best <= best[capacity] + 1e-9))
+    choices = [0] * n_items
+    for i in range(n_items - 1, -1, -1):
+        j = int(choice[i, b])
+        choices[i] = j
+        b -= int(np.ceil(costs[i][j] / step - 1e-9))
+    return _budget_plan(choices, costs, losses, within=True)
+
+
+def _budget_plan(choices, costs, losses, within: bool) -> BudgetPlan:
+    return BudgetPlan(
+        choices,
+        float(sum(c[j] for c, j in zip(costs, choices))),
+        float(sum(l[j] for l, j in zip(losses, choices))),
+        within
+    )
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Batched Price Trend Predictor
+Trend, next-day price and confidence for many products in one NumPy pass
+"""
+
+from dataclasses import dataclass
+import numpy as np
+
+# A product is "rising"/"falling" when its 7-day mean moved more than this
+TREND_THRESHOLD = 0.05
+
+# Points used for the linear next-day extrapolation
+SLOPE_WINDOW = 5
+
+# Days compared for the trend: the last TREND_WINDOW against the TREND_WINDOW before
+TREND_WINDOW = 7
+LOOKBACK_DAYS = 2 * TREND_WINDOW
+
+
+@dataclass
+class TrendBatch:
+    """Per-product results, aligned with the rows of the input matrix"""
+    predicted_price: np.ndarray
+    confidence: np.ndarray
+    trend_change: np.ndarray
+
+    @property
+    def rising(self) -> np.ndarray:
+        return self.trend_change > TREND_THRESHOLD
+
+    @property
+    def falling(self) -> np.ndarray:
+        return self.trend_change < -TREND_THRESHOLD
+
+
+def predict_batch(prices: np.ndarray, horizon: int = 1) -> TrendBatch:
+    """
+    Vectorized trend analysis over a products × days price matrix
+
+    Per row: compares the last 7 days' mean with the previous 7, extrapolates
+    `horizon` days ahead with a least-squares slope over the last 5 points
+    (closed form, no polyfit), and derives confidence from the recent volatility.
+    
+    With fewer than LOOKBACK_DAYS of history, confidence is scaled down by
+    the fraction of the lookback covered; with no earlier week to compare
+    against, the trend is flat.
+    """
+    prices = np.asarray(prices, dtype=float)
+    n_days = prices.shape[1]
+    recent = prices[:, -TREND_WINDOW:]
+    older = prices[:, -LOOKBACK_DAYS:-TREND_WINDOW]
+
+    recent_avg = recent.mean(axis=1)
+    if older.shape[1]:
+        older_avg = older.mean(axis=1)
+        trend_change = (recent_avg - older_avg) / older_avg
+    else:
+        trend_change = np.zeros(len(prices))
+
+    if n_days >= SLOPE_WINDOW:
+        # Least-squares slope for x = 0..n-1: sum((x - x̄) * y) / sum((x - x̄)²)
+        x = np.arange(SLOPE_WINDOW, dtype=float)
+        x -= x.mean()
+        slope = prices[:, -SLOPE_WINDOW:] @ x / (x @ x)
+        predicted = prices[:, -1] + slope * horizon
+    else:
+        predicted = prices[:, -1].copy()
+
+    volatility = recent.std(axis=1) / recent_avg
+    confidence = np.maximum(0.3, 1.0 - volatility * 10)
+    if n_days < LOOKBACK_DAYS:
+        confidence *= n_days / LOOKBACK_DAYS
+
+    return TrendBatch(predicted_price=predicted, confidence=confidence, trend_change=trend_change)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Price History Store
+Columnar price history: one shared date axis and a float32 products × days
+matrix, optionally persisted as a memory-mapped file shared by workers
+"""
+
+import json
+import logging
+import os
+from datetime import date
+from typing import Callable, List, Dict, Optional, Iterable, Tuple, Union
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PRICES_FILE = "prices.npy"
+META_FILE = "meta.json"
+
+# Spare day columns allocated ahead so appends don't reallocate
+DEFAULT_SPARE_DAYS = 30
+
+# Most days one record_prices call may append (bounds a bogus far-future date)
+MAX_APPEND_DAYS = 366
+
+# Per-store price history rows are keyed "<product id>@<store>"
+OFFER_KEY_SEPARATOR = "@"
+
+# listener(rows, col, old, new): `rows` of day `col` changed from `old` to
+# `new`; rows=None is a whole appended day, col=None a wholesale change
+HistoryListener = Callable[[Optional[np.ndarray], Optional[int], Optional[np.ndarray], Optional[np.ndarray]], None]
+
+
+class PriceHistoryStore:
+    """Daily price history for the whole catalog.
+
+    Day d of product row r lives at `prices[r, d]`; the date of column d is
+    `start + d` days. The backing array has spare columns so a new day is a
+    single O(products) column write. With a `path`, the matrix is a
+    memory-mapped .npy file and metadata lives in a JSON sidecar.
+    """
+
+    def __init__(self, product_ids: Iterable[str], start: Union[date, np.datetime64],
+                 data: np.ndarray, n_days: int, path: Optional[str] = None):
+        self.product_ids: List[str] = list(product_ids)
+        self.index: Dict[str, int] = {pid: row for row, pid in enumerate(self.product_ids)}
+        self.start = np.datetime64(start, "D")
+        self.n_days = n_days
+        self.path = path
+        self._data = data
+        self._listeners: List[HistoryListener] = []
+        self._meta_mtime = self._stat_meta()
+
+    # Construction / persistence
+
+    @classmethod
+    def from_matrix(cls, product_ids: Iterable[str], start: Union[date, np.datetime64],
+                    prices: np.ndarray, spare_days: int = DEFAULT_SPARE_DAYS) -> "PriceHistoryStore":
+        """In-memory store from a products × days matrix"""
+        n_products, n_days = prices.shape
+        data = np.full((n_products, n_days + spare_days), np.nan, dtype=np.float32)
+        data[:, :n_days] = prices
+        return cls(product_ids, start, data, n_days)
+
+    @classmethod
+    def open(cls, path: str, writable: bool = False) -> "PriceHistoryStore":
+        """Memory-map a store saved with save(); read-only maps share pages across processes"""
+        meta = _read_meta(path)
+        data = np.load(os.path.join(path, PRICES_FILE), mmap_mode="r+" if writable else "r")
+        store = cls(meta["product_ids"], np.datetime64(meta["start"], "D"), data, meta["n_days"], path)
+        logger.info(f"Price history mapped from {path}: {len(store)} products × {store.n_days} days")
+        return store
+
+    def save(self, path: str) -> "PriceHistoryStore":
+        """Write the store to `path` and return a writable memory-mapped copy"""
+        os.makedirs(path, exist_ok=True)
+        target = os.path.join(path, PRICES_FILE)
+        tmp = target + ".tmp"
+        mapped = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=self._data.shape)
+        mapped[:] = self._data
+        mapped.flush()
+        del mapped
+        os.replace(tmp, target)
+        store = PriceHistoryStore(
+            self.product_ids, self.start,
+            np.load(target, mmap_mode="r+"), self.n_days, path
+        )
+        store._write_meta()
+        return store
+
+    def refresh(self) -> bool:
+        """Pick up days appended by another process sharing the same files.
+
+        One stat() of the metadata file while nothing changed, so it is
+        cheap enough to call per request. Returns whether anything changed.
+        """
+        mtime = self._stat_meta()
+        if mtime is None or mtime == self._meta_mtime:
+            return False
+        self._meta_mtime = mtime
+        meta = _read_meta(self.path)
+        if meta["capacity"] != self._data.shape[1] or len(meta["product_ids"]) != len(self.product_ids):
+            # The file was regrown; remap it
+            fresh = PriceHistoryStore.open(self.path, writable=self._data.flags.writeable)
+            fresh._listeners = self._listeners
+            self.__dict__.update(fresh.__dict__)
+        elif meta["n_days"] != self.n_days:
+            self.n_days = meta["n_days"]
+        else:
+            return False
+        logger.info(f"Price history at {self.path} moved on to {self.n_days} days")
+        self._notify(None, None, None, None)
+        return True
+
+    def _stat_meta(self) -> Optional[int]:
+        if not self.path:
+            return None
+        try:
+            return os.stat(os.path.join(self.path, META_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self) -> None:
+        meta = {
+            "start": str(self.start),
+            "n_days": self.n_days,
+            "capacity": int(self._data.shape[1]),
+            "product_ids": self.product_ids,
+        }
+        target = os.path.join(self.path, META_FILE)
+        with open(target + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(target + ".tmp", target)
+        self._meta_mtime = self._stat_meta()
+
+    # Reads
+
+    def __len__(self) -> int:
+        return len(self.product_ids)
+
+    def __contains__(self, product_id: str) -> bool:
+        return product_id in self.index
+
+    @property
+    def prices(self) -> np.ndarray:
+        """products × days view of the populated part of the matrix"""
+        return self._data[:, :self.n_days]
+
+    @property
+    def dates(self) -> np.ndarray:
+        """Shared date axis as datetime64[D]"""
+        return self.start + np.arange(self.n_days)
+
+    @property
+    def last_date(self) -> np.datetime64:
+        return self.start + (self.n_days - 1)
+
+    def row_of(self, product_id: str) -> int:
+        return self.index.get(product_id, -1)
+
+    def rows_of(self, product_ids: Iterable[str]) -> np.ndarray:
+        return np.fromiter((self.index.get(pid, -1) for pid in product_ids), dtype=np.intp)
+
+    def series(self, product_id: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(dates, prices) for one product, or None when it has no history"""
+        row = self.index.get(product_id)
+        if row is None:
+            return None
+        return self.dates, self.prices[row]
+
+    # Writes
+
+    def add_listener(self, listener: HistoryListener) -> None:
+        """Call `listener(rows, col, old, new)` after every write (see HistoryListener)"""
+        self._listeners.append(listener)
+
+    def _notify(self, rows, col, old, new) -> None:
+        for listener in self._listeners:
+            try:
+                listener(rows, col, old, new)
+            except Exception as e:
+                logger.error(f"Price history listener error: {str(e)}")
+
+    def append_day(self, values: np.ndarray) -> None:
+        """Append one day of prices (aligned with product rows) in O(products)"""
+        if self.n_days == self._data.shape[1]:
+            self._grow(max(DEFAULT_SPARE_DAYS, self.n_days // 4))
+        self._data[:, self.n_days] = values
+        self.n_days += 1
+        if self.path:
+            self._data.flush()
+            self._write_meta()
+        self._notify(None, self.n_days - 1, None, self._data[:, self.n_days - 1])
+
+    def record_prices(self, product_ids: Iterable[str], day: Union[date, np.datetime64],
+                      values: np.ndarray) -> int:
+        """Set the prices of some products on one day, in place.
+
+        Days after last_date are appended first, carrying every product's
+        last price forward over the gap (at most MAX_APPEND_DAYS). Products
+        without a history row are skipped. Returns the number of prices written.
+        Raises ValueError for days before `start` or too far past last_date.
+        """
+        day = np.datetime64(day, "D")
+        if day < self.start:
+            raise ValueError(f"{day} is before the first history day {self.start}")
+        if day > self.last_date + MAX_APPEND_DAYS:
+            raise ValueError(f"{day} is more than {MAX_APPEND_DAYS} days after the last history day {self.last_date}")
+        if not self._data.flags.writeable:
+            # Read-only map shared with other processes: diverge into memory
+            logger.warning(f"Price history at {self.path} is read-only; recording updates in memory")
+            self._data = np.array(self._data)
+            self.path = None
+        col = int((day - self.start) // np.timedelta64(1, "D"))
+        while self.n_days <= col:
+            self.append_day(self._data[:, self.n_days - 1])
+
+        rows = self.rows_of(product_ids)
+        known = rows >= 0
+        rows = rows[known]
+        old = self._data[rows, col]
+        new = np.asarray(values, dtype=np.float32)[known]
+        self._data[rows, col] = new
+        if self.path:
+            self._data.flush()
+        self._notify(rows, col, old, new)
+        return len(rows)
+
+    def _grow(self, extra_days: int) -> None:
+        """Reallocate with more spare day columns (amortised by over-allocating)"""
+        n_products, capacity = self._data.shape
+        data = np.full((n_products, capacity + extra_days), np.nan, dtype=np.float32)
+        data[:, :capacity] = self._data
+        if self.path:
+            grown = PriceHistoryStore(self.product_ids, self.start, data, self.n_days).save(self.path)
+            self._data = grown._data
+        else:
+            self._data = data
+
+
+def offer_key(product_id: str, store: str) -> str:
+    """Row id of one product's offer at one store in a per-store price history"""
+    return f"{product_id}{OFFER_KEY_SEPARATOR}{store}"
+
+
+def split_offer_key(key: str) -> Tuple[str, str]:
+    """(product id, store) of an offer_key"""
+    product_id, _, store = key.rpartition(OFFER_KEY_SEPARATOR)
+    return product_id, store
+
+
+def _read_meta(path: str) -> dict:
+    with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+        return json.load(f)
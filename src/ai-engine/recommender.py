@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Recommendation Engine
+Precomputed per-product features scored against a preference vector with NumPy
+"""
+
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+from catalog import CatalogSnapshot, ProductCatalog
+
+# Scoring weights (same as the original per-product loop)
+CATEGORY_WEIGHT = 0.4
+PRICE_WEIGHT = 0.3
+BRAND_WEIGHT = 0.2
+RATING_WEIGHT = 0.1
+DISCOUNT_WEIGHT = 0.1
+
+SCORE_THRESHOLD = 0.5
+DEFAULT_MAX_PRICE = 50.0
+
+
+class RecommendationFeatures:
+    """Per-product feature vectors for one catalog snapshot"""
+
+    def __init__(self, catalog: CatalogSnapshot):
+        self.catalog = catalog
+        n = len(catalog)
+
+        self.categories = list(catalog.category_index)
+        self.category_lookup = {category: cid for cid, category in enumerate(self.categories)}
+        self.category_ids = np.empty(n, dtype=np.int32)
+        for cid, category in enumerate(self.categories):
+            self.category_ids[catalog.category_index[category]] = cid
+
+        self.brands = list(catalog.brand_index)
+        self.brand_lookup = {brand: bid for bid, brand in enumerate(self.brands)}
+        self.brand_ids = np.empty(n, dtype=np.int32)
+        for bid, brand in enumerate(self.brands):
+            self.brand_ids[catalog.brand_index[brand]] = bid
+
+        self.rating = np.array([p.rating for p in catalog.products], dtype=float)
+        self.rating_term = RATING_WEIGHT * (self.rating / 5.0)
+
+        self.min_price = np.empty(n)
+        self.max_discount = np.empty(n)
+        self.best_offer = np.empty(n, dtype=np.intp)
+        self.discount_term = np.zeros(n)
+        self.refresh_rows(np.arange(n))
+
+    def refresh_rows(self, rows: np.ndarray) -> None:
+        """Recompute the price-derived features of the given rows"""
+        if len(rows) == 0:
+            return
+        catalog = self.catalog
+        prices = catalog.prices[rows]
+        # Products without offers (unsold) get NaN prices and no best offer
+        unsold = np.isnan(prices).all(axis=1)
+        lowest = np.where(np.isnan(prices), np.inf, prices).min(axis=1)
+        self.min_price[rows] = np.where(unsold, np.nan, lowest)
+        self.max_discount[rows] = np.where(np.isnan(prices), -np.inf, catalog.discounts[rows]).max(axis=1)
+        # Cheapest effective offer, first in the product's list on ties
+        effective = np.where(np.isnan(prices), np.inf, catalog.effective_prices[rows])
+        best_col = np.lexsort((catalog.offer_order[rows], effective))[:, 0]
+        self.best_offer[rows] = np.where(unsold, -1, catalog.offer_order[rows, best_col])
+        self.discount_term[rows] = np.where(self.max_discount[rows] > 0, DISCOUNT_WEIGHT, 0.0)
+
+    def score(self, preferences: Dict[str, Any]) -> np.ndarray:
+        """Score every product against the preferences in one vectorized pass"""
+        categories = preferences.get("categories") or []
+        brands = preferences.get("brands") or []
+        max_price = preferences.get("max_price", DEFAULT_MAX_PRICE)
+
+        # Terms are added in the same order as the original loop so scores
+        # (and therefore threshold and rounding decisions) match bit for bit;
+        # category/brand preferences become small weight lookup tables
+        category_weight = np.zeros(len(self.categories))
+        category_weight[[self.category_lookup[c] for c in categories if c in self.category_lookup]] = CATEGORY_WEIGHT
+        score = category_weight[self.category_ids]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            price_term = self.min_price / max_price
+        np.subtract(1, price_term, out=price_term)
+        price_term *= PRICE_WEIGHT
+        price_term[~(self.min_price <= max_price)] = 0.0
+        score += price_term
+
+        brand_weight = np.zeros(len(self.brands))
+        brand_weight[[self.brand_lookup[b] for b in brands if b in self.brand_lookup]] = BRAND_WEIGHT
+        score += brand_weight[self.brand_ids]
+
+        score += self.rating_term
+        score += self.discount_term
+        return score
+
+    def top_k(self, preferences: Dict[str, Any], k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows and scores of the k best products above the threshold.
+
+        Ordered by rounded score, then catalog order, like a stable sort of
+        the full candidate list; only the top k are ever sorted. Products
+        without offers are never recommended.
+        """
+        score = self.score(preferences)
+        candidates = np.flatnonzero((score > SCORE_THRESHOLD) & ~np.isnan(self.min_price))
+        rounded = _round2(score[candidates])
+
+        if len(candidates) > k:
+            kth = rounded[np.argpartition(-rounded, k - 1)[:k]].min()
+            above = rounded > kth
+            ties = np.flatnonzero(rounded == kth)[:k - int(above.sum())]
+            keep = np.concatenate([np.flatnonzero(above), ties])
+            candidates, rounded = candidates[keep], rounded[keep]
+
+        order = np.lexsort((candidates, -rounded))
+        rows = candidates[order]
+        return rows, score[rows]
+
+
+def _round2(values: np.ndarray) -> np.ndarray:
+    """np.round(values, 2) that agrees with Python's round() near .xx5 ties"""
+    rounded = np.round(values, 2)
+    scaled = values * 100
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie):
+        rounded[i] = round(float(values[i]), 2)
+    return rounded
+
+
+class Recommender:
+    """Keeps RecommendationFeatures in sync with a ProductCatalog"""
+
+    def __init__(self, catalog: ProductCatalog):
+        self.catalog = catalog
+        self._lock = threading.Lock()
+        self._features: Optional[RecommendationFeatures] = None
+        catalog.add_listener(self._on_catalog_change)
+
+    @property
+    def features(self) -> RecommendationFeatures:
+        features = self._features
+        snapshot = self.catalog.snapshot
+        if features is None or features.catalog is not snapshot:
+            with self._lock:
+                if self._features is None or self._features.catalog is not snapshot:
+                    self._features = RecommendationFeatures(snapshot)
+                features = self._features
+        return features
+
+    def _on_catalog_change(self, product_ids: Optional[List[str]]) -> None:
+        if product_ids is None:
+            return  # new snapshot; features are rebuilt lazily on next use
+        with self._lock:
+            features = self._features
+            if features is not None and features.catalog is self.catalog.snapshot:
+                features.refresh_rows(features.catalog.rows_of(product_ids))
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Product Records
+Compact slotted product and offer records used inside the engine, with
+store and category names interned as small ints; API dicts are produced
+only at the response boundary
+"""
+
+import sys
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+
+class Interner:
+    """Append-only name <-> small int table; an id never changes meaning"""
+
+    __slots__ = ("names", "ids", "_lock")
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def id(self, name: str) -> int:
+        i = self.ids.get(name)
+        if i is None:
+            with self._lock:
+                i = self.ids.get(name)
+                if i is None:
+                    i = len(self.names)
+                    self.names.append(sys.intern(name))
+                    self.ids[self.names[i]] = i
+        return i
+
+    def name(self, i: int) -> str:
+        return self.names[i]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+# Process-wide tables; pickled snapshots carry their own names and are
+# remapped on load (see CatalogSnapshot.__setstate__)
+STORES = Interner()
+CATEGORIES = Interner()
+
+
+class Offer:
+    """One store's price for a product"""
+
+    __slots__ = ("store_id", "price", "discount")
+
+    def __init__(self, store_id: int, price: float, discount: float = 0.0):
+        self.store_id = store_id
+        self.price = price
+        self.discount = discount
+
+    @classmethod
+    def from_dict(cls, offer: Dict[str, Any]) -> "Offer":
+        return cls(STORES.id(offer["store"]), offer["price"], offer.get("discount", 0))
+
+    @property
+    def store(self) -> str:
+        return STORES.names[self.store_id]
+
+    @property
+    def effective_price(self) -> float:
+        return self.price - self.discount
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"store": self.store, "price": self.price, "discount": self.discount}
+
+    def __reduce__(self):
+        return Offer, (self.store_id, self.price, self.discount)
+
+    def __repr__(self) -> str:
+        return f"Offer({self.store!r}, {self.price!r}, {self.discount!r})"
+
+
+class ProductRecord:
+    """A catalog product. Treated as immutable: price updates swap in a
+    new record (with_offers), so holders of the old one see consistent offers"""
+
+    __slots__ = ("id", "name", "brand", "category_id", "offers", "rating", "availability")
+
+    def __init__(self, id: str, name: str, brand: str, category_id: int,
+                 offers: Tuple[Offer, ...], rating: float, availability: int):
+        self.id = id
+        self.name = name
+        self.brand = brand
+        self.category_id = category_id
+        self.offers = offers
+        self.rating = rating
+        self.availability = availability
+
+    @classmethod
+    def from_dict(cls, product: Dict[str, Any]) -> "ProductRecord":
+        return cls(
+            product["id"],
+            product["name"],
+            sys.intern(product["brand"]),
+            CATEGORIES.id(product["category"]),
+            tuple(Offer.from_dict(offer) for offer in product["prices"]),
+            product["rating"],
+            product.get("availability", len(product["prices"])),
+        )
+
+    @property
+    def category(self) -> str:
+        return CATEGORIES.names[self.category_id]
+
+    def with_offers(self, offers: Iterable[Offer]) -> "ProductRecord":
+        return ProductRecord(self.id, self.name, self.brand, self.category_id,
+                             tuple(offers), self.rating, self.availability)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The API `Product` shape"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "category": self.category,
+            "brand": self.brand,
+            "prices": [offer.to_dict() for offer in self.offers],
+            "rating": self.rating,
+            "availability": self.availability,
+        }
+
+    def __reduce__(self):
+        return ProductRecord, (self.id, self.name, self.brand, self.category_id,
+                               self.offers, self.rating, self.availability)
+
+    def __repr__(self) -> str:
+        return f"ProductRecord({self.id!r}, {self.name!r})"
+
+
+def as_record(product: Union[ProductRecord, Dict[str, Any]]) -> ProductRecord:
+    return product if isinstance(product, ProductRecord) else ProductRecord.from_dict(product)
+
+
+def as_offer(offer: Union[Offer, Dict[str, Any]]) -> Offer:
+    return offer if isinstance(offer, Offer) else Offer.from_dict(offer)
+
+
+def remap(products: List[ProductRecord], store_names: List[str],
+          category_names: List[str]) -> Optional[List[ProductRecord]]:
+    """Records re-pointed at this process's interned ids, or None when the
+    ids they were written with already mean the same names here"""
+    stores = [STORES.id(name) for name in store_names]
+    categories = [CATEGORIES.id(name) for name in category_names]
+    if stores == list(range(len(stores))) and categories == list(range(len(categories))):
+        return None
+    return [
+        ProductRecord(p.id, p.name, p.brand, categories[p.category_id],
+                      tuple(Offer(stores[o.store_id], o.price, o.discount) for o in p.offers),
+                      p.rating, p.availability)
+        for p in products
+    ]
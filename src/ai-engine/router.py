@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Shard Router
+Thin front for a sharded deployment (see sharding.py): fans /predict-prices,
+/recommendations and /search out to the engine nodes and merges the answers,
+and plans /optimize-basket over the candidate offers of the shards holding
+the items
+
+Usage:
+    SMARTSHOP_SHARD_URLS=http://node0:8000,http://node1:8000 SMARTSHOP_SHARD_BY=category uvicorn router:app
+    python router.py --local 4 --skus 20000     # spawn a local 4-shard cluster behind the router
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+from fastapi import FastAPI, HTTPException, Query
+
+from main import (FastJSONResponse, OptimizationResult, ShoppingList, SmartShopAI,
+                  MAX_HORIZON_DAYS)
+from optimizer import STORE_VISIT_COST, solve_budget, solve_store_subset
+from sharding import SHARD_BY, LocalCluster, shard_of
+
+logger = logging.getLogger(__name__)
+
+# Recommendations the engine returns per call (Recommender.top_k default)
+RECOMMENDATIONS_K = 10
+
+# Seconds to wait for a shard before failing the request
+SHARD_TIMEOUT = 30.0
+
+
+class ShardRouter:
+    """Fan-out and merge logic over the nodes of one sharded deployment.
+
+    `urls[i]` must serve shard i (SMARTSHOP_SHARD=i/n). With by="hash" the
+    owner of a product id is computed here and only that node is asked;
+    with by="category" ids are sent to every node and each answers for the
+    products it holds.
+    """
+
+    def __init__(self, urls: List[str], by: str = "category", timeout: float = SHARD_TIMEOUT):
+        if by not in SHARD_BY:
+            raise ValueError(f"Unknown shard key: {by}")
+        self.urls = [url.rstrip("/") for url in urls]
+        self.by = by
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def call(self, shard: int, method: str, path: str, **kwargs) -> Any:
+        """JSON response of one node; node errors keep their status, unreachable nodes become 502"""
+        try:
+            response = await self.client.request(method, self.urls[shard] + path, **kwargs)
+        except httpx.HTTPError as e:
+            logger.error(f"Shard {shard} ({self.urls[shard]}) unreachable: {str(e)}")
+            raise HTTPException(status_code=502, detail=f"Shard {shard} unavailable")
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get("detail", response.text)
+            except ValueError:
+                detail = response.text
+            raise HTTPException(status_code=response.status_code, detail=detail,
+                                headers={"Retry-After": response.headers["Retry-After"]}
+                                if "Retry-After" in response.headers else None)
+        return response.json()
+
+    async def fan_out(self, method: str, path: str, shards: Optional[List[int]] = None, **kwargs) -> List[Any]:
+        """Same request to every node (or the given ones), answers in shard order"""
+        if not self.urls:
+            raise HTTPException(status_code=503, detail="No shards configured (set SMARTSHOP_SHARD_URLS)")
+        shards = range(len(self.urls)) if shards is None else shards
+        return await asyncio.gather(*(self.call(shard, method, path, **kwargs) for shard in shards))
+
+    def owner_of(self, product_id: str) -> Optional[int]:
+        """Shard holding a product, when it can be told from the id alone"""
+        return shard_of(product_id, len(self.urls)) if self.by == "hash" else None
+
+    def split(self, product_ids: List[str]) -> Dict[int, List[str]]:
+        """shard -> ids to ask it about"""
+        if self.by != "hash":
+            return {shard: product_ids for shard in range(len(self.urls))}
+        groups: Dict[int, List[str]] = {}
+        for pid in product_ids:
+            groups.setdefault(self.owner_of(pid), []).append(pid)
+        return groups
+
+    # Endpoints
+
+    async def predict_prices(self, product_ids: List[str], all_products: bool,
+                             horizon: Optional[int]) -> List[Dict[str, Any]]:
+        params = {"horizon": horizon} if horizon else {}
+        if all_products:
+            answers = await self.fan_out("POST", "/predict-prices", params={**params, "all_products": True})
+            return [p for answer in answers for p in answer["predictions"]]
+        groups = self.split(product_ids)
+        answers = await asyncio.gather(*(
+            self.call(shard, "POST", "/predict-prices", params=params, json=ids)
+            for shard, ids in groups.items()
+        ))
+        by_id = {p["product_id"]: p for answer in answers for p in answer["predictions"]}
+        return [by_id[pid] for pid in product_ids if pid in by_id]
+
+    async def recommendations(self, preferences: Dict[str, Any]) -> List[Dict[str, Any]]:
+        answers = await self.fan_out("POST", "/recommendations", json=preferences)
+        merged = [r for answer in answers for r in answer["recommendations"]]
+        # Stable: equal scores keep shard order, like catalog order within a node
+        merged.sort(key=lambda r: -r["score"])
+        return merged[:RECOMMENDATIONS_K]
+
+    async def search(self, q: str, limit: int) -> List[Dict[str, Any]]:
+        answers = await self.fan_out("GET", "/search", params={"q": q, "limit": limit})
+        merged = [r for answer in answers for r in answer["results"]]
+        merged.sort(key=lambda r: (-r["score"], -r["rating"]))
+        return merged[:limit]
+
+    async def optimize_basket(self, shopping_list: ShoppingList) -> OptimizationResult:
+        """
+        Greedy baskets are optimized per item, so each shard optimizes its
+        part and the parts are merged. Multi-store and budget plans depend on
+        the whole basket: shards return their items' candidate offers
+        (/optimize-basket/options) and the store-subset search or budget
+        knapsack runs once here, as it would on a single node. Substitutes
+        come from the shard holding the item: whole categories under category
+        sharding, only that shard's products under hash sharding.
+        """
+        shopping_list = await self._resolve_item_names(shopping_list)
+        indexed = [(i, item) for i, item in enumerate(shopping_list.items) if item.product_id]
+        items = [item for _, item in indexed]
+        groups: Dict[int, List[int]] = {}
+        for i, item in indexed:
+            owner = self.owner_of(item.product_id)
+            for shard in ([owner] if owner is not None else range(len(self.urls))):
+                groups.setdefault(shard, []).append(i)
+
+        def request(shard: int) -> Dict[str, Any]:
+            part = [shopping_list.items[i] for i in groups[shard]]
+            return shopping_list.model_copy(update={"items": part}).model_dump(exclude_none=True)
+
+        mode = shopping_list.optimization_mode
+        path = "/optimize-basket" if mode == "greedy" else "/optimize-basket/options"
+        shards = list(groups)
+        answers = await asyncio.gather(*(self.call(shard, "POST", path, json=request(shard)) for shard in shards))
+        if mode == "greedy":
+            return self._merge_baskets(shopping_list, items, answers)
+
+        # Candidate tables keyed by the item's position in the full basket
+        stores: Dict[str, None] = {}
+        candidates: Dict[int, Dict[str, Any]] = {}
+        for shard, answer in zip(shards, answers):
+            stores.update(dict.fromkeys(answer["stores"]))
+            for entry in answer["items"]:
+                candidates[groups[shard][entry["index"]]] = entry
+        held = [(shopping_list.items[i], candidates[i]) for i, _ in indexed if i in candidates]
+        plan_basket = self._plan_multi_store if mode == "multi_store" else self._plan_budget
+        return self._merge_baskets(shopping_list, items, [plan_basket(shopping_list, held, list(stores))])
+
+    @staticmethod
+    def _plan_multi_store(shopping_list: ShoppingList, held: list, stores: List[str]) -> Dict[str, Any]:
+        """One store subset for the whole basket over the shards' candidate offers"""
+        columns = {store: col for col, store in enumerate(stores)}
+        costs = np.full((len(held), len(stores)), np.inf)
+        for row, (_, entry) in enumerate(held):
+            for offer in entry["offers"]:
+                costs[row, columns[offer["store"]]] = offer["cost"]
+        visit_cost = (shopping_list.store_visit_cost
+                      if shopping_list.store_visit_cost is not None else STORE_VISIT_COST)
+        plan = solve_store_subset(costs, visit_cost, shopping_list.max_stores)
+
+        lines = []
+        for (item, entry), col in zip(held, plan.assignment):
+            if col >= 0:
+                offer = next(offer for offer in entry["offers"] if offer["store"] == stores[col])
+                lines.append(_basket_line(item, entry["product_id"], entry["product_name"], offer))
+        return _basket_part(lines, stores, selected_stores=[stores[col] for col in plan.stores])
+
+    @staticmethod
+    def _plan_budget(shopping_list: ShoppingList, held: list, stores: List[str]) -> Dict[str, Any]:
+        """Greedy picks, or the budget knapsack over every item's substitutes when they do not fit"""
+        options = [entry["options"] for _, entry in held]
+        choices = [0] * len(held)
+        budget = shopping_list.budget
+        if budget and sum(item_options[0]["cost"] for item_options in options) > budget:
+            costs = [np.array([option["cost"] for option in item_options]) for item_options in options]
+            losses = [np.array([option["loss"] for option in item_options]) for item_options in options]
+            choices = solve_budget(costs, losses, budget).choices
+
+        lines, recommendations = [], []
+        for (item, _), item_options, choice in zip(held, options, choices):
+            option = item_options[choice]
+            if option["offer"] is None:
+                continue
+            line = _basket_line(item, option["product_id"], option["product_name"], option["offer"])
+            if choice:
+                line["substitute_for"] = item.product_id
+                recommendations.append(
+                    f"🔄 {item_options[0]['product_name']} yerine {line['product_name']} "
+                    f"({line['store']}, {line['unit_price']:.2f} PLN) - bütçeye uygun alternatif"
+                )
+            lines.append(line)
+        return _basket_part(lines, stores, recommendations=recommendations)
+
+    async def _resolve_item_names(self, shopping_list: ShoppingList) -> ShoppingList:
+        """Give name-only items the id of the best search hit across all shards"""
+        if all(item.product_id for item in shopping_list.items):
+            return shopping_list
+        items = []
+        for item in shopping_list.items:
+            if not item.product_id:
+                hits = await self.search(item.name, 1)
+                if hits:
+                    item = item.model_copy(update={"product_id": hits[0]["product_id"]})
+                else:
+                    logger.info(f"No product matches basket item '{item.name}'")
+            items.append(item)
+        return shopping_list.model_copy(update={"items": items})
+
+    def _merge_baskets(self, shopping_list: ShoppingList, items: list,
+                       parts: List[Dict[str, Any]]) -> OptimizationResult:
+        position: Dict[str, int] = {}
+        for i, item in enumerate(items):
+            position.setdefault(item.product_id, i)
+        lines = [line for part in parts for line in part["optimized_list"]]
+        lines.sort(key=lambda line: position.get(line.get("substitute_for", line["product_id"]), len(items)))
+
+        store_counts: Dict[str, int] = {}
+        for part in parts:
+            for store, count in part["store_distribution"].items():
+                store_counts[store] = store_counts.get(store, 0) + count
+        total_cost = sum(line["total_price"] for line in lines)
+        recommendations = SmartShopAI._generate_recommendations(
+            lines, store_counts, total_cost, shopping_list.budget)
+        recommendations += [r for part in parts for r in part["recommendations"] if r.startswith("🔄")]
+
+        selected_stores = trip_cost = None
+        if shopping_list.optimization_mode == "multi_store":
+            selected_stores = list(dict.fromkeys(s for part in parts for s in part.get("selected_stores") or []))
+            visit_cost = (shopping_list.store_visit_cost
+                          if shopping_list.store_visit_cost is not None else STORE_VISIT_COST)
+            trip_cost = round(visit_cost * len(selected_stores), 2)
+            recommendations.append(
+                f"🛒 En uygun plan: {' + '.join(selected_stores)} "
+                f"({len(selected_stores)} mağaza, ziyaret maliyeti {trip_cost:.2f} PLN)"
+            )
+
+        return OptimizationResult(
+            optimized_list=lines,
+            total_cost=round(total_cost, 2),
+            savings=round(sum(line["savings"] for line in lines), 2),
+            store_distribution=store_counts,
+            recommendations=recommendations,
+            selected_stores=selected_stores,
+            trip_cost=trip_cost
+        )
+
+
+def _basket_line(item, product_id: str, product_name: str, offer: Dict[str, Any]) -> Dict[str, Any]:
+    """An optimized_list line, as SmartShopAI._build_optimization_result writes it"""
+    return {
+        "product_id": product_id,
+        "product_name": product_name,
+        "quantity": item.quantity,
+        "store": offer["store"],
+        "unit_price": offer["price"],
+        "total_price": offer["price"] * item.quantity,
+        "discount": offer["discount"],
+        "savings": offer["discount"] * item.quantity,
+    }
+
+
+def _basket_part(lines: List[Dict[str, Any]], stores: List[str], recommendations: Optional[List[str]] = None,
+                 selected_stores: Optional[List[str]] = None) -> Dict[str, Any]:
+    """A centrally planned basket in the shape of one shard's /optimize-basket answer"""
+    distribution = dict.fromkeys(stores, 0)
+    for line in lines:
+        distribution[line["store"]] += line["quantity"]
+    return {"optimized_list": lines, "store_distribution": distribution,
+            "recommendations": recommendations or [], "selected_stores": selected_stores}
+
+
+def create_router(urls: List[str], by: str = "category", timeout: float = SHARD_TIMEOUT) -> FastAPI:
+    """FastAPI app routing to the given shard nodes"""
+    shards = ShardRouter(urls, by, timeout)
+    router_app = FastAPI(title="SmartShop AI Shard Router", version="1.0.0",
+                         default_response_class=FastJSONResponse)
+    router_app.state.shards = shards
+
+    @router_app.on_event("shutdown")
+    async def close_client():
+        await shards.close()
+
+    @router_app.get("/")
+    async def root():
+        """Router health plus the health of every shard"""
+        answers = await asyncio.gather(*(shards.call(i, "GET", "/") for i in range(len(shards.urls))),
+                                       return_exceptions=True)
+        nodes = [
+            {"url": url, "status": "unavailable" if isinstance(answer, Exception) else answer["status"],
+             "shard": None if isinstance(answer, Exception) else answer.get("shard")}
+            for url, answer in zip(shards.urls, answers)
+        ]
+        healthy = all(node["status"] == "healthy" for node in nodes)
+        return {"service": "SmartShop AI Shard Router", "status": "healthy" if healthy else "degraded",
+                "by": shards.by, "shards": nodes}
+
+    @router_app.post("/optimize-basket", response_model=OptimizationResult)
+    async def optimize_basket(shopping_list: ShoppingList):
+        return await shards.optimize_basket(shopping_list)
+
+    @router_app.post("/predict-prices")
+    async def predict_prices(product_ids: Optional[List[str]] = None, all_products: bool = False,
+                             horizon: Optional[int] = Query(None, ge=1, le=MAX_HORIZON_DAYS)):
+        return {"predictions": await shards.predict_prices(product_ids or [], all_products, horizon)}
+
+    @router_app.post("/recommendations")
+    async def get_recommendations(user_preferences: Dict[str, Any]):
+        return {"recommendations": await shards.recommendations(user_preferences)}
+
+    @router_app.get("/search")
+    async def search_products(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=100)):
+        return {"query": q, "results": await shards.search(q, limit)}
+
+    return router_app
+
+
+def _urls_from_environment() -> List[str]:
+    return [url.strip() for url in os.getenv("SMARTSHOP_SHARD_URLS", "").split(",") if url.strip()]
+
+
+# `uvicorn router:app` with SMARTSHOP_SHARD_URLS (shard i at position i) and SMARTSHOP_SHARD_BY
+app = create_router(_urls_from_environment(), os.getenv("SMARTSHOP_SHARD_BY", "category"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SmartShop AI shard router")
+    parser.add_argument("--local", type=int, metavar="N", help="Start N local shard processes on a synthetic catalog")
+    parser.add_argument("--by", choices=SHARD_BY, default=os.getenv("SMARTSHOP_SHARD_BY", "category"))
+    parser.add_argument("--skus", type=int, default=10000, help="Synthetic catalog size (--local)")
+    parser.add_argument("--stores", type=int, default=10, help="Number of store chains (--local)")
+    parser.add_argument("--days", type=int, default=90, help="Days of price history (--local)")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    import uvicorn
+
+    if not args.local:
+        uvicorn.run(create_router(_urls_from_environment(), args.by), host="0.0.0.0", port=args.port)
+        return
+
+    from datagen import generate_catalog
+
+    with LocalCluster(generate_catalog(args.skus, args.stores), args.local, by=args.by,
+                      base_port=args.port + 1, history_days=args.days) as cluster:
+        print(f"🧩 {args.local} shards by {args.by}: {', '.join(cluster.urls)}")
+        uvicorn.run(create_router(cluster.urls, args.by), host="0.0.0.0", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Product Search
+Diacritic-folding trigram index over product names, brands and categories
+with prefix matching, typo tolerance, ranking and incremental updates
+"""
+
+import re
+import threading
+import unicodedata
+from contextlib import contextmanager
+from functools import lru_cache
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from catalog import CatalogSnapshot, ProductCatalog
+
+# Letters NFKD does not decompose
+FOLD_TABLE = str.maketrans({"ł": "l", "Ł": "l", "ß": "ss", "æ": "ae", "ø": "o", "đ": "d"})
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)?")
+
+# Field weights: a term matching the name counts more than one matching the category
+FIELD_WEIGHTS = {"name": 1.0, "brand": 0.8, "category": 0.5}
+
+# Term scores by match quality
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.85
+FUZZY_SCORE = 0.7
+
+# Fuzzy candidates: minimum trigram Dice similarity, and how many are verified
+MIN_TRIGRAM_SIMILARITY = 0.3
+MAX_FUZZY_CANDIDATES = 32
+# Vocabulary terms a prefix may expand to
+MAX_PREFIX_EXPANSIONS = 64
+# resolve() needs every term matched above this mean term score (a category-only match is exactly 0.5)
+MIN_RESOLVE_SCORE = 0.5
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip diacritics: "Łaciate Żytni" -> "laciate zytni\""""
+    text = unicodedata.normalize("NFKD", text.translate(FOLD_TABLE).lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+@lru_cache(maxsize=65536)
+def _tokens(text: str) -> Tuple[str, ...]:
+    return tuple(token.replace(",", ".") for token in TOKEN_PATTERN.findall(fold(text)))
+
+
+def tokenize(text: str) -> List[str]:
+    """Folded terms; decimals stay whole ("3.2%" -> "3.2", "1L" -> "1l")"""
+    return list(_tokens(text))
+
+
+def trigrams(term: str) -> Set[str]:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_typos(term: str) -> int:
+    """Edits tolerated in a term; none in short terms and sizes ("500g" must not match "300g")"""
+    if len(term) < 4 or any(ch.isdigit() for ch in term):
+        return 0
+    return 1 if len(term) < 8 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance, or limit + 1 once it exceeds `limit`"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous2 is not None and i > 1 and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class _ReadWriteLock:
+    """Any number of readers or one writer; a waiting writer holds off new readers"""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+class SearchIndex:
+    """Inverted index from folded terms to products, plus a trigram index over the terms.
+
+    Postings map term -> {product id: field weight}; a query term matches
+    vocabulary terms exactly, by prefix (the last term, while typing) or
+    within a few edits (found through shared trigrams). Products are ranked
+    by how many query terms they match, then by summed term score × field
+    weight, then by rating.
+
+    The index is keyed by product id, so a catalog reload only re-indexes
+    products whose name, brand or category changed. Searches share a read
+    lock; a sync diffs the snapshot without it and holds the write lock only
+    while applying the changed products.
+    """
+
+    def __init__(self, catalog: Optional[ProductCatalog] = None):
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._vocabulary: List[str] = []  # sorted, for prefix ranges
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        # product id -> (indexed fields, dense doc number)
+        self._documents: Dict[str, Tuple[Tuple[str, str, str], int]] = {}
+        self._doc_ids: List[Optional[str]] = []
+        self._free_docs: List[int] = []
+        self._ratings = np.zeros(0)
+        self._lock = _ReadWriteLock()
+        self._sync_lock = threading.RLock()  # one sync at a time; only syncs mutate the index
+        self.catalog = catalog
+        self._snapshot: Optional[CatalogSnapshot] = None
+        if catalog is not None:
+            catalog.add_listener(self._on_catalog_change)
+
+    # Indexing
+
+    def sync(self, snapshot: CatalogSnapshot) -> Dict[str, int]:
+        """Bring the index in line with a snapshot, touching only changed products"""
+        with self._sync_lock:
+            # Diff without blocking searches: nothing else writes while we hold the sync lock
+            seen = set()
+            changed: List[Tuple[str, Tuple[str, str, str], float]] = []
+            kept_docs: List[int] = []
+            kept_ratings: List[float] = []
+            updated = 0
+            for product in snapshot.products:
+                pid = product.id
+                seen.add(pid)
+                fields = (product.name, product.brand, product.category)
+                current = self._documents.get(pid)
+                if current is None or current[0] != fields:
+                    updated += current is not None
+                    changed.append((pid, fields, product.rating))
+                else:
+                    kept_docs.append(current[1])
+                    kept_ratings.append(product.rating)
+            removed = [pid for pid in self._documents if pid not in seen]
+
+            with self._lock.write():
+                self._ratings[kept_docs] = kept_ratings
+                for pid in removed:
+                    self._remove(pid)
+                for pid, fields, rating in changed:
+                    if pid in self._documents:
+                        self._remove(pid)
+                    self._add(pid, fields, rating)
+                self._snapshot = snapshot
+            return {"added": len(changed) - updated, "updated": updated, "removed": len(removed)}
+
+    def _add(self, pid: str, fields: Tuple[str, str, str], rating: float) -> None:
+        if self._free_docs:
+            doc = self._free_docs.pop()
+            self._doc_ids[doc] = pid
+        else:
+            doc = len(self._doc_ids)
+            self._doc_ids.append(pid)
+            if doc >= len(self._ratings):
+                self._ratings = np.concatenate([self._ratings, np.zeros(max(1024, len(self._ratings)))])
+        self._ratings[doc] = rating
+        self._documents[pid] = (fields, doc)
+
+        weights: Dict[str, float] = {}
+        for field, text in zip(FIELD_WEIGHTS, fields):
+            for term in tokenize(text):
+                weights[term] = max(weights.get(term, 0.0), FIELD_WEIGHTS[field])
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                insort(self._vocabulary, term)
+                for gram in trigrams(term):
+                    self._trigrams.setdefault(gram, set()).add(term)
+            postings[pid] = weight
+            self._arrays.pop(term, None)
+
+    def _remove(self, pid: str) -> None:
+        fields, doc = self._documents.pop(pid)
+        self._doc_ids[doc] = None
+        self._free_docs.append(doc)
+        for term in {t for text in fields for t in tokenize(text)}:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(pid, None)
+            self._arrays.pop(term, None)
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect_left(self._vocabulary, term)]
+                for gram in trigrams(term):
+                    terms = self._trigrams.get(gram)
+                    if terms is not None:
+                        terms.discard(term)
+                        if not terms:
+                            del self._trigrams[gram]
+
+    def _on_catalog_change(self, product_ids: Optional[List[str]]) -> None:
+        # Price updates never touch names; only reloads need a diff
+        if product_ids is None and self._snapshot is not None:
+            self.sync(self.catalog.snapshot)
+
+    def sync_in_background(self) -> threading.Thread:
+        """Index the current catalog on a daemon thread; searches wait for it to finish"""
+        thread = threading.Thread(target=self._ensure_synced, name="search-index", daemon=True)
+        thread.start()
+        return thread
+
+    def _ensure_synced(self) -> None:
+        with self._sync_lock:
+            if self.catalog is not None and self._snapshot is None:
+                self.sync(self.catalog.snapshot)
+
+    # Queries
+
+    def _term_arrays(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self._postings[term]
+            docs = np.fromiter((self._documents[pid][1] for pid in postings), dtype=np.intp, count=len(postings))
+            arrays = self._arrays[term] = (docs, np.fromiter(postings.values(), dtype=float, count=len(postings)))
+        return arrays
+
+    def _expand(self, term: str, prefix: bool) -> Dict[str, float]:
+        """Vocabulary terms matching one query term, with their match scores"""
+        matches: Dict[str, float] = {}
+        if term in self._postings:
+            matches[term] = EXACT_SCORE
+        if prefix:
+            start = bisect_left(self._vocabulary, term)
+            for candidate in self._vocabulary[start:start + MAX_PREFIX_EXPANSIONS + 1]:
+                if not candidate.startswith(term):
+                    break
+                matches.setdefault(candidate, PREFIX_SCORE)
+
+        typos = max_typos(term)
+        if typos:
+            grams = trigrams(term)
+            shared: Dict[str, int] = {}
+            for gram in grams:
+                for candidate in self._trigrams.get(gram, ()):
+                    shared[candidate] = shared.get(candidate, 0) + 1
+            ranked = sorted(
+                ((2 * count / (len(grams) + len(candidate) + 1), candidate)
+                 for candidate, count in shared.items() if candidate not in matches),
+                reverse=True
+            )[:MAX_FUZZY_CANDIDATES]
+            for similarity, candidate in ranked:
+                if similarity < MIN_TRIGRAM_SIMILARITY:
+                    break
+                # While typing, a typo may also sit in a prefix of a longer term
+                target = candidate[:len(term)] if prefix and len(candidate) > len(term) else candidate
+                distance = edit_distance(term, target, typos)
+                if distance <= typos:
+                    score = FUZZY_SCORE * (1 - distance / (len(term) + 1))
+                    matches[candidate] = score * (PREFIX_SCORE if target is not candidate else 1.0)
+        return matches
+
+    def search(self, query: str, limit: int = 10, prefix: bool = True) -> List[Tuple[str, float]]:
+        """Best `limit` (product id, score) pairs; the last query term may be a prefix"""
+        return [(pid, score) for pid, score, _ in self._rank(query, limit, prefix)]
+
+    def _rank(self, query: str, limit: int, prefix: bool) -> List[Tuple[str, float, bool]]:
+        """Best `limit` (product id, mean term score, all terms matched) triples"""
+        self._ensure_synced()
+        with self._lock.read():
+            terms = list(dict.fromkeys(tokenize(query)))
+            if not terms or not self._doc_ids:
+                return []
+            n_docs = len(self._doc_ids)
+            total = np.zeros(n_docs)
+            matched = np.zeros(n_docs, dtype=np.int32)
+            for i, term in enumerate(terms):
+                term_scores = np.zeros(n_docs)
+                for candidate, score in self._expand(term, prefix and i == len(terms) - 1).items():
+                    docs, weights = self._term_arrays(candidate)
+                    # Docs are unique within one postings list
+                    term_scores[docs] = np.maximum(term_scores[docs], score * weights)
+                total += term_scores
+                matched += term_scores > 0
+            # Terms matched first, then score, then rating; only the best tiers are sorted
+            ranked: List[int] = []
+            for level in range(len(terms), 0, -1):
+                hits = np.flatnonzero(matched == level)
+                wanted = limit - len(ranked)
+                if len(hits) > wanted:
+                    cutoff = np.partition(total[hits], len(hits) - wanted)[len(hits) - wanted]
+                    hits = hits[total[hits] >= cutoff]
+                order = np.lexsort((-self._ratings[hits], -total[hits]))[:wanted]
+                ranked.extend(hits[order])
+                if len(ranked) >= limit:
+                    break
+            return [(self._doc_ids[doc], round(float(total[doc]) / len(terms), 4), matched[doc] == len(terms))
+                    for doc in ranked]
+
+    def resolve(self, query: str) -> Optional[str]:
+        """Product id a free-text basket item most likely means, or None.
+
+        Only a product matching every query term, at a mean term score above
+        MIN_RESOLVE_SCORE, counts; "mleko czekoladowe" must not resolve to
+        plain milk, nor a bare category word like "nabiał" to any dairy product.
+        """
+        hits = self._rank(query, 1, prefix=False)
+        if hits and hits[0][2] and hits[0][1] > MIN_RESOLVE_SCORE:
+            return hits[0][0]
+        return None
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"products": len(self._documents), "terms": len(self._postings), "trigrams": len(self._trigrams)}
+
+
+def search_results(snapshot: CatalogSnapshot, hits: Iterable[Tuple[str, float]]) -> List[Dict[str, Any]]:
+    """API rows for search hits"""
+    results = []
+    for pid, score in hits:
+        product = snapshot.get(pid)
+        if product is None:
+            continue
+        best = min(product.offers, key=lambda offer: offer.effective_price, default=None)
+        results.append({
+            "product_id": pid,
+            "name": product.name,
+            "brand": product.brand,
+            "category": product.category,
+            "rating": product.rating,
+            "best_price": best.price if best else None,
+            "best_store": best.store if best else None,
+            "score": score,
+        })
+    return results
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - JSON Serialization
+Fast JSON encoding shared by both servers: orjson when installed, a
+compact stdlib encoder otherwise, plus NDJSON and pagination helpers
+"""
+
+import json
+import math
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+# Rows serialized per chunk when streaming NDJSON
+STREAM_CHUNK_ROWS = 500
+
+
+def _default(obj: Any) -> Any:
+    """Encode what the engine hands out besides plain JSON types"""
+    if hasattr(obj, "model_dump"):  # pydantic models
+        return obj.model_dump()
+    if hasattr(obj, "tolist"):  # numpy scalars and arrays
+        return obj.tolist()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _finite(obj: Any) -> Any:
+    """Copy of `obj` with NaN and infinities as None, the way orjson writes them"""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(value) for value in obj]
+    if hasattr(obj, "model_dump") or hasattr(obj, "tolist"):
+        return _finite(_default(obj))
+    return obj
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any) -> bytes:
+        """Serialize to UTF-8 JSON bytes"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_default, allow_nan=False)
+
+    def dumps(obj: Any) -> bytes:
+        """Serialize to UTF-8 JSON bytes (NaN and infinities as null, like orjson)"""
+        try:
+            return _encoder.encode(obj).encode("utf-8")
+        except ValueError:  # a non-finite float: only then pay for the sanitizing copy
+            return _encoder.encode(_finite(obj)).encode("utf-8")
+
+
+def ndjson_chunks(rows: Iterable[Any], chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+    """NDJSON body in chunks of `chunk_rows` lines, so only one chunk is ever in memory"""
+    lines: List[bytes] = []
+    for row in rows:
+        lines.append(dumps(row))
+        if len(lines) >= chunk_rows:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+def paginate(items: List[Any], index: Dict[str, int], cursor: Optional[str],
+             limit: int) -> Dict[str, Any]:
+    """One page of `items` (anything with an `id` attribute) starting at the item whose id is `cursor`.
+
+    The cursor is the id of the first item of the next page, so pages stay
+    stable while prices change in place. Raises KeyError for an unknown cursor.
+    """
+    start = index[cursor] if cursor else 0
+    page = items[start:start + limit]
+    end = start + len(page)
+    return {
+        "items": page,
+        "next_cursor": items[end].id if end < len(items) else None,
+        "total": len(items),
+    }
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Catalog Sharding
+Partitioning of the catalog and price history across engine nodes, and a
+local multi-process cluster standing in for a real deployment
+"""
+
+import logging
+import multiprocessing
+import os
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Partition keys: whole categories per node, or products spread by id
+SHARD_BY = ("category", "hash")
+
+# Seconds a local cluster waits for its nodes to answer the health check
+STARTUP_TIMEOUT = 120.0
+
+
+def shard_of(key: str, count: int) -> int:
+    """Owning shard of a partition key; stable across processes and Python versions"""
+    return zlib.crc32(key.encode("utf-8")) % count
+
+
+@dataclass(frozen=True)
+class ShardSpec:
+    """This node's partition: shard `index` of `count`, keyed by category or product id"""
+    index: int
+    count: int
+    by: str = "category"
+
+    def __post_init__(self):
+        if self.by not in SHARD_BY:
+            raise ValueError(f"Unknown shard key: {self.by}")
+        if not 0 <= self.index < self.count:
+            raise ValueError(f"Shard index {self.index} out of range for {self.count} shards")
+
+    @classmethod
+    def parse(cls, spec: str, by: str = "category") -> "ShardSpec":
+        """"2/8" -> shard 2 of 8"""
+        index, count = spec.split("/")
+        return cls(int(index), int(count), by)
+
+    @classmethod
+    def from_environment(cls) -> Optional["ShardSpec"]:
+        """SMARTSHOP_SHARD=i/n and SMARTSHOP_SHARD_BY=category|hash; None when unsharded"""
+        spec = os.getenv("SMARTSHOP_SHARD")
+        if not spec:
+            return None
+        return cls.parse(spec, os.getenv("SMARTSHOP_SHARD_BY", "category"))
+
+    def key(self, product: Dict[str, Any]) -> str:
+        return product["category"] if self.by == "category" else product["id"]
+
+    def owns(self, product: Dict[str, Any]) -> bool:
+        return shard_of(self.key(product), self.count) == self.index
+
+    def filter(self, products: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """The products this shard holds"""
+        return [product for product in products if self.owns(product)]
+
+    def path(self, path: Optional[str]) -> Optional[str]:
+        """Per-shard variant of a snapshot/history path, so nodes never share state files"""
+        return f"{path}-shard{self.index}of{self.count}" if path else path
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+
+def _serve_shard(spec: ShardSpec, products: List[Dict[str, Any]], history_days: int, port: int) -> None:
+    """Process entry point of a LocalCluster node: main.app over one shard of `products`"""
+    import uvicorn
+
+    import main
+    from datagen import generate_history, generate_store_history
+
+    owned = spec.filter(products)
+    main.SHARD = spec
+    main._engine = main.SmartShopAI(owned, price_history=generate_history(owned, history_days),
+                                    store_history=generate_store_history(owned, history_days))
+    main._engine.catalog.add_listener(main.result_cache.invalidate)
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+class LocalCluster:
+    """N engine processes on localhost, each serving one shard of the same catalog.
+
+    Stands in for a multi-node deployment when testing the router:
+
+        with LocalCluster(generate_catalog(20000, 10), shards=4) as cluster:
+            app = create_router(cluster.urls, by=cluster.by)
+    """
+
+    def __init__(self, products: List[Dict[str, Any]], shards: int, by: str = "category",
+                 base_port: int = 8101, history_days: int = 90):
+        self.products = products
+        self.specs = [ShardSpec(i, shards, by) for i in range(shards)]
+        self.by = by
+        self.ports = [base_port + i for i in range(shards)]
+        self.history_days = history_days
+        self._processes: List[multiprocessing.Process] = []
+
+    @property
+    def urls(self) -> List[str]:
+        return [f"http://127.0.0.1:{port}" for port in self.ports]
+
+    def start(self) -> "LocalCluster":
+        context = multiprocessing.get_context("spawn")
+        for spec, port in zip(self.specs, self.ports):
+            process = context.Process(target=_serve_shard, args=(spec, self.products, self.history_days, port),
+                                      name=f"shard-{spec.index}", daemon=True)
+            process.start()
+            self._processes.append(process)
+        self._wait_ready()
+        logger.info(f"Local cluster up: {len(self.specs)} shards by {self.by} on ports {self.ports}")
+        return self
+
+    def _wait_ready(self) -> None:
+        import httpx
+
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        pending = list(self.urls)
+        while pending:
+            if time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError(f"Shards did not start: {pending}")
+            if any(not process.is_alive() for process in self._processes):
+                self.stop()
+                raise RuntimeError("A shard process exited during startup")
+            try:
+                httpx.get(pending[0] + "/", timeout=1.0).raise_for_status()
+                pending.pop(0)
+            except httpx.HTTPError:
+                time.sleep(0.2)
+
+    def stop(self) -> None:
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join(timeout=5)
+        self._processes = []
+
+    def __enter__(self) -> "LocalCluster":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -5,13 +5,43 @@ Basic AI functionality without heavy dependencies
 """
 
 import json
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
+import argparse
+import os
+import signal
 import socket
+import threading
+import time
 from datetime import datetime
 import random
 
+from serialization import dumps
+
+# Worker supervision: restart delay doubles per recent crash, and the
+# supervisor gives up after this many restarts within the window
+RESTART_BACKOFF = 0.5
+MAX_RESTART_BACKOFF = 30.0
+MAX_RESTARTS = 5
+RESTART_WINDOW = 60.0
+
 class SmartShopAIHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections alive between requests; every response
+    # therefore carries a Content-Length
+    protocol_version = "HTTP/1.1"
+    # Idle keep-alive connections are dropped after this many seconds
+    timeout = 15
+    # Headers and body go out in separate writes; without TCP_NODELAY every
+    # keep-alive response stalls ~40 ms on Nagle + delayed ACK
+    disable_nagle_algorithm = True
+    
+    def handle_one_request(self):
+        # Wait for the next request where shutdown can see and close the idle connection
+        if not self.server.wait_for_request(self):
+            self.close_connection = True
+            return
+        super().handle_one_request()
+    
     def _set_cors_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
@@ -20,6 +50,7 @@ class SmartShopAIHandler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         self.send_response(200)
         self._set_cors_headers()
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def do_GET(self):
@@ -217,42 +248,177 @@ class SmartShopAIHandler(BaseHTTPRequestHandler):
         self._send_json_response(trends)
     
     def _handle_404(self):
-        self.send_response(404)
-        self._set_cors_headers()
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
         response = {"error": "Not found", "path": self.path}
-        self.wfile.write(json.dumps(response).encode())
+        self._send_json_response(response, status=404)
     
-    def _send_json_response(self, data):
-        self.send_response(200)
+    def _send_json_response(self, data, status=200):
+        body = dumps(data)  # orjson when installed, compact stdlib JSON otherwise
+        self.send_response(status)
         self._set_cors_headers()
-        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        self.wfile.write(body)
+
+class SmartShopAIServer(ThreadingHTTPServer):
+    """One thread per connection; in-flight requests finish on shutdown.
+    
+    Keep-alive connections waiting for their next request are closed when
+    the server closes, so draining never waits out the idle timeout.
+    """
+    daemon_threads = False
+    block_on_close = True
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._idle = set()
+        self._dropped = set()
+        self._idle_lock = threading.Lock()
+        self._draining = False
+    
+    def wait_for_request(self, handler):
+        """Block until the next request starts arriving; False if the connection closed or the server is draining"""
+        connection = handler.connection
+        with self._idle_lock:
+            if self._draining:
+                return False
+            self._idle.add(connection)
+        try:
+            arrived = bool(handler.rfile.peek(1))
+        except OSError:  # idle timeout or reset
+            arrived = False
+        with self._idle_lock:
+            self._idle.discard(connection)
+            # A request racing the shutdown may be cut short; drop it rather than read half of it
+            if connection in self._dropped:
+                self._dropped.discard(connection)
+                return False
+        return arrived
+    
+    def close_idle_connections(self):
+        with self._idle_lock:
+            self._draining = True
+            for connection in self._idle:
+                try:
+                    connection.shutdown(socket.SHUT_RD)
+                except OSError:
+                    pass
+            self._dropped.update(self._idle)
+    
+    def server_close(self):
+        self.close_idle_connections()
+        super().server_close()  # joins the connection threads
 
 def is_port_in_use(port):
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         return s.connect_ex(('localhost', port)) == 0
 
+def serve_until_signalled(server):
+    """Serve until SIGTERM/SIGINT, then stop accepting and drain in-flight requests"""
+    def request_shutdown(signum, frame):
+        # shutdown() blocks until serve_forever returns, so call it off-thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    
+    signal.signal(signal.SIGTERM, request_shutdown)
+    signal.signal(signal.SIGINT, request_shutdown)
+    server.serve_forever()
+    server.server_close()
+
+def run_prefork(server, workers):
+    """Fork `workers` processes that all accept on the shared listening socket.
+    
+    Crashed workers are restarted with exponential backoff; after more than
+    MAX_RESTARTS crashes within RESTART_WINDOW seconds every worker is
+    stopped and False is returned.
+    """
+    children = {}
+    stopping = False
+    restarts = []
+    
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                serve_until_signalled(server)
+            finally:
+                os._exit(0)
+        children[pid] = True
+    
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    
+    for _ in range(workers):
+        spawn()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.pop(pid, None)
+        if stopping:
+            continue
+        now = time.monotonic()
+        restarts = [t for t in restarts if now - t < RESTART_WINDOW] + [now]
+        if len(restarts) > MAX_RESTARTS:
+            print(f"❌ Workers crashed {len(restarts)} times in {RESTART_WINDOW:.0f}s, shutting down")
+            stop(None, None)
+            continue
+        delay = min(MAX_RESTART_BACKOFF, RESTART_BACKOFF * 2 ** (len(restarts) - 1))
+        print(f"⚠️ Worker {pid} exited unexpectedly, restarting in {delay:.1f}s")
+        deadline = now + delay
+        while not stopping and time.monotonic() < deadline:
+            time.sleep(0.1)
+        if not stopping:
+            spawn()
+    server.server_close()
+    return len(restarts) <= MAX_RESTARTS
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="SmartShop AI Engine (Simple)")
+    parser.add_argument('--host', default='localhost', help='Address to bind (default: localhost)')
+    parser.add_argument('--port', type=int, default=None,
+                        help='Port to bind (default: 8000, falling back to 8001 if busy)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes sharing the socket, each serving connections on threads (default: 1)')
+    return parser.parse_args()
+
 def main():
-    port = 8000
+    args = parse_args()
+    port = args.port
     
-    # Check if port is already in use
-    if is_port_in_use(port):
-        print(f"❌ Port {port} is already in use")
-        print("🔄 Trying port 8001...")
-        port = 8001
+    if port is None:
+        port = 8000
         
+        # Check if port is already in use
         if is_port_in_use(port):
-            print(f"❌ Port {port} is also in use")
-            print("Please stop other services or use a different port")
-            return
+            print(f"❌ Port {port} is already in use")
+            print("🔄 Trying port 8001...")
+            port = 8001
+            
+            if is_port_in_use(port):
+                print(f"❌ Port {port} is also in use")
+                print("Please stop other services or use a different port")
+                return
     
-    server = HTTPServer(('localhost', port), SmartShopAIHandler)
+    server = SmartShopAIServer((args.host, port), SmartShopAIHandler)
+    workers = max(1, args.workers)
+    if workers > 1 and not hasattr(os, 'fork'):
+        print("⚠️ Pre-fork workers need os.fork(); running a single threaded worker")
+        workers = 1
     
     print("🤖 SmartShop AI Engine (Simple) starting...")
-    print(f"🚀 Server running on http://localhost:{port}")
+    print(f"🚀 Server running on http://{args.host}:{port} ({workers} worker{'s' if workers > 1 else ''})")
     print("📊 Available endpoints:")
     print("   GET  /                     - Health check")
     print("   POST /optimize-basket      - Basket optimization")
@@ -261,11 +427,14 @@ def main():
     print("   GET  /analytics/market-trends - Market trends")
     print("\n✨ AI Engine ready to serve requests!")
     
-    try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        print("\n🛑 Shutting down AI Engine...")
-        server.shutdown()
+    healthy = True
+    if workers > 1:
+        healthy = run_prefork(server, workers)
+    else:
+        serve_until_signalled(server)
+    print("\n🛑 AI Engine stopped.")
+    if not healthy:
+        raise SystemExit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Engine State Snapshot
+Prebuilt binary snapshot of catalog indexes and price history for fast startup
+
+Layout of a snapshot directory:
+    manifest.json   format version, sizes, build time
+    catalog.pkl     pickled CatalogSnapshot (indexes and price arrays included)
+    history/        PriceHistoryStore files, memory-mapped on load
+    store_history/  per-store (offer) PriceHistoryStore files, when recorded
+
+Snapshots are trusted local build artifacts (they are unpickled on load);
+never point SMARTSHOP_SNAPSHOT at files from an untrusted source.
+"""
+
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+from datetime import datetime
+from typing import Optional, Tuple
+
+from catalog import CatalogSnapshot
+from price_history import PriceHistoryStore
+
+SNAPSHOT_FORMAT = 1
+
+MANIFEST_FILE = "manifest.json"
+CATALOG_FILE = "catalog.pkl"
+HISTORY_DIR = "history"
+STORE_HISTORY_DIR = "store_history"
+
+
+def snapshot_exists(path: str) -> bool:
+    return os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+
+def save_snapshot(path: str, catalog: CatalogSnapshot, history: PriceHistoryStore,
+                  store_history: Optional[PriceHistoryStore] = None) -> None:
+    """Write a snapshot atomically: build in a temp dir, then rename into place"""
+    tmp = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    with open(os.path.join(tmp, CATALOG_FILE), "wb") as f:
+        pickle.dump(catalog, f, protocol=pickle.HIGHEST_PROTOCOL)
+    history.save(os.path.join(tmp, HISTORY_DIR))
+    if store_history is not None:
+        store_history.save(os.path.join(tmp, STORE_HISTORY_DIR))
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "created": datetime.now().isoformat(),
+        "catalog_version": catalog.version,
+        "products": len(catalog),
+        "stores": len(catalog.stores),
+        "history_days": history.n_days,
+    }
+    with open(os.path.join(tmp, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # Another worker published the snapshot first (or an old one exists)
+        if not snapshot_exists(path):
+            shutil.rmtree(path, ignore_errors=True)
+            os.rename(tmp, path)
+        else:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_snapshot(path: str) -> Tuple[CatalogSnapshot, PriceHistoryStore]:
+    """Load the catalog and memory-map the price history of a snapshot"""
+    with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format')} in {path}")
+
+    with open(os.path.join(path, CATALOG_FILE), "rb") as f:
+        catalog = pickle.load(f)
+    history = PriceHistoryStore.open(os.path.join(path, HISTORY_DIR))
+    return catalog, history
+
+
+def load_store_history(path: str) -> Optional[PriceHistoryStore]:
+    """Memory-map the per-store price history of a snapshot (None if it has none)"""
+    target = os.path.join(path, STORE_HISTORY_DIR)
+    return PriceHistoryStore.open(target) if os.path.isdir(target) else None
+
+
+def main():
+    """Build a snapshot from the current engine data: python snapshot.py <path>"""
+    if len(sys.argv) != 2:
+        print("Usage: python snapshot.py <snapshot-dir>")
+        sys.exit(1)
+
+    from main import SmartShopAI
+
+    path = sys.argv[1]
+    started = time.perf_counter()
+    engine = SmartShopAI()
+    shutil.rmtree(path, ignore_errors=True)
+    save_snapshot(path, engine.catalog.snapshot, engine.price_history, engine.store_history)
+    print(f"📦 Snapshot written to {path} in {time.perf_counter() - started:.2f}s "
+          f"({len(engine.catalog)} products, {engine.price_history.n_days} days)")
+
+
+if __name__ == "__main__":
+    main()
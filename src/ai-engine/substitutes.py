@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+SmartShop AI - Substitute Products
+Same-category, similar-size alternatives per product, ranked by price and
+rating, for bringing over-budget baskets under budget
+"""
+
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from catalog import CatalogSnapshot, ProductCatalog
+
+# Pack size in a product name: "1L", "500g", "1.5 kg", "6x1.5L"
+SIZE_PATTERN = re.compile(r"(?:(\d+)\s*x\s*)?(\d+(?:[.,]\d+)?)\s*(kg|g|ml|l)(?!\w)", re.IGNORECASE)
+UNITS = {"g": ("g", 1.0), "kg": ("g", 1000.0), "ml": ("ml", 1.0), "l": ("ml", 1000.0)}
+
+# A substitute's size must be within this factor of the original's
+SIZE_TOLERANCE = 1.35
+
+# Substitutes kept per product (spread over the price/rating frontier)
+MAX_SUBSTITUTES = 8
+
+# Loss charged per swapped item on top of its rating loss: small enough never
+# to outweigh a 0.1 rating step, so among equal rating losses fewer swaps win
+SWAP_PENALTY = 0.001
+
+GroupKey = Tuple[str, str, Optional[str]]
+
+
+def parse_size(name: str) -> Optional[Tuple[str, float]]:
+    """(unit, amount in g or ml) of the pack size in a product name, if any"""
+    match = SIZE_PATTERN.search(name)
+    if match is None:
+        return None
+    count, amount, unit = match.groups()
+    base, scale = UNITS[unit.lower()]
+    return base, float(amount.replace(",", ".")) * scale * int(count or 1)
+
+
+def product_kind(name: str) -> str:
+    """Leading word of the name ("Mleko", "Chleb"): what the product is"""
+    return name.split(maxsplit=1)[0].lower() if name.strip() else ""
+
+
+class Substitutes:
+    """Substitute candidates for one catalog snapshot.
+
+    Products are grouped by (category, kind, size unit) and sorted by size
+    at build time. A product's substitutes are the group members within
+    SIZE_TOLERANCE of its size that are cheaper (lowest offer) and not
+    dominated: no cheaper candidate is rated at least as well. Lists are
+    computed on first use and kept until prices in the catalog change.
+    """
+
+    def __init__(self, catalog: CatalogSnapshot):
+        self.catalog = catalog
+        n = len(catalog)
+        self.sizes = np.full(n, np.nan)
+        self.ratings = np.array([product.rating for product in catalog.products], dtype=float)
+        self.lowest = self._lowest_prices(np.arange(n))
+        self.group_of: List[GroupKey] = []
+
+        members: Dict[GroupKey, List[int]] = {}
+        for row, product in enumerate(catalog.products):
+            size = parse_size(product.name)
+            key = (product.category, product_kind(product.name), size[0] if size else None)
+            if size:
+                self.sizes[row] = size[1]
+            self.group_of.append(key)
+            members.setdefault(key, []).append(row)
+
+        # Group rows sorted by size, with the sizes alongside for bisection
+        self._groups: Dict[GroupKey, Tuple[np.ndarray, np.ndarray]] = {}
+        for key, rows in members.items():
+            rows = np.array(rows, dtype=np.intp)
+            if key[2] is not None:
+                rows = rows[np.argsort(self.sizes[rows], kind="stable")]
+            self._groups[key] = (rows, self.sizes[rows])
+        self._memo: Dict[int, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def _lowest_prices(self, rows: np.ndarray) -> np.ndarray:
+        prices = self.catalog.prices[rows]
+        sold = np.isfinite(prices).any(axis=1)
+        lowest = np.full(len(rows), np.inf)
+        lowest[sold] = np.nanmin(prices[sold], axis=1)
+        return lowest
+
+    def of(self, row: int, limit: int = MAX_SUBSTITUTES) -> List[int]:
+        """Substitute rows for a product row, cheapest first"""
+        substitutes = self._memo.get(row)
+        if substitutes is None:
+            substitutes = self._memo[row] = self._find(row, limit)
+        return substitutes
+
+    def _find(self, row: int, limit: int) -> List[int]:
+        key = self.group_of[row]
+        rows, sizes = self._groups[key]
+        if key[2] is not None:
+            size = self.sizes[row]
+            lo = np.searchsorted(sizes, size / SIZE_TOLERANCE, side="left")
+            hi = np.searchsorted(sizes, size * SIZE_TOLERANCE, side="right")
+            rows = rows[lo:hi]
+        rows = rows[(rows != row) & (self.lowest[rows] < self.lowest[row])]
+        if not len(rows):
+            return []
+
+        # Price/rating frontier: cheapest first, each better rated than all cheaper ones
+        rows = rows[np.lexsort((-self.ratings[rows], self.lowest[rows]))]
+        ratings = self.ratings[rows]
+        frontier = rows[ratings > np.maximum.accumulate(np.concatenate(([-np.inf], ratings[:-1])))]
+        if len(frontier) > limit:
+            frontier = frontier[np.linspace(0, len(frontier) - 1, limit).round().astype(np.intp)]
+        return [int(r) for r in frontier]
+
+    def refresh_rows(self, rows: Iterable[int]) -> None:
+        """Re-read the lowest prices of rows whose offers changed"""
+        rows = np.fromiter(rows, dtype=np.intp)
+        with self._lock:
+            self.lowest[rows] = self._lowest_prices(rows)
+            # Any memoized list may now include or miss these rows
+            self._memo = {}
+
+
+class SubstituteIndex:
+    """Keeps Substitutes in sync with a ProductCatalog"""
+
+    def __init__(self, catalog: ProductCatalog):
+        self.catalog = catalog
+        self._lock = threading.Lock()
+        self._substitutes: Optional[Substitutes] = None
+        catalog.add_listener(self._on_catalog_change)
+
+    @property
+    def substitutes(self) -> Substitutes:
+        substitutes = self._substitutes
+        snapshot = self.catalog.snapshot
+        if substitutes is None or substitutes.catalog is not snapshot:
+            with self._lock:
+                if self._substitutes is None or self._substitutes.catalog is not snapshot:
+                    self._substitutes = Substitutes(snapshot)
+                substitutes = self._substitutes
+        return substitutes
+
+    def _on_catalog_change(self, product_ids: Optional[List[str]]) -> None:
+        if product_ids is None:
+            return  # new snapshot; rebuilt lazily on next use
+        substitutes = self._substitutes
+        if substitutes is not None and substitutes.catalog is self.catalog.snapshot:
+            substitutes.refresh_rows(substitutes.catalog.id_index[pid] for pid in product_ids)
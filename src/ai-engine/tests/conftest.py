@@ -0,0 +1,6 @@
+"""Engine modules are flat (imported as `from catalog import ...`); make them importable from tests"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
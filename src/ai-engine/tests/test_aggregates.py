@@ -0,0 +1,117 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from aggregates import MarketAggregates
+from catalog import CatalogSnapshot
+from datagen import generate_history, generate_store_history
+from main import PriceDelta, SmartShopAI
+from price_history import PriceHistoryStore, offer_key
+
+START = date(2026, 10, 1)
+
+
+def _product(pid, category, offers):
+    return {"id": pid, "name": f"Produkt {pid}", "category": category, "brand": "Marka",
+            "prices": [{"store": store, "price": price, "discount": 0.0} for store, price in offers],
+            "rating": 4.0, "availability": len(offers)}
+
+
+PRODUCTS = [
+    _product("1", "Nabiał", [("LIDL", 4.0), ("Auchan", 5.0)]),
+    _product("2", "Nabiał", [("LIDL", 6.0)]),
+    _product("3", "Pieczywo", [("Auchan", 3.0)]),
+]
+
+
+def _aggregates():
+    catalog = CatalogSnapshot(PRODUCTS)
+    lowest = np.array([[4.0, 4.0, 4.0], [6.0, 6.0, 6.0], [3.0, 3.0, 3.0]])
+    history = PriceHistoryStore.from_matrix(["1", "2", "3"], START, lowest)
+    keys = [offer_key("1", "LIDL"), offer_key("1", "Auchan"), offer_key("2", "LIDL"), offer_key("3", "Auchan")]
+    offers = np.array([[4.0, 4.0, 4.0], [5.0, 6.0, 7.0], [6.0, 6.0, 6.0], [3.0, 3.0, 3.0]])
+    return MarketAggregates(catalog, history, PriceHistoryStore.from_matrix(keys, START, offers))
+
+
+def test_store_slices_average_the_chain_own_prices():
+    aggregates = _aggregates()
+
+    assert aggregates.mean_price(0, 2, ["Nabiał"]) == 5.0
+    assert aggregates.mean_price(0, 2, ["Nabiał"], ["LIDL"]) == 5.0
+    assert aggregates.mean_price(0, 2, ["Nabiał"], ["Auchan"]) == 6.0
+    assert aggregates.daily_means(0, 2, stores=["Auchan"]) == [4.0, 4.5, 5.0]
+    assert aggregates.price_index(["Nabiał"], ["Auchan"]) == 140.0
+    assert aggregates.price_index(["Nabiał"], ["LIDL"]) == 100.0
+    assert aggregates.mean_price(0, 2, stores=["Carrefour"]) is None
+
+
+def test_store_slices_follow_offers_recorded_after_the_build():
+    aggregates = _aggregates()
+    history, offers = aggregates.lowest.history, aggregates.offers.history
+    history.add_listener(aggregates.lowest.on_history_change)
+    offers.add_listener(aggregates.offers.on_history_change)
+    day = START + timedelta(days=3)
+
+    history.record_prices(["2"], day, np.array([9.0]))
+    offers.record_prices([offer_key("2", "LIDL"), offer_key("1", "Auchan")], day, np.array([9.0, np.nan]))
+
+    assert aggregates.daily_means(-1, -1, ["Nabiał"], ["LIDL"]) == [6.5]
+    assert aggregates.daily_means(-1, -1, ["Nabiał"], ["Auchan"]) == [None]
+    rebuilt = MarketAggregates(aggregates.catalog, history, offers)
+    for stores in (None, ["LIDL"], ["Auchan"], ["LIDL", "Auchan"]):
+        assert aggregates.window(0, -1, stores=stores) == rebuilt.window(0, -1, stores=stores)
+        assert aggregates.daily_means(0, -1, stores=stores) == rebuilt.daily_means(0, -1, stores=stores)
+
+
+def test_ingest_records_per_store_prices_into_the_store_slice():
+    today = date.today()
+    engine = SmartShopAI(PRODUCTS, price_history=generate_history(PRODUCTS, 20, end=today),
+                         store_history=generate_store_history(PRODUCTS, 20, end=today))
+    before = engine.price_aggregates(["Nabiał"], ["Auchan"], today, today)
+
+    now = datetime.now()
+    engine.ingest_price_deltas([PriceDelta(product_id="1", store="Auchan", price=2.0, timestamp=now)])
+    after = engine.price_aggregates(["Nabiał"], ["Auchan"], today, today)
+    lidl = engine.price_aggregates(["Nabiał"], ["LIDL"], today, today)
+
+    assert before["price_points"] == after["price_points"] == 1
+    assert after["mean_price"] == 2.0
+    assert lidl["price_points"] == 2
+    assert engine.store_history.series(offer_key("1", "Auchan"))[1][-1] == 2.0
+
+    engine.ingest_price_deltas([PriceDelta(product_id="1", store="Auchan", price=2.0, removed=True, timestamp=now)])
+    assert engine.price_aggregates(["Nabiał"], ["Auchan"], today, today)["price_points"] == 0
+
+
+def test_store_slices_start_with_the_current_offers_when_nothing_was_recorded():
+    engine = SmartShopAI(PRODUCTS, price_history=generate_history(PRODUCTS, 20, end=date.today()))
+
+    summary = engine.price_aggregates(stores=["LIDL"])
+    assert summary["price_points"] == 2 and summary["mean_price"] == 5.0
+    assert summary["daily_mean_prices"][:-1] == [None] * 19
+    assert summary["price_changes"] == {"week": None, "month": None}
+    assert engine.price_aggregates()["price_points"] == 60
+
+
+def test_generated_store_history_covers_every_offer():
+    history = generate_store_history(PRODUCTS, 10, end=START)
+
+    assert sorted(history.product_ids) == sorted(
+        offer_key(p["id"], offer["store"]) for p in PRODUCTS for offer in p["prices"])
+    assert history.last_date == np.datetime64(START) and history.n_days == 10
+
+
+def test_market_trends_breaks_changes_down_per_chain():
+    from jobs import market_trends
+
+    today = date.today()
+    engine = SmartShopAI(PRODUCTS, price_history=generate_history(PRODUCTS, 20, end=today),
+                         store_history=generate_store_history(PRODUCTS, 20, end=today))
+    aggregates = engine.market_aggregates.aggregates
+
+    chains = market_trends(engine)["chains"]
+    assert set(chains) == {"LIDL", "Auchan"}
+    for store, changes in chains.items():
+        assert changes == aggregates.changes(stores=[store])
+        assert changes["week"] is not None and changes["month"] is None
+    assert chains["LIDL"] != chains["Auchan"]
@@ -0,0 +1,35 @@
+from datetime import date
+
+import numpy as np
+
+from datagen import generate_catalog, generate_history, product_keys
+
+
+def test_catalog_and_history_are_deterministic():
+    products = generate_catalog(300, 5, seed=7)
+    assert products == generate_catalog(300, 5, seed=7)
+    assert products != generate_catalog(300, 5, seed=8)
+    # A product's data does not depend on the rest of the catalog
+    assert generate_catalog(50, 5, seed=7) == products[:50]
+
+    history = generate_history(products, 30, seed=7, end=date(2026, 10, 1))
+    again = generate_history(products[100:], 30, seed=7, end=date(2026, 10, 1))
+    assert history.start == np.datetime64("2026-09-02")
+    np.testing.assert_array_equal(history.prices[100:], again.prices)
+    assert np.isfinite(history.prices).all() and (history.prices > 0).all()
+
+
+def test_history_skips_products_without_offers():
+    products = generate_catalog(10, 3)
+    products[3]["prices"] = []
+
+    history = generate_history(products, 14)
+
+    assert len(history) == 9 and products[3]["id"] not in history
+    assert np.isfinite(history.prices).all()
+
+
+def test_any_integer_seed_is_accepted():
+    keys = product_keys(["1", "2"], seed=-1)
+    np.testing.assert_array_equal(keys, product_keys(["1", "2"], seed=2 ** 64 - 1))
+    assert len(set(product_keys(["1"], seed=s)[0] for s in (-2, -1, 0, 1))) == 4
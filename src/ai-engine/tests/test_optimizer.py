@@ -0,0 +1,72 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from optimizer import solve_budget, solve_store_subset
+
+
+def _brute_force_subset(costs, visit_cost, max_stores):
+    """Cheapest item + visit cost over every store subset of up to max_stores stores"""
+    buyable = np.isfinite(costs).any(axis=1)
+    if not buyable.any():
+        return 0.0
+    best = np.inf
+    for k in range(1, max_stores + 1):
+        for stores in itertools.combinations(range(costs.shape[1]), k):
+            item_cost = costs[buyable][:, stores].min(axis=1)
+            if np.isfinite(item_cost).all():
+                best = min(best, item_cost.sum() + k * visit_cost)
+    return best
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_store_subset_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    n_items, n_stores = rng.integers(1, 9), rng.integers(1, 7)
+    costs = np.round(rng.uniform(1, 20, (n_items, n_stores)), 2)
+    costs[rng.random((n_items, n_stores)) < 0.3] = np.inf
+    visit_cost = float(rng.choice([0.0, 2.5, 8.0]))
+    max_stores = int(rng.integers(1, n_stores + 1))
+
+    plan = solve_store_subset(costs, visit_cost, max_stores)
+
+    expected = _brute_force_subset(costs, visit_cost, max_stores)
+    if np.isfinite(expected):
+        assert plan.total_cost == pytest.approx(expected)
+        assert len(plan.stores) <= max_stores
+        bought = plan.assignment >= 0
+        assert set(plan.assignment[bought]) <= set(plan.stores)
+        assert costs[bought, plan.assignment[bought]].sum() == pytest.approx(plan.item_cost)
+    unbuyable = ~np.isfinite(costs).any(axis=1)
+    assert (plan.assignment[unbuyable] == -1).all()
+
+
+def _brute_force_budget(costs, losses, budget):
+    best = None
+    for choices in itertools.product(*(range(len(c)) for c in costs)):
+        cost = sum(c[j] for c, j in zip(costs, choices))
+        loss = sum(l[j] for l, j in zip(losses, choices))
+        if cost <= budget + 1e-9 and (best is None or (loss, cost) < best):
+            best = (loss, cost)
+    return best
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_budget_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    n_items = rng.integers(1, 6)
+    costs = [np.round(rng.uniform(1, 15, rng.integers(1, 4)), 2) for _ in range(n_items)]
+    losses = [np.concatenate([[0.0], np.round(rng.uniform(0.1, 2, len(c) - 1), 2)]) for c in costs]
+    budget = round(float(sum(c.min() for c in costs) * rng.uniform(0.9, 1.5)), 2)
+
+    plan = solve_budget(costs, losses, budget)
+
+    expected = _brute_force_budget(costs, losses, budget)
+    if expected is None:
+        assert not plan.within_budget
+        assert plan.choices == [int(np.argmin(c)) for c in costs]
+    else:
+        assert plan.within_budget
+        assert plan.cost <= budget + 1e-9
+        assert (plan.loss, plan.cost) == pytest.approx(expected)
@@ -0,0 +1,73 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+from datagen import generate_catalog, generate_history
+from main import PriceDelta, SmartShopAI
+from price_history import MAX_APPEND_DAYS, PriceHistoryStore
+
+
+def _store(n_days=5):
+    prices = np.arange(2 * n_days, dtype=np.float32).reshape(2, n_days) + 1
+    return PriceHistoryStore.from_matrix(["1", "2"], date(2026, 10, 1), prices)
+
+
+def test_record_prices_appends_days_carrying_prices_forward():
+    history = _store()
+
+    assert history.record_prices(["2", "unknown"], date(2026, 10, 8), np.array([9.5, 1.0])) == 1
+    assert history.n_days == 8
+    assert history.series("1")[1][-3:].tolist() == [5.0, 5.0, 5.0]
+    assert history.series("2")[1][-3:].tolist() == [10.0, 10.0, 9.5]
+
+
+def test_record_prices_rejects_days_out_of_range():
+    history = _store()
+
+    with pytest.raises(ValueError):
+        history.record_prices(["1"], date(2026, 9, 30), np.array([1.0]))
+    with pytest.raises(ValueError):
+        history.record_prices(["1"], history.last_date + MAX_APPEND_DAYS + 1, np.array([1.0]))
+    assert history.n_days == 5
+
+
+def test_ingest_rejects_deltas_past_the_append_limit_before_applying_them():
+    products = generate_catalog(3, 2, seed=1)
+    end = date.today() - timedelta(days=MAX_APPEND_DAYS + 10)
+    engine = SmartShopAI(products, price_history=generate_history(products, 30, end=end))
+    offer = products[0]["prices"][0]
+
+    result = engine.ingest_price_deltas([
+        PriceDelta(product_id=products[0]["id"], store=offer["store"], price=offer["price"] + 1, timestamp=datetime.now())
+    ])
+    assert result == {"products_updated": 0, "history_points": 0, "rejected": 1}
+    assert engine.catalog.get(products[0]["id"]).offers[0].price == offer["price"]
+    assert engine.price_history.last_date == np.datetime64(end)
+
+
+def test_predictions_skip_products_without_any_recorded_price():
+    products = generate_catalog(3, 2, seed=1)
+    ids = [product["id"] for product in products]
+    prices = generate_history(products, 30).prices.copy()
+    prices[1] = np.nan
+    engine = SmartShopAI(products, price_history=PriceHistoryStore.from_matrix(ids, date.today() - timedelta(days=29), prices))
+
+    predictions = engine.predict_price_trends(ids, horizon=7)
+    assert [p.product_id for p in predictions] == [ids[0], ids[2]]
+    assert all(np.isfinite([p.predicted_price, p.confidence, *p.forecast]).all() for p in predictions)
+    assert [p.product_id for p in engine.predict_all_price_trends()] == [ids[0], ids[2]]
+
+
+def test_refresh_picks_up_days_appended_by_another_process(tmp_path):
+    writer = _store().save(str(tmp_path))
+    reader = PriceHistoryStore.open(str(tmp_path))
+    changes = []
+    reader.add_listener(lambda *args: changes.append(args))
+
+    assert not reader.refresh()
+    writer.append_day(np.array([7.0, 8.0], dtype=np.float32))
+    assert reader.refresh()
+    assert reader.n_days == 6 and reader.prices[:, -1].tolist() == [7.0, 8.0]
+    assert changes == [(None, None, None, None)]
+    assert not reader.refresh()
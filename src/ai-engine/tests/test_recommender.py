@@ -0,0 +1,33 @@
+import numpy as np
+
+from catalog import ProductCatalog
+from recommender import Recommender
+
+
+def _product(product_id, category, prices, rating=4.8):
+    return {
+        "id": product_id,
+        "name": f"Produkt {product_id}",
+        "category": category,
+        "brand": "Łaciate",
+        "prices": prices,
+        "rating": rating,
+        "availability": len(prices),
+    }
+
+
+def test_products_without_offers_are_not_recommended():
+    catalog = ProductCatalog([
+        _product("1", "Nabiał", [{"store": "LIDL", "price": 3.49, "discount": 0.5}]),
+        _product("2", "Nabiał", []),
+        _product("3", "Nabiał", [{"store": "Biedronka", "price": 4.19, "discount": 0.0},
+                                 {"store": "LIDL", "price": 3.99, "discount": 0.0}]),
+    ])
+    features = Recommender(catalog).features
+
+    assert np.isnan(features.min_price[1])
+    assert features.best_offer[1] == -1
+    rows, scores = features.top_k({"categories": ["Nabiał"], "brands": ["Łaciate"]})
+    assert [catalog.snapshot.products[row].id for row in rows] == ["1", "3"]
+    assert features.best_offer[2] == 1
+
@@ -0,0 +1,98 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+from datagen import generate_catalog, generate_history
+from main import ShoppingList, SmartShopAI
+from router import ShardRouter
+from sharding import ShardSpec
+
+N_SHARDS = 2
+
+
+class ShardTransport(httpx.AsyncBaseTransport):
+    """main.app over ASGI, serving http://shard<i> from the engine of shard i.
+
+    The engine is a module global of main, so requests are served one at a time.
+    """
+
+    def __init__(self, engines):
+        self.engines = engines
+        self.inner = httpx.ASGITransport(app=main.app)
+        self.lock = asyncio.Lock()
+
+    async def handle_async_request(self, request):
+        async with self.lock:
+            shard = int(request.url.host[len("shard"):])
+            main._engine = self.engines[shard]
+            return await self.inner.handle_async_request(request)
+
+
+@pytest.fixture(scope="module")
+def products():
+    return generate_catalog(600, 6, seed=3)
+
+
+@pytest.fixture
+def router(products, monkeypatch):
+    monkeypatch.setattr(main, "_engine", None)
+    engines = []
+    for i in range(N_SHARDS):
+        owned = ShardSpec(i, N_SHARDS, "category").filter(products)
+        engines.append(SmartShopAI(owned, price_history=generate_history(owned, 30)))
+    shards = ShardRouter([f"http://shard{i}" for i in range(N_SHARDS)], by="category")
+    shards._client = httpx.AsyncClient(transport=ShardTransport(engines))
+    yield shards
+    asyncio.run(shards.close())
+
+
+def _basket(products, **options):
+    # Items from several categories, so both shards hold some of them
+    picked = products[:12]
+    assert len({ShardSpec(0, N_SHARDS, "category").owns(p) for p in picked}) == 2
+    return ShoppingList(items=[{"product_id": p["id"], "quantity": 1 + i % 3} for i, p in enumerate(picked)],
+                        **options)
+
+
+def _comparable(result):
+    """What the plan costs the shopper; stores may differ where effective prices tie"""
+    paid = sum(line["total_price"] - line["savings"] for line in result.optimized_list)
+    return (round(paid, 2), len(result.selected_stores or ()), result.trip_cost,
+            [(line["product_id"], line.get("substitute_for"), line["quantity"]) for line in result.optimized_list])
+
+
+@pytest.mark.parametrize("options", [
+    {"optimization_mode": "multi_store", "store_visit_cost": 4.0},
+    {"optimization_mode": "multi_store", "max_stores": 2},
+])
+def test_multi_store_basket_is_planned_once_across_shards(router, products, options):
+    shopping_list = _basket(products, **options)
+
+    merged = asyncio.run(router.optimize_basket(shopping_list))
+
+    expected = SmartShopAI(products, price_history=generate_history(products, 30)).optimize_shopping_basket(
+        shopping_list)
+    assert _comparable(merged) == _comparable(expected)
+    assert len(merged.optimized_list) == 12
+    assert set(merged.store_distribution[s] > 0 for s in merged.selected_stores) == {True}
+
+
+def test_budget_basket_swaps_substitutes_across_shards(router, products):
+    single = SmartShopAI(products, price_history=generate_history(products, 30))
+    greedy_cost = single.optimize_shopping_basket(_basket(products)).total_cost
+    shopping_list = _basket(products, optimization_mode="budget", budget=round(greedy_cost * 0.9, 2))
+
+    merged = asyncio.run(router.optimize_basket(shopping_list))
+
+    expected = single.optimize_shopping_basket(shopping_list)
+    assert _comparable(merged) == _comparable(expected)
+    assert any("substitute_for" in line for line in merged.optimized_list)
+    assert merged.total_cost < greedy_cost
+
+
+def test_greedy_baskets_are_not_served_options(router, products):
+    with pytest.raises(Exception) as error:
+        asyncio.run(router.call(0, "POST", "/optimize-basket/options", json=_basket(products).model_dump()))
+    assert error.value.status_code == 400
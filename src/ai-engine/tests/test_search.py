@@ -0,0 +1,80 @@
+import threading
+
+from catalog import ProductCatalog
+from search import SearchIndex
+
+
+def _product(product_id, name, category="Nabiał", brand="Łaciate", rating=4.5):
+    return {
+        "id": product_id,
+        "name": name,
+        "category": category,
+        "brand": brand,
+        "prices": [{"store": "LIDL", "price": 3.49, "discount": 0.0}],
+        "rating": rating,
+        "availability": 1,
+    }
+
+
+def _catalog():
+    return ProductCatalog([
+        _product("1", "Mleko UHT 3.2% 1L"),
+        _product("2", "Chleb Żytni 500g", category="Pieczywo", brand="Putka"),
+        _product("3", "Jogurt naturalny 400g", brand="Piątnica"),
+    ])
+
+
+def test_resolve_requires_every_term():
+    index = SearchIndex(_catalog())
+
+    assert index.resolve("mleko 1l") == "1"
+    assert index.resolve("chleb zytni") == "2"
+    assert index.resolve("mlko uht") == "1"  # one typo
+    assert index.resolve("mleko czekoladowe") is None
+    assert index.resolve("czekolada") is None
+    # Category words alone name no product
+    assert index.resolve("nabiał") is None
+    assert index.resolve("pieczywo") is None
+    # Partial matches still rank in search
+    assert index.search("mleko czekoladowe", prefix=False)[0][0] == "1"
+
+
+def test_sync_reindexes_only_changed_products():
+    catalog = _catalog()
+    index = SearchIndex(catalog)
+    assert index.resolve("jogurt") == "3"
+
+    catalog.reload([
+        _product("1", "Mleko UHT 3.2% 1L", rating=4.9),
+        _product("3", "Kefir 400g", brand="Piątnica"),
+        _product("4", "Masło 200g", brand="Mlekovita"),
+    ])
+
+    assert index.sync(catalog.snapshot) == {"added": 0, "updated": 0, "removed": 0}
+    assert index.resolve("jogurt") is None
+    assert index.resolve("kefir") == "3"
+    assert index.resolve("maslo") == "4"
+    assert index.resolve("chleb") is None
+    assert len(index) == 3
+
+
+def test_searches_run_during_reloads():
+    catalog = _catalog()
+    index = SearchIndex(catalog)
+    errors = []
+
+    def search():
+        try:
+            for _ in range(200):
+                assert index.search("mleko")[0][0] == "1"
+        except Exception as error:  # surfaced below
+            errors.append(error)
+
+    threads = [threading.Thread(target=search) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for i in range(50):
+        catalog.reload([_product("1", "Mleko UHT 3.2% 1L"), _product(str(i + 10), f"Ser żółty {i}")])
+    for thread in threads:
+        thread.join()
+    assert not errors
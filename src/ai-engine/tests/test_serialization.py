@@ -0,0 +1,28 @@
+import importlib
+import sys
+
+import numpy as np
+import pytest
+
+import serialization
+
+PAYLOAD = {"price": float("nan"), "rows": [1.5, float("-inf")], "array": np.array([np.nan, 2.0]),
+           "name": "Mleko Łaciate", 3: np.float32(1.25)}
+EXPECTED = '{"price":null,"rows":[1.5,null],"array":[null,2.0],"name":"Mleko Łaciate","3":1.25}'.encode("utf-8")
+
+
+@pytest.fixture(params=["installed", "stdlib"])
+def encoder(request, monkeypatch):
+    """serialization as imported here, and as imported without orjson"""
+    if request.param == "installed":
+        yield serialization
+        return
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    yield importlib.reload(serialization)
+    monkeypatch.undo()
+    importlib.reload(serialization)
+
+
+def test_non_finite_floats_are_written_as_null(encoder):
+    assert encoder.dumps(PAYLOAD) == EXPECTED
+    assert encoder.dumps({"a": [1, 2.5]}) == b'{"a":[1,2.5]}'
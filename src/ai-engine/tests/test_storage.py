@@ -0,0 +1,107 @@
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from catalog import ProductCatalog
+from storage import SQLiteStorage
+
+SCHEMA = """
+CREATE TABLE stores (id TEXT PRIMARY KEY, name TEXT UNIQUE, "isActive" BOOLEAN DEFAULT 1);
+CREATE TABLE products (id TEXT PRIMARY KEY, name TEXT, brand TEXT, category TEXT, "isActive" BOOLEAN DEFAULT 1);
+CREATE TABLE prices (id TEXT PRIMARY KEY, "productId" TEXT, "storeId" TEXT, "currentPrice" REAL,
+                     "originalPrice" REAL, "discountAmount" REAL, "inStock" BOOLEAN DEFAULT 1, "scrapedAt" DATETIME);
+CREATE TABLE reviews (id INTEGER PRIMARY KEY, "productId" TEXT, rating INTEGER);
+"""
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Prisma-shaped SQLite database with two products at two stores"""
+    path = str(tmp_path / "dev.db")
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    db.executemany('INSERT INTO stores (id, name) VALUES (?, ?)', [("s1", "LIDL"), ("s2", "Biedronka")])
+    db.executemany('INSERT INTO products (id, name, brand, category) VALUES (?, ?, ?, ?)',
+                   [("1", "Mleko UHT 3.2% 1L", "Łaciate", "Nabiał"), ("2", "Chleb Żytni", "Putka", "Pieczywo")])
+    db.executemany(
+        'INSERT INTO prices (id, "productId", "storeId", "currentPrice", "originalPrice", "scrapedAt") '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        [("p1", "1", "s1", 3.49, 3.99, "2026-10-01 10:00:00"), ("p2", "1", "s2", 3.79, None, "2026-10-01 10:00:00"),
+         ("p3", "2", "s1", 4.19, None, "2026-10-01 10:00:00")])
+    db.commit()
+    yield db, SQLiteStorage(path)
+    db.close()
+
+
+def _scrape(db, price_id, price, scraped_at, in_stock=True):
+    db.execute('UPDATE prices SET "currentPrice" = ?, "originalPrice" = NULL, "inStock" = ?, "scrapedAt" = ? '
+               'WHERE id = ?', (price, in_stock, scraped_at, price_id))
+    db.commit()
+
+
+def test_load_catalog_reads_offers(database):
+    _, storage = database
+    products = {product["id"]: product for product in storage.load_catalog()}
+
+    assert {offer["store"] for offer in products["1"]["prices"]} == {"LIDL", "Biedronka"}
+    assert products["1"]["prices"][0] == {"store": "LIDL", "price": 3.99, "discount": 0.5}
+    assert storage.changed_offers() == []
+
+
+def test_changed_offers_keeps_rows_sharing_the_watermark_time(database):
+    db, storage = database
+    list(storage.load_catalog())
+
+    _scrape(db, "p1", 3.29, "2026-10-02 08:00:00")
+    assert [delta["price"] for delta in storage.changed_offers()] == [3.29]
+    # Committed after the refresh, but scraped at the same instant
+    _scrape(db, "p3", 3.99, "2026-10-02 08:00:00")
+    deltas = storage.changed_offers()
+    assert [(delta["product_id"], delta["price"]) for delta in deltas] == [("2", 3.99)]
+    assert storage.changed_offers() == []
+
+
+def test_changed_offers_removes_unavailable_offers(database):
+    db, storage = database
+    catalog = ProductCatalog(storage.load_catalog())
+
+    _scrape(db, "p2", 3.79, "2026-10-02 08:00:00", in_stock=False)
+    deltas = storage.changed_offers()
+    assert [(delta["store"], delta["removed"]) for delta in deltas] == [("Biedronka", True)]
+    catalog.merge_offers(deltas)
+    assert [offer.store for offer in catalog.get("1").offers] == ["LIDL"]
+
+    db.execute('UPDATE stores SET "isActive" = 0 WHERE id = ?', ("s1",))
+    db.commit()
+    deltas = storage.changed_offers()
+    assert sorted((delta["product_id"], delta["removed"]) for delta in deltas) == [("1", True), ("2", True)]
+    assert all(delta["timestamp"] is None for delta in deltas)
+    catalog.merge_offers(deltas)
+    assert catalog.get("1").offers == () and catalog.get("2").offers == ()
+    assert np.isnan(catalog.snapshot.prices[catalog.snapshot.row_of("1")]).all()
+
+    db.execute('UPDATE stores SET "isActive" = 1 WHERE id = ?', ("s1",))
+    db.commit()
+    catalog.merge_offers(storage.changed_offers())
+    assert [offer.store for offer in catalog.get("1").offers] == ["LIDL"]
+    assert catalog.get("2").offers[0].price == 4.19
+
+
+def test_engine_records_per_store_prices_in_the_database(database):
+    from main import SmartShopAI
+    from price_history import offer_key
+
+    db, storage = database
+    engine = SmartShopAI.from_storage(storage)
+    assert sorted(engine.store_history.product_ids) == [offer_key("1", "Biedronka"), offer_key("1", "LIDL"),
+                                                          offer_key("2", "LIDL")]
+
+    _scrape(db, "p2", 3.19, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    engine.refresh_from_storage()
+    assert engine.store_history.series(offer_key("1", "Biedronka"))[1][-1] == np.float32(3.19)
+
+    reloaded = SmartShopAI.from_storage(SQLiteStorage(storage.path))
+    assert reloaded.store_history.series(offer_key("1", "Biedronka"))[1][-1] == np.float32(3.19)
+    assert reloaded.price_aggregates(stores=["Biedronka"])["mean_price"] == 3.19
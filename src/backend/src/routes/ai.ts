@@ -8,7 +8,8 @@ const AI_ENGINE_URL = process.env.AI_ENGINE_URL || 'http://localhost:8000';
 
 // Interface definitions
 interface ShoppingItem {
-  product_id: string;
+  product_id?: string;
+  name?: string; // free text, resolved by the AI engine's product search
   quantity: number;
   max_price?: number;
 }
@@ -17,6 +18,9 @@ interface ShoppingList {
   items: ShoppingItem[];
   budget?: number;
   preferred_stores?: string[];
+  optimization_mode?: 'greedy' | 'multi_store' | 'budget';
+  store_visit_cost?: number;
+  max_stores?: number;
 }
 
 interface UserPreferences {
@@ -82,10 +86,63 @@ router.post('/optimize-basket', async (req: Request, res: Response) => {
   }
 });
 
+// POST /api/ai/optimize-basket/batch - Optimize many shopping lists in one AI Engine call
+router.post('/optimize-basket/batch', async (req: Request, res: Response) => {
+  try {
+    const shoppingLists: ShoppingList[] = req.body;
+    
+    if (!Array.isArray(shoppingLists) || shoppingLists.length === 0) {
+      return res.status(400).json({
+        success: false,
+        message: 'Shopping lists array is required'
+      });
+    }
+    
+    // AI Engine streams one OptimizationResult per line (NDJSON)
+    const response = await axios.post(`${AI_ENGINE_URL}/optimize-basket/batch`, shoppingLists, {
+      timeout: 120000,
+      responseType: 'text',
+      headers: {
+        'Content-Type': 'application/json'
+      }
+    });
+    
+    const results = String(response.data)
+      .split('\n')
+      .filter((line) => line.trim().length > 0)
+      .map((line) => JSON.parse(line));
+    
+    console.log('🤖 Batch optimization completed for', results.length, 'lists');
+    
+    res.json({
+      success: true,
+      data: results,
+      message: `${results.length} shopping lists optimized successfully`
+    });
+    
+  } catch (error) {
+    console.error('❌ Batch optimization error:', error);
+    
+    if (axios.isAxiosError(error) && error.code === 'ECONNREFUSED') {
+      return res.status(503).json({
+        success: false,
+        message: 'AI Engine is not available. Please try again later.',
+        error: 'Service unavailable'
+      });
+    }
+    
+    res.status(500).json({
+      success: false,
+      message: 'Batch optimization failed',
+      error: error instanceof Error ? error.message : 'Unknown error'
+    });
+  }
+});
+
 // POST /api/ai/predict-prices - Get price predictions
 router.post('/predict-prices', async (req: Request, res: Response) => {
   try {
-    const { product_ids } = req.body;
+    const { product_ids, horizon } = req.body;
     
     if (!product_ids || !Array.isArray(product_ids)) {
       return res.status(400).json({
@@ -96,6 +153,8 @@ router.post('/predict-prices', async (req: Request, res: Response) => {
     
     const response = await axios.post(`${AI_ENGINE_URL}/predict-prices`, product_ids, {
       timeout: 15000,
+      // Optional multi-day forecast (1-30 days)
+      params: horizon ? { horizon } : undefined,
       headers: {
         'Content-Type': 'application/json'
       }